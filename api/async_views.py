@@ -0,0 +1,76 @@
+# api/async_views.py
+"""
+list и retrieve игр и товаров корутинами — для запуска под ASGI (webproj/urls_async.py).
+
+Запросы состояния для ETag (коллекция и вложенные модели) независимы и выполняются
+параллельно; аутентификация, права, пагинация и сериализация — прежний синхронный
+код DRF в потоке. Остальные действия (create, update, search, ...) не меняются.
+"""
+from functools import partial, update_wrapper
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from rest_framework.response import Response
+
+from main.async_views import gather
+from main.conditional import collection_state
+from .views import GameViewSet, ProductViewSet
+
+
+class AsyncReadMixin:
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+
+        # Django вызывает view как корутину, только если это корутинная функция
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        # cls, initkwargs, actions, csrf_exempt — нужны роутеру и схеме API
+        update_wrapper(async_view, view)
+        return async_view
+
+    async def dispatch(self, request, *args, **kwargs):
+        """APIView.dispatch с await: обработчик-корутина ждётся, синхронный — в потоке"""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = await sync_to_async(self.handle_exception)(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def list(self, request, *args, **kwargs):
+        querysets = await sync_to_async(self.collection_querysets)()
+        states = await gather(*(partial(collection_state, queryset) for queryset in querysets))
+        return await sync_to_async(self.conditional)(
+            request, states, lambda: self.build_list_response(request, *args, **kwargs),
+        )
+
+    async def retrieve(self, request, *args, **kwargs):
+        instance = await sync_to_async(self.get_object)()
+        return await sync_to_async(self.conditional)(
+            request, self.get_object_state(instance),
+            lambda: Response(self.get_serializer(instance).data),
+        )
+
+
+class AsyncGameViewSet(AsyncReadMixin, GameViewSet):
+    pass
+
+
+class AsyncProductViewSet(AsyncReadMixin, ProductViewSet):
+    pass
@@ -0,0 +1,68 @@
+# api/pagination.py
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from main.pagination import KeysetPaginator, InvalidCursor, SORT_ORDERINGS, estimate_count
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная пагинация для API: ?sort=price_asc|price_desc, ссылки next/previous
+    содержат непрозрачный курсор. Точное количество — только по ?count=exact.
+    """
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        ordering = SORT_ORDERINGS.get(request.query_params.get('sort'), SORT_ORDERINGS['default'])
+        paginator = KeysetPaginator(queryset, self.get_page_size(request), ordering)
+        try:
+            self.page = paginator.get_page(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound("Неверный курсор")
+
+        if request.query_params.get('count') == 'exact':
+            self.count, self.count_is_exact = queryset.count(), True
+        else:
+            self.count, self.count_is_exact = estimate_count(queryset), False
+        return list(self.page)
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'count_is_exact': self.count_is_exact,
+            'next': self._link(self.page.next_cursor),
+            'previous': self._link(self.page.previous_cursor),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer'},
+                'count_is_exact': {'type': 'boolean'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
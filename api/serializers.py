@@ -1,11 +1,22 @@
 # api/serializers.py
+from django.core.files.storage import default_storage
 from rest_framework import serializers
-from main.models import Game, Category, Product, Review, Order, OrderItem
+from main import images
+from main.models import (
+    Game, Category, Product, Review, Order, OrderItem,
+    ActiveOrderView, TopSellingProductView, TopWishlistView,
+)
 
 class GameSerializer(serializers.ModelSerializer):
+    # Уменьшенные копии логотипа для <img srcset>; пустая строка, пока они не готовы
+    logo_srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = Game
-        fields = ['id', 'name', 'logo_url']
+        fields = ['id', 'name', 'logo_url', 'logo_srcset']
+
+    def get_logo_srcset(self, obj):
+        return images.srcset(obj)
 
 class CategorySerializer(serializers.ModelSerializer):
     game = GameSerializer(read_only=True)
@@ -32,15 +43,109 @@ class ProductSerializer(serializers.ModelSerializer):
         write_only=True,
         source='game'
     )
+    image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'description', 'price', 'old_price',
-            'discount', 'image_url', 'category', 'category_id',
+            'discount', 'image_url', 'image_srcset', 'category', 'category_id',
             'game', 'game_id', 'average_rating'
         ]
 
+    def get_image_srcset(self, obj):
+        return images.srcset(obj)
+
+def _decimal(value):
+    return None if value is None else str(value)
+
+def _file_url(name):
+    return default_storage.url(name) if name else None
+
+class FlatProductListSerializer:
+    """
+    Быстрый путь для списков товаров: вместо моделей и вложенных сериализаторов —
+    строки .values(), а игры и категории страницы отдаются один раз в included.
+    Поддерживает sparse fieldsets: fields=['id', 'name', 'price'].
+    """
+    # поле ответа -> (колонка .values(), преобразование)
+    FIELDS = {
+        'id': ('id', None),
+        'name': ('name', None),
+        'description': ('description', None),
+        'price': ('price', _decimal),
+        'old_price': ('old_price', _decimal),
+        'discount': ('discount', None),
+        'image_url': ('image', _file_url),
+        'category_id': ('category_id', None),
+        'game_id': ('game_id', None),
+        'average_rating': ('average_rating', _decimal),
+    }
+    # Колонки для included — из того же запроса, без отдельных обращений к БД
+    RELATED_COLUMNS = ['category__name', 'game__name', 'game__logo']
+
+    def __init__(self, fields=None):
+        if fields:
+            unknown = set(fields) - set(self.FIELDS)
+            if unknown:
+                raise serializers.ValidationError({'fields': f"Неизвестные поля: {', '.join(sorted(unknown))}"})
+            # id нужен всегда — по нему строится курсор и ссылки клиента
+            self.fields = ['id'] + [f for f in fields if f != 'id']
+        else:
+            self.fields = list(self.FIELDS)
+
+    @classmethod
+    def parse_fields(cls, raw):
+        """?fields=id,name,price -> ['id', 'name', 'price'] (None, если параметр не задан)"""
+        if not raw:
+            return None
+        return [f.strip() for f in raw.split(',') if f.strip()]
+
+    def columns(self):
+        """Колонки для queryset.values(): запрошенные поля, ключи сортировки и связанные данные"""
+        columns = {self.FIELDS[f][0] for f in self.fields} | {'id', 'price', 'category_id', 'game_id'}
+        return sorted(columns) + self.RELATED_COLUMNS
+
+    def to_representation(self, rows):
+        results = []
+        games, categories = {}, {}
+        with_games = 'game_id' in self.fields
+        with_categories = 'category_id' in self.fields
+        plan = [(name, column, convert) for name, (column, convert) in
+                ((f, self.FIELDS[f]) for f in self.fields)]
+
+        for row in rows:
+            item = {}
+            for name, column, convert in plan:
+                value = row[column]
+                item[name] = convert(value) if convert and value is not None else value
+            results.append(item)
+
+            if with_games and row['game_id'] not in games:
+                games[row['game_id']] = {
+                    'id': row['game_id'],
+                    'name': row['game__name'],
+                    'logo_url': _file_url(row['game__logo']),
+                }
+            if with_categories and row['category_id'] not in categories:
+                categories[row['category_id']] = {
+                    'id': row['category_id'],
+                    'name': row['category__name'],
+                    'game_id': row['game_id'],
+                }
+
+        included = {}
+        if with_games:
+            included['games'] = games
+        if with_categories:
+            included['categories'] = categories
+        return {'results': results, 'included': included}
+
+class GameDiscountsSerializer(serializers.Serializer):
+    """Игра и её товары со скидкой (см. main.queries.games_with_discounts)"""
+    game = GameSerializer(read_only=True)
+    products = ProductSerializer(many=True, read_only=True)
+
 class ReviewSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
     product = ProductSerializer(read_only=True)
@@ -79,4 +184,29 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['id', 'user', 'total_price', 'status', 'created_at', 'items']
-        read_only_fields = ['user', 'created_at', 'total_price']
\ No newline at end of file
+        read_only_fields = ['user', 'created_at', 'total_price']
+
+
+# === Аналитика (материализованные представления) ===
+class ActiveOrderStatSerializer(serializers.ModelSerializer):
+    order_id = serializers.IntegerField(source='pk')
+
+    class Meta:
+        model = ActiveOrderView
+        fields = ['order_id', 'created_at', 'status', 'user_name', 'user_email', 'total', 'items_count']
+
+
+class TopSellingProductSerializer(serializers.ModelSerializer):
+    product_id = serializers.IntegerField(source='pk')
+
+    class Meta:
+        model = TopSellingProductView
+        fields = ['rank', 'product_id', 'name', 'game_id', 'game_name', 'total_sold', 'orders_count']
+
+
+class TopWishlistSerializer(serializers.ModelSerializer):
+    user_id = serializers.IntegerField(source='pk')
+
+    class Meta:
+        model = TopWishlistView
+        fields = ['rank', 'user_id', 'username', 'email', 'wishlist_count']
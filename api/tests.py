@@ -1,3 +1,124 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from main.models import Game, Category, Product, ProductNeighbor
+from .serializers import ProductSerializer, FlatProductListSerializer
+
+
+class FlatProductListTests(TestCase):
+    def setUp(self):
+        self.game = Game.objects.create(name='Game')
+        self.category = Category.objects.create(name='Cat', game=self.game)
+        Product.objects.bulk_create(
+            Product(name=f'P{i}', description='', price=10 + i, category=self.category, game=self.game)
+            for i in range(5)
+        )
+        self.client.force_login(User.objects.create_user('admin', password='pass', is_staff=True))
+
+    def test_rows_match_nested_serializer(self):
+        flat = FlatProductListSerializer()
+        rows = Product.objects.order_by('id').values(*flat.columns())
+        data = flat.to_representation(rows)
+        nested = ProductSerializer(Product.objects.order_by('id'), many=True).data
+
+        for item, full in zip(data['results'], nested):
+            for field in ('id', 'name', 'price', 'old_price', 'discount', 'image_url', 'average_rating'):
+                self.assertEqual(item[field], full[field], field)
+            self.assertEqual(item['game_id'], full['game']['id'])
+        self.assertEqual(list(data['included']['games']), [self.game.id])
+        self.assertEqual(data['included']['categories'][self.category.id]['name'], 'Cat')
+
+    def test_sparse_fieldset(self):
+        response = self.client.get('/api/products/', {'fields': 'name,price'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'price'})
+        self.assertEqual(response.data['included'], {})
+
+    def test_flat_list_is_single_page_query(self):
+        # курсорная страница + оценка количества через EXPLAIN + состояние для ETag
+        with self.assertNumQueries(2 + 3 + 1):  # + пользователь (сессия в подписанной cookie)
+            response = self.client.get('/api/products/', {'flat': '1'})
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIn(self.game.id, response.data['included']['games'])
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/products/', {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.game = Game.objects.create(name='Game')
+        self.category = Category.objects.create(name='Cat', game=self.game)
+        self.product = Product.objects.create(
+            name='P', description='', price=10, category=self.category, game=self.game,
+        )
+        self.client.force_login(User.objects.create_user('admin', password='pass', is_staff=True))
+
+    def test_list_returns_304_until_product_changes(self):
+        etag = self.client.get('/api/products/')['ETag']
+        self.assertEqual(self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Product.objects.filter(id=self.product.id).update(price=20)
+        self.assertEqual(self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_retrieve_depends_on_nested_game(self):
+        url = f'/api/products/{self.product.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.game.name = 'Renamed'
+        self.game.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(ROOT_URLCONF='webproj.urls_async', ASYNC_CONCURRENT_QUERIES=False)
+class AsyncReadViewSetTests(ConditionalGetTests):
+    """Те же проверки условных GET через асинхронные list/retrieve"""
+
+    def test_async_list_matches_sync(self):
+        data = self.client.get('/api/products/').json()
+        with override_settings(ROOT_URLCONF='webproj.urls'):
+            self.assertEqual(data, self.client.get('/api/products/').json())
+
+    def test_write_actions_still_work(self):
+        response = self.client.delete(f'/api/products/{self.product.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Product.objects.filter(id=self.product.id).exists())
+
+    def test_anonymous_is_rejected(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/api/games/').status_code, 403)
+
+
+class SimilarProductsApiTests(TestCase):
+    def setUp(self):
+        game = Game.objects.create(name='Game')
+        category = Category.objects.create(name='Cat', game=game)
+        self.products = Product.objects.bulk_create(
+            Product(name=f'P{i}', description='', price=10, category=category, game=game) for i in range(3)
+        )
+
+    def test_neighbors_in_rank_order_with_scores(self):
+        first, second, third = self.products
+        ProductNeighbor.objects.bulk_create([
+            ProductNeighbor(product=first, neighbor=third, rank=1, score=0.9),
+            ProductNeighbor(product=first, neighbor=second, rank=2, score=0.5),
+        ])
+        data = self.client.get(f'/api/products/{first.id}/similar/').json()
+        self.assertEqual([item['id'] for item in data['results']], [third.id, second.id])
+        self.assertEqual(data['results'][0]['score'], 0.9)
+
+    def test_unknown_product_is_404(self):
+        self.assertEqual(self.client.get('/api/products/999999/similar/').status_code, 404)
+
+
+class AnalyticsApiTests(TestCase):
+    def test_dashboard_for_staff_only(self):
+        self.assertEqual(self.client.get('/api/analytics/').status_code, 403)
+        self.client.force_login(User.objects.create_user('admin', password='pass', is_staff=True))
+        data = self.client.get('/api/analytics/', {'limit': 5}).json()
+        self.assertEqual(
+            set(data), {'refreshed', 'latest_active_orders', 'top_selling_products', 'top_wishlists'},
+        )
+        self.assertIsNone(data['refreshed']['active_orders_view'])
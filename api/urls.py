@@ -1,7 +1,7 @@
 # api/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import GameViewSet, CategoryViewSet, ProductViewSet, ReviewViewSet, OrderViewSet
+from .views import GameViewSet, CategoryViewSet, ProductViewSet, ReviewViewSet, OrderViewSet, AnalyticsViewSet
 
 router = DefaultRouter()
 router.register(r'games', GameViewSet)
@@ -9,6 +9,7 @@ router.register(r'categories', CategoryViewSet)
 router.register(r'products', ProductViewSet)
 router.register(r'reviews', ReviewViewSet)
 router.register(r'orders', OrderViewSet, basename='order')
+router.register(r'analytics', AnalyticsViewSet, basename='analytics')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,11 +1,24 @@
 # api/views.py
 from rest_framework import viewsets, permissions, serializers
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
+from django.conf import settings
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from main.models import Game, Category, Product, Review, Order
+from main.queries import games_with_discounts
+from main.search import search_products, search_page
+from main.facets import catalog_facets
+from main.conditional import collection_state, make_etag
+from main.recommendations import neighbors
+from main.analytics import dashboard
+from .pagination import KeysetPagination
 from .serializers import (
     GameSerializer, CategorySerializer, ProductSerializer,
-    ReviewSerializer, OrderSerializer
+    ReviewSerializer, OrderSerializer, GameDiscountsSerializer,
+    FlatProductListSerializer, ActiveOrderStatSerializer, TopSellingProductSerializer,
+    TopWishlistSerializer
 )
 
 # === Пользовательские разрешения ===
@@ -23,21 +36,159 @@ class IsOwnerOrStaff(permissions.BasePermission):
             return True
         return (hasattr(obj, 'user') and obj.user == request.user) or request.user.is_staff
 
+# === Условные GET ===
+class ConditionalGetMixin:
+    """
+    ETag/Last-Modified для list и retrieve: состояние считается по updated_at и
+    количеству строк до сериализации, при совпадении сразу отдаётся 304.
+    conditional_related — FK, данные которых вложены в ответ (их изменения тоже меняют ETag).
+    """
+    conditional_related = ()
+
+    def _related_models(self):
+        model = self.get_queryset().model
+        return [model._meta.get_field(name).related_model for name in self.conditional_related]
+
+    def collection_querysets(self):
+        """Выборки, от которых зависит ответ list: сама коллекция и вложенные модели"""
+        return [self.filter_queryset(self.get_queryset())] + [model.objects.all() for model in self._related_models()]
+
+    def get_collection_state(self):
+        return [collection_state(queryset) for queryset in self.collection_querysets()]
+
+    def get_object_state(self, obj):
+        objects = [obj] + [getattr(obj, name) for name in self.conditional_related]
+        return [{'last_modified': o.updated_at, 'counts': (o.pk,)} for o in objects]
+
+    def conditional(self, request, states, build_response):
+        timestamps = [s['last_modified'] for s in states if s['last_modified'] is not None]
+        last_modified = int(max(timestamps).timestamp()) if timestamps else None
+        etag = quote_etag(make_etag(
+            *(t.isoformat() for t in timestamps), *(c for s in states for c in s['counts']),
+        ))
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = build_response()
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def build_list_response(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(
+            request, self.get_collection_state(),
+            lambda: self.build_list_response(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return self.conditional(
+            request, self.get_object_state(instance),
+            lambda: Response(self.get_serializer(instance).data),
+        )
+
 # === ViewSets ===
-class GameViewSet(viewsets.ModelViewSet):
+class GameViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Game.objects.all()
     serializer_class = GameSerializer
     permission_classes = [permissions.IsAdminUser]
 
-class CategoryViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
+    def discounts(self, request):
+        """Игры с первыми товарами со скидкой — тот же один запрос, что и на главной"""
+        try:
+            limit = min(max(int(request.query_params.get('limit', 4)), 1), 20)
+        except ValueError:
+            limit = 4
+        data = GameDiscountsSerializer(games_with_discounts(limit=limit), many=True).data
+        return Response(data)
+
+class CategoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Category.objects.select_related('game').all()
+    conditional_related = ('game',)
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAdminUser]
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.select_related('category', 'game').all()
+class ProductViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = Product.objects.select_related('category__game', 'game').all()
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = KeysetPagination
+    conditional_related = ('category', 'game')
+
+    def build_list_response(self, request, *args, **kwargs):
+        """
+        ?flat=1 или ?fields=id,name,price — облегчённый ответ: строки без вложенных
+        объектов, игры и категории страницы один раз в included.
+        """
+        fields = FlatProductListSerializer.parse_fields(request.query_params.get('fields'))
+        if not fields and request.query_params.get('flat') not in ('1', 'true'):
+            return super().build_list_response(request, *args, **kwargs)
+        return self.flat_list(FlatProductListSerializer(fields))
+
+    def flat_list(self, flat):
+        queryset = self.filter_queryset(Product.objects.all()).values(*flat.columns())
+        data = flat.to_representation(self.paginate_queryset(queryset))
+        response = self.get_paginated_response(data['results'])
+        response.data['included'] = data['included']
+        return response
+
+    @action(detail=True, methods=['get'], permission_classes=[permissions.AllowAny])
+    def similar(self, request, pk=None):
+        """Похожие товары из индекса рекомендаций: ?limit=<n> (по умолчанию 4), с оценкой сходства"""
+        if not str(pk).isdigit():
+            raise NotFound()
+        try:
+            limit = min(max(int(request.query_params.get('limit', 4)), 1), settings.RECOMMENDATION_TOP_K)
+        except ValueError:
+            limit = 4
+        rows = list(neighbors(pk).select_related('category__game', 'game')[:limit])
+        if not rows and not Product.objects.filter(pk=pk).exists():
+            raise NotFound()
+        data = ProductSerializer(rows, many=True).data
+        for item, row in zip(data, rows):
+            item['score'] = round(row.score, 4)
+        return Response({'product': int(pk), 'results': data})
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
+    def facets(self, request):
+        """Фасеты каталога игры: ?game=<id>&category=..&min_price=..&max_price=.."""
+        game_id = request.query_params.get('game', '')
+        if not game_id.isdigit():
+            raise serializers.ValidationError({'game': 'Укажите id игры.'})
+        return Response(catalog_facets(int(game_id), request.query_params))
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
+    def search(self, request):
+        """Поиск товаров: ?q=...&game=<id>&page=<n>, результаты по релевантности"""
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            raise serializers.ValidationError({'q': 'Укажите поисковый запрос.'})
+
+        queryset = self.get_queryset()
+        game_id = request.query_params.get('game')
+        if game_id:
+            if not game_id.isdigit():
+                raise serializers.ValidationError({'game': 'Некорректный id игры.'})
+            queryset = queryset.filter(game_id=game_id)
+
+        try:
+            page = int(request.query_params.get('page', 1))
+        except ValueError:
+            page = 1
+        rows, has_next = search_page(search_products(text, queryset), page, per_page=20)
+        return Response({
+            'page': page,
+            'has_next': has_next,
+            'results': ProductSerializer(rows, many=True).data,
+        })
 
 class ReviewViewSet(viewsets.ModelViewSet):
     queryset = Review.objects.select_related('product', 'user').all()
@@ -70,4 +221,28 @@ class OrderViewSet(viewsets.ModelViewSet):
         # Удалять может только админ или владелец (если статус 'pending')
         if not self.request.user.is_staff and instance.status != 'pending':
             raise serializers.ValidationError("Можно удалить только ожидающий заказ.")
-        instance.delete()
\ No newline at end of file
+        instance.delete()
+
+# === Аналитика ===
+class AnalyticsViewSet(viewsets.ViewSet):
+    """
+    Дашборд по материализованным представлениям (manage.py refresh_analytics): готовые
+    строки по индексам с LIMIT — время ответа не зависит от числа заказов.
+    ?limit=<1..100> — строк в каждом списке.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def _limit(self, request):
+        try:
+            return min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        except ValueError:
+            return 20
+
+    def list(self, request):
+        data = dashboard(limit=self._limit(request))
+        return Response({
+            'refreshed': data['refreshed'],
+            'latest_active_orders': ActiveOrderStatSerializer(data['latest_active_orders'], many=True).data,
+            'top_selling_products': TopSellingProductSerializer(data['top_selling_products'], many=True).data,
+            'top_wishlists': TopWishlistSerializer(data['top_wishlists'], many=True).data,
+        })
@@ -0,0 +1,65 @@
+# gunicorn.conf.py — подхватывается gunicorn автоматически из рабочего каталога
+import logging
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+
+# SERVER_MODE: wsgi — потоки gthread, asgi — воркеры uvicorn с асинхронными страницами
+server_mode = os.environ.get('SERVER_MODE', 'wsgi')
+if server_mode == 'asgi':
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    wsgi_app = 'webproj.asgi:application'
+    os.environ.setdefault('ASYNC_VIEWS', '1')
+else:
+    worker_class = 'gthread' if threads > 1 else 'sync'
+    wsgi_app = 'webproj.wsgi:application'
+
+# settings.py считает размер пула БД от числа потоков — передаём ему то же значение
+os.environ['GUNICORN_THREADS'] = str(threads)
+
+# Бюджет соединений: max_connections Postgres за вычетом запаса на runworker, migrate,
+# psql и superuser_reserved_connections. Пулы открывают соединения по требованию, так что
+# превышение проявилось бы только под нагрузкой ошибкой «too many clients» — считаем заранее
+db_mode = os.environ.get('DB_CONNECTION_MODE', 'persistent')
+db_budget = int(os.environ.get('DB_MAX_CONNECTIONS', 100)) - int(os.environ.get('DB_RESERVED_CONNECTIONS', 20))
+loader_threads = int(os.environ.get('LOADER_MAX_WORKERS', 4))
+if db_mode == 'pool':
+    # Без явного DB_POOL_MAX_SIZE пул воркера — не больше его доли бюджета
+    wanted = 20 if server_mode == 'asgi' else threads + loader_threads + 2
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(min(wanted, db_budget // workers)))
+    per_worker = int(os.environ['DB_POOL_MAX_SIZE'])
+else:
+    # Соединение на поток запроса и на каждый поток параллельных выборок
+    per_worker = threads + loader_threads
+if per_worker < 1 or workers * per_worker > db_budget:
+    raise RuntimeError(
+        f"БД: {workers} воркеров × {per_worker} соединений = {workers * per_worker}, "
+        f"а бюджет {db_budget} (DB_MAX_CONNECTIONS − DB_RESERVED_CONNECTIONS). "
+        "Уменьшите GUNICORN_WORKERS/GUNICORN_THREADS или DB_POOL_MAX_SIZE либо увеличьте max_connections"
+    )
+
+
+def on_starting(server):
+    logging.getLogger('gunicorn.error').info(
+        "БД: режим %s, до %s соединений на воркер, всего до %s из %s",
+        db_mode, per_worker, workers * per_worker, db_budget,
+    )
+
+
+def post_worker_init(worker):
+    from main.pool_metrics import start_stats_logger
+    worker.pool_stats_logger = start_stats_logger()
+
+
+def worker_exit(server, worker):
+    from main.pool_metrics import close_pool, log_stats
+
+    stats_logger = getattr(worker, 'pool_stats_logger', None)
+    if stats_logger is not None:
+        stats_logger.stop()
+        log_stats()
+    close_pool()
@@ -6,16 +6,47 @@ from django.shortcuts import redirect
 from django.contrib.admin import ModelAdmin, register
 from django.contrib import messages
 from django.conf import settings
-import os
-import subprocess
+from django.http import HttpResponse, StreamingHttpResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.template.defaultfilters import filesizeformat
+from django.utils.html import format_html
+from django.template.response import TemplateResponse
+from django.core.files.storage import default_storage
 from datetime import datetime
-from django.http import HttpResponse
-import csv
+import os
+from .jobs import enqueue
+from .forms import ProductImportForm
+from .product_io import FIELDS, FORMATS, detect_format, stream_export
+from .backups import delete_backup, stream_directory_tar
+from .pagination import EstimatedCountPaginator
+from .streaming import file_response, streaming_content
 
 @admin.register(BackupFile)
 class BackupFileAdmin(admin.ModelAdmin):
-    list_display = ("file", "created_at")
-    actions = ["restore_backup"]
+    list_display = ("file", "created_at", "format", "compression", "size_display", "duration", "short_sha256", "download_link")
+    readonly_fields = ("file", "created_at", "format", "compression", "jobs", "size_bytes", "duration", "sha256", "manifest")
+    actions = ["restore_backup", "verify_backup"]
+
+    def size_display(self, obj):
+        return filesizeformat(obj.size_bytes) if obj.size_bytes is not None else "—"
+    size_display.short_description = "Размер"
+
+    def short_sha256(self, obj):
+        return obj.sha256[:12] if obj.sha256 else "—"
+    short_sha256.short_description = "SHA-256"
+
+    def download_link(self, obj):
+        url = reverse("admin:download_backup", args=[obj.id])
+        return format_html('<a href="{}">Скачать</a>', url)
+    download_link.short_description = ""
+
+    def delete_model(self, request, obj):
+        delete_backup(obj)
+
+    def delete_queryset(self, request, queryset):
+        for backup in queryset:
+            delete_backup(backup)
 
     def has_add_permission(self, request):
         return False
@@ -28,98 +59,196 @@ class BackupFileAdmin(admin.ModelAdmin):
                 self.admin_site.admin_view(self.make_backup_view),
                 name="make_backup",
             ),
+            path(
+                "<int:backup_id>/download/",
+                self.admin_site.admin_view(self.download_view),
+                name="download_backup",
+            ),
         ]
         return custom + urls
 
     def make_backup_view(self, request):
-        try:
-            media_backup_dir = os.path.join(settings.MEDIA_ROOT, 'backups')
-            os.makedirs(media_backup_dir, exist_ok=True)
-
-            timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            filename = f"backup_{timestamp}.dump"
-            abs_path = os.path.join(media_backup_dir, filename)
-
-            db = settings.DATABASES["default"]
-
-            # Передаём пароль через окружение — безопаснее
-            env = os.environ.copy()
-            env["PGPASSWORD"] = db["PASSWORD"]
-
-            # Формируем аргументы без URL (избегаем подстановки пароля)
-            cmd = [
-                "pg_dump",
-                "--host", db.get("HOST", "localhost"),
-                "--port", str(db.get("PORT", "5432")),
-                "--username", db["USER"],
-                "--dbname", db["NAME"],
-                "--format=custom",
-                "--file", abs_path,
-            ]
-
-            result = subprocess.run(
-                cmd,
-                env=env,
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
+        # pg_dump выполняется обработчиком очереди (manage.py runworker), а не в запросе
+        job = enqueue('backup', created_by=request.user)
+        messages.success(request, f"Бэкап поставлен в очередь (задача #{job.id}).")
+        return redirect("admin:main_job_change", job.id)
+
+    def download_view(self, request, backup_id):
+        # Дамп отдаётся потоком кусками — даже многогигабайтный файл не читается в память
+        backup = get_object_or_404(BackupFile, id=backup_id)
+        path = backup.file.path
+        if not os.path.exists(path):
+            raise Http404("Файл бэкапа не найден")
+
+        if os.path.isdir(path):
+            response = StreamingHttpResponse(
+                streaming_content(stream_directory_tar(path)), content_type="application/x-tar",
             )
+            response["Content-Disposition"] = f'attachment; filename="{os.path.basename(path)}.tar"'
+        else:
+            response = file_response(path, settings.BACKUP_CHUNK_SIZE)
+        if backup.sha256:
+            response["X-Checksum-SHA256"] = backup.sha256
+        return response
+
+    def _enqueue_restore(self, request, queryset, swap):
+        if queryset.count() != 1:
+            self.message_user(request, "Выберите один бэкап!", messages.ERROR)
+            return
+
+        backup = queryset.first()
+        job = enqueue('restore', created_by=request.user, backup_id=backup.id, swap=swap)
+        what = "Восстановление из" if swap else "Проверка"
+        self.message_user(request, f"{what} {backup} поставлено в очередь (задача #{job.id}).", messages.SUCCESS)
+        return redirect("admin:main_job_change", job.id)
 
-            relative_path = f"backups/{filename}"
+    def restore_backup(self, request, queryset):
+        # Рабочая БД заменяется только после успешной сверки временной с манифестом
+        return self._enqueue_restore(request, queryset, swap=True)
 
-            # Сохраняем в модель
-            backup = BackupFile(file=relative_path)
-            backup.save()
+    restore_backup.short_description = "Восстановить БД из выбранного бэкапа"
 
-            messages.success(request, "Бэкап успешно создан!")
-            return redirect("admin:main_backupfile_changelist")
+    def verify_backup(self, request, queryset):
+        return self._enqueue_restore(request, queryset, swap=False)
 
-        except subprocess.CalledProcessError as e:
-            messages.error(request, f"pg_dump failed: {e.stderr.strip()}")
-        except Exception as e:
-            messages.error(request, f"Ошибка: {e}")
+    verify_backup.short_description = "Проверить бэкап (восстановить во временную БД без подмены)"
 
-        return redirect("admin:main_backupfile_changelist")
+@admin.register(RestoreRun)
+class RestoreRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'backup', 'status', 'jobs', 'started_at', 'duration', 'previous_database')
+    list_filter = ('status',)
+    readonly_fields = (
+        'backup', 'status', 'jobs', 'scratch_database', 'previous_database',
+        'started_at', 'finished_at', 'duration', 'table_timings', 'verification', 'error',
+    )
 
-    def restore_backup(self, request, queryset):
-        try:
-            if queryset.count() != 1:
-                self.message_user(request, "Выберите один бэкап!", messages.ERROR)
-                return
-
-            backup = queryset.first()
-            backup_path = backup.file.path
-
-            if not os.path.exists(backup_path):
-                self.message_user(request, "Файл бэкапа не найден!", messages.ERROR)
-                return
-
-            db = settings.DATABASES["default"]
-            db_url = (
-                f"postgresql://{db['USER']}:{db['PASSWORD']}@"
-                f"{db['HOST']}:{db['PORT']}/{db['NAME']}"
-            )
+    def has_add_permission(self, request):
+        return False
 
-            cmd = [
-                "pg_restore",
-                f"--dbname={db_url}",
-                "--clean",
-                "--if-exists",
-                backup_path,
-            ]
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(RecommendationRun)
+class RecommendationRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'mode', 'started_at', 'duration', 'products_updated', 'neighbors_written')
+    list_filter = ('mode',)
+    readonly_fields = (
+        'mode', 'started_at', 'finished_at', 'duration', 'last_order_id', 'last_wishlist_id',
+        'last_product_id', 'products_updated', 'neighbors_written',
+    )
+    actions = ['rebuild_full']
 
-            subprocess.run(cmd, check=True)
+    def has_add_permission(self, request):
+        return False
 
-            self.message_user(request, "База данных успешно восстановлена!", messages.SUCCESS)
+    def has_change_permission(self, request, obj=None):
+        return False
 
-        except subprocess.CalledProcessError:
-            self.message_user(request, "Ошибка: pg_restore завершился неудачно.", messages.ERROR)
+    def rebuild_full(self, request, queryset):
+        job = enqueue('refresh_recommendations', created_by=request.user, full=True)
+        self.message_user(request, f"Полный пересчёт рекомендаций поставлен в очередь (задача #{job.id}).", messages.SUCCESS)
+    rebuild_full.short_description = "Пересчитать рекомендации полностью"
 
-        except Exception as e:
-            self.message_user(request, f"Ошибка восстановления: {e}", messages.ERROR)
+class AnalyticsViewAdmin(admin.ModelAdmin):
+    """Материализованное представление: только чтение, время обновления и кнопка «Обновить»"""
+    change_list_template = "admin/main/analytics_change_list.html"
+    show_full_result_count = False
+    view_name = None
 
-    restore_backup.short_description = "Восстановить БД из выбранного бэкапа"
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        custom = [
+            path(
+                "refresh/",
+                self.admin_site.admin_view(self.refresh_view),
+                name="%s_%s_refresh" % info,
+            ),
+        ]
+        return custom + super().get_urls()
+
+    def refresh_view(self, request):
+        # REFRESH ... CONCURRENTLY по большой истории заказов — в очереди задач, не в запросе
+        job = enqueue('refresh_analytics', created_by=request.user, views=[self.view_name])
+        messages.success(request, f"Обновление {self.view_name} поставлено в очередь (задача #{job.id}).")
+        return redirect("admin:main_job_change", job.id)
+
+    def changelist_view(self, request, extra_context=None):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        extra_context = {
+            **(extra_context or {}),
+            'refresh': AnalyticsRefresh.objects.filter(view_name=self.view_name).first(),
+            'refresh_url': reverse("admin:%s_%s_refresh" % info),
+        }
+        return super().changelist_view(request, extra_context=extra_context)
+
+@admin.register(ActiveOrderView)
+class ActiveOrderViewAdmin(AnalyticsViewAdmin):
+    view_name = 'active_orders_view'
+    list_display = ('order', 'created_at', 'status', 'user_name', 'user_email', 'total', 'items_count')
+    list_filter = ('status',)
+    list_select_related = ('order',)
+    # Строк столько же, сколько заказов: число страниц — по оценке планировщика, без COUNT(*)
+    paginator = EstimatedCountPaginator
+
+@admin.register(TopSellingProductView)
+class TopSellingProductViewAdmin(AnalyticsViewAdmin):
+    view_name = 'top_selling_products_view'
+    list_display = ('rank', 'product', 'game_name', 'total_sold', 'orders_count')
+    list_select_related = ('product',)
+
+@admin.register(TopWishlistView)
+class TopWishlistViewAdmin(AnalyticsViewAdmin):
+    view_name = 'top_wishlists_view'
+    list_display = ('rank', 'user', 'email', 'wishlist_count')
+    list_select_related = ('user',)
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'progress_bar', 'message', 'created_by', 'created_at', 'duration')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'message')
+    readonly_fields = (
+        'name', 'kwargs', 'status', 'progress_bar', 'message', 'result', 'error',
+        'created_by', 'worker', 'created_at', 'started_at', 'heartbeat_at', 'finished_at', 'duration',
+    )
+    fieldsets = (
+        (None, {
+            'fields': ('name', 'kwargs', 'status', 'progress_bar', 'message', 'result')
+        }),
+        ('Выполнение', {
+            'fields': ('created_by', 'worker', 'created_at', 'started_at', 'heartbeat_at', 'finished_at', 'duration')
+        }),
+        ('Ошибка', {
+            'classes': ('collapse',),
+            'fields': ('error',)
+        }),
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def progress_bar(self, obj):
+        return format_html(
+            '<progress value="{}" max="100" style="width: 120px;"></progress> {}%',
+            obj.progress, obj.progress,
+        )
+    progress_bar.short_description = "Прогресс"
+
+    def duration(self, obj):
+        return obj.duration or "—"
+    duration.short_description = "Длительность"
 
 @admin.register(Game)
 class GameAdmin(admin.ModelAdmin):
@@ -157,6 +286,79 @@ class CategoryAdmin(admin.ModelAdmin):
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('name', 'category', 'game', 'price', 'discount', 'image_preview')
+    list_filter = ('game',)
+    actions = ['export_selected_csv', 'export_selected_jsonl']
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom = [
+            path(
+                "import/",
+                self.admin_site.admin_view(self.import_view),
+                name="import_products",
+            ),
+            path(
+                "export/",
+                self.admin_site.admin_view(self.export_view),
+                name="export_products",
+            ),
+        ]
+        return custom + urls
+
+    def import_view(self, request):
+        # Разбор файла — в очереди задач (manage.py runworker): на миллионе строк запрос бы не дождался
+        form = ProductImportForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            upload = form.cleaned_data["file"]
+            stamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+            path = default_storage.save(f"imports/{stamp}_{upload.name}", upload)
+            job = enqueue(
+                'import_products', created_by=request.user,
+                path=path, fmt=detect_format(upload.name), batch_size=form.cleaned_data["batch_size"],
+            )
+            messages.success(request, f"Импорт поставлен в очередь (задача #{job.id}).")
+            return redirect("admin:main_job_change", job.id)
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Импорт товаров",
+            "form": form,
+            "fields": FIELDS,
+        }
+        return TemplateResponse(request, "admin/main/product/import.html", context)
+
+    def _export_response(self, queryset, fmt):
+        # Курсор БД и генератор: миллион товаров выгружается в постоянной памяти
+        response = StreamingHttpResponse(
+            streaming_content(stream_export(queryset.select_related(None), fmt)),
+            content_type=f"{FORMATS[fmt]}; charset=utf-8",
+        )
+        filename = f"products_{datetime.now().strftime('%Y-%m-%d')}.{fmt}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    def export_view(self, request):
+        fmt = request.GET.get("format", "csv")
+        if fmt not in FORMATS:
+            raise Http404("Неизвестный формат выгрузки")
+        queryset = Product.objects.all()
+        game_id = request.GET.get("game", "")
+        if game_id:
+            if not game_id.isdigit():
+                raise Http404("Неверный id игры")
+            queryset = queryset.filter(game_id=int(game_id))
+        return self._export_response(queryset, fmt)
+
+    def export_selected_csv(self, request, queryset):
+        return self._export_response(queryset, "csv")
+
+    export_selected_csv.short_description = "Выгрузить выбранные товары (CSV)"
+
+    def export_selected_jsonl(self, request, queryset):
+        return self._export_response(queryset, "jsonl")
+
+    export_selected_jsonl.short_description = "Выгрузить выбранные товары (JSONL)"
 
     # ...
 
@@ -0,0 +1,88 @@
+# main/analytics.py
+"""
+Материализованные представления аналитики (миграция 0016).
+
+Обновляются REFRESH MATERIALIZED VIEW CONCURRENTLY: читатели во время обновления видят
+прежние строки, а не ждут блокировку. Расписание — manage.py refresh_analytics --loop с интервалами
+ANALYTICS_REFRESH_INTERVALS (сервис analytics-scheduler в docker-compose.yaml); разовое обновление —
+задача refresh_analytics в очереди. Время и число строк последнего обновления
+пишутся в AnalyticsRefresh — дашборды показывают их без COUNT(*) по представлению.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import ActiveOrderView, AnalyticsRefresh, TopSellingProductView, TopWishlistView
+
+# имя представления -> модель (имена подставляются в SQL — только из этого списка)
+VIEWS = {
+    'active_orders_view': ActiveOrderView,
+    'top_selling_products_view': TopSellingProductView,
+    'top_wishlists_view': TopWishlistView,
+}
+
+
+class UnknownView(ValueError):
+    pass
+
+
+def refresh_view(name, concurrently=True):
+    """Обновляет представление и возвращает его AnalyticsRefresh"""
+    if name not in VIEWS:
+        raise UnknownView(name)
+    started = time.monotonic()
+    with connection.cursor() as cursor:
+        # Без CONCURRENTLY — только для ещё не заполненного представления (WITH NO DATA после восстановления)
+        cursor.execute(f"REFRESH MATERIALIZED VIEW {'CONCURRENTLY ' if concurrently else ''}{name}")
+        cursor.execute(f"SELECT COUNT(*) FROM {name}")
+        row_count = cursor.fetchone()[0]
+    refresh, _ = AnalyticsRefresh.objects.update_or_create(
+        view_name=name,
+        defaults={
+            'refreshed_at': timezone.now(),
+            'duration': timedelta(seconds=time.monotonic() - started),
+            'row_count': row_count,
+        },
+    )
+    return refresh
+
+
+def refresh_all(names=None, concurrently=True):
+    return [refresh_view(name, concurrently=concurrently) for name in names or VIEWS]
+
+
+def due_views(now=None):
+    """Представления, у которых с прошлого обновления прошло больше ANALYTICS_REFRESH_INTERVALS[имя] секунд"""
+    now = now or timezone.now()
+    intervals = getattr(settings, 'ANALYTICS_REFRESH_INTERVALS', {})
+    last = dict(AnalyticsRefresh.objects.filter(view_name__in=VIEWS).values_list('view_name', 'refreshed_at'))
+    return [
+        name for name in VIEWS
+        if name not in last or now - last[name] >= timedelta(seconds=intervals.get(name, 300))
+    ]
+
+
+def refresh_status():
+    """{имя: {'refreshed_at', 'duration_seconds', 'row_count'}}; None — ещё не обновлялось"""
+    known = {r.view_name: r for r in AnalyticsRefresh.objects.filter(view_name__in=VIEWS)}
+    return {
+        name: {
+            'refreshed_at': known[name].refreshed_at,
+            'duration_seconds': known[name].duration.total_seconds(),
+            'row_count': known[name].row_count,
+        } if name in known else None
+        for name in VIEWS
+    }
+
+
+def dashboard(limit=20):
+    """Всё для дашборда: ограниченные выборки по индексам представлений, время не зависит от числа заказов"""
+    return {
+        'refreshed': refresh_status(),
+        'latest_active_orders': list(ActiveOrderView.objects.order_by('-created_at', '-order_id')[:limit]),
+        'top_selling_products': list(TopSellingProductView.objects.order_by('rank')[:limit]),
+        'top_wishlists': list(TopWishlistView.objects.order_by('rank')[:limit]),
+    }
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        # Сброс версий кэша фрагментов при изменении каталога
+        from . import signals  # noqa: F401
+        # Реестр фоновых задач — нужен и для enqueue, и обработчику
+        from . import tasks  # noqa: F401
@@ -0,0 +1,161 @@
+# main/async_views.py
+"""
+Асинхронные версии страниц только для чтения: главная, товар, каталог игры.
+
+Подключаются через webproj/urls_async.py, когда приложение запущено под ASGI
+(webproj/asgi.py выставляет ASYNC_VIEWS=1). Независимые запросы страницы
+выполняются параллельно — каждый в своём потоке со своим соединением (из пула,
+если DB_CONNECTION_MODE=pool); рендер шаблона — в потоке запроса, как у sync-views.
+"""
+import asyncio
+from calendar import timegm
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.shortcuts import get_object_or_404, render
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .conditional import (
+    catalog_etag, catalog_last_modified, in_wishlist, product_etag, product_last_modified,
+)
+from .cache import get_cached, get_version, store
+from .counters import get_counters
+from .facets import catalog_facets
+from .models import Category, Game
+from .queries import games_with_discounts
+from .views import (
+    catalog_context, catalog_key, catalog_page, catalog_products, catalog_url_builder, render_catalog,
+    load_product, load_reviews, load_similar_products,
+)
+
+
+def _run_and_release(func):
+    try:
+        return func()
+    finally:
+        # Поток пула исполнителя не проходит request_finished: соединение возвращаем сами
+        # (в режиме pool — обратно в пул, при CONN_MAX_AGE — по обычным правилам)
+        close_old_connections()
+
+
+async def gather(*funcs):
+    """
+    Выполняет синхронные функции с запросами к БД параллельно и возвращает их результаты.
+    При ASYNC_CONCURRENT_QUERIES=False — по очереди в потоке запроса (тесты: TestCase
+    видит свои данные только в одном соединении).
+    """
+    if not getattr(settings, 'ASYNC_CONCURRENT_QUERIES', True):
+        return [await sync_to_async(func)() for func in funcs]
+    return await asyncio.gather(*(
+        sync_to_async(_run_and_release, thread_sensitive=False)(func) for func in funcs
+    ))
+
+
+def async_condition(etag_func=None, last_modified_func=None):
+    """
+    condition() для корутин: ETag и Last-Modified считаются в потоке (им нужна БД),
+    при совпадении — 304 без вызова view.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await view(request, *args, **kwargs)
+
+            await resolve_user(request)
+
+            def validators():
+                etag = etag_func(request, *args, **kwargs) if etag_func else None
+                last_modified = last_modified_func(request, *args, **kwargs) if last_modified_func else None
+                return (
+                    quote_etag(etag) if etag else None,
+                    timegm(last_modified.utctimetuple()) if last_modified else None,
+                )
+
+            etag, last_modified = await sync_to_async(validators)()
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+                if response.status_code == 200:
+                    if etag and not response.has_header('ETag'):
+                        response['ETag'] = etag
+                    if last_modified and not response.has_header('Last-Modified'):
+                        response['Last-Modified'] = http_date(last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+async def resolve_user(request):
+    """request.user без ленивой загрузки: из async-кода обращаться к БД напрямую нельзя"""
+    if not getattr(request, '_user_resolved', False):
+        request.user = await request.auser()
+        request._user_resolved = True
+    return request.user
+
+
+async def _prepare_user(request):
+    """Пользователь и счётчики шапки загружаются заранее, чтобы рендер не ходил за ними в БД"""
+    await resolve_user(request)
+    counters = get_counters(request)
+    return lambda: counters.basket_count if request.user.is_authenticated else None
+
+
+async def index_view(request):
+    load_counters = await _prepare_user(request)
+    games, discounts, _ = await gather(
+        lambda: list(Game.objects.all()),
+        # Все игры со своими первыми 4 скидочными товарами — один запрос вместо 1 + N
+        lambda: games_with_discounts(limit=4),
+        load_counters,
+    )
+    return await sync_to_async(render)(request, 'main/index.html', {
+        'games': games,
+        'games_with_discounts': discounts,
+    })
+
+
+@async_condition(etag_func=product_etag, last_modified_func=product_last_modified)
+async def product_view(request, product_id):
+    load_counters = await _prepare_user(request)
+    version = await sync_to_async(get_version)('product', product_id)
+    product, reviews, wishlisted, _ = await gather(
+        lambda: load_product(product_id, version),
+        lambda: load_reviews(product_id, version),
+        lambda: in_wishlist(request, product_id),
+        load_counters,
+    )
+    # Похожие товары зависят от категории товара (обычно — попадание в кэш фрагментов)
+    similar_products = await sync_to_async(load_similar_products)(product, version)
+
+    return await sync_to_async(render)(request, 'main/prodinfo.html', {
+        'product': product,
+        'reviews': reviews,
+        'similar_products': similar_products,
+        'in_wishlist': wishlisted,
+    })
+
+
+@async_condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+async def catalog_view(request, game_id):
+    load_counters = await _prepare_user(request)
+    params = request.GET.copy()
+    build_url = catalog_url_builder(params)
+    key = await sync_to_async(catalog_key)(game_id, params)
+
+    # Как get_or_build, но сборка фрагмента — параллельными запросами
+    cache_hit, context = await sync_to_async(get_cached)(key)
+    if not cache_hit:
+        game, categories, page, facets, _ = await gather(
+            lambda: get_object_or_404(Game, id=game_id),
+            lambda: list(Category.objects.filter(game_id=game_id)),
+            lambda: catalog_page(catalog_products(game_id, params), params, build_url),
+            lambda: catalog_facets(game_id, params),
+            load_counters,
+        )
+        context = catalog_context(game, categories, facets, page, build_url)
+        await sync_to_async(store)(key, context)
+    return await sync_to_async(render_catalog)(request, context, params, build_url)
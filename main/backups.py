@@ -0,0 +1,318 @@
+# main/backups.py
+import hashlib
+import os
+import shutil
+import subprocess
+import tarfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import BackupFile
+
+# Допустимые уровни встроенного сжатия pg_dump
+COMPRESSION_LEVELS = {'zstd': (1, 22), 'gzip': (1, 9)}
+
+
+class BackupError(Exception):
+    pass
+
+
+def pg_env():
+    # Пароль — через окружение, а не в аргументах/URL (их видно в списке процессов)
+    env = os.environ.copy()
+    env["PGPASSWORD"] = settings.DATABASES["default"]["PASSWORD"]
+    return env
+
+
+def connection_args():
+    db = settings.DATABASES["default"]
+    return [
+        "--host", db.get("HOST") or "localhost",
+        "--port", str(db.get("PORT") or "5432"),
+        "--username", db["USER"],
+    ]
+
+
+def raw_connection(dbname=None):
+    """Отдельное соединение драйвера (не Django) — к рабочей или указанной БД"""
+    params = connection.get_connection_params()
+    if dbname:
+        params['dbname'] = dbname
+    return connection.Database.connect(**params)
+
+
+def _chunk_size():
+    return getattr(settings, 'BACKUP_CHUNK_SIZE', 1024 * 1024)
+
+
+def _user_tables(cursor):
+    cursor.execute(
+        "SELECT n.nspname, c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relkind = 'r' AND n.nspname NOT IN ('pg_catalog', 'information_schema') "
+        "ORDER BY 1, 2"
+    )
+    return cursor.fetchall()
+
+
+def table_manifest(cursor):
+    """
+    Количество строк и порядконезависимая контрольная сумма (сумма hashtextextended
+    текстового представления строк) для каждой пользовательской таблицы.
+    """
+    manifest = {}
+    for schema, table in _user_tables(cursor):
+        cursor.execute(
+            'SELECT COUNT(*), COALESCE(SUM(hashtextextended(t::text, 0)), 0)::text '
+            f'FROM "{schema}"."{table}" t'
+        )
+        rows, checksum = cursor.fetchone()
+        manifest[f"{schema}.{table}"] = {'rows': rows, 'checksum': checksum}
+    return manifest
+
+
+def parse_compression(spec):
+    """'zstd:3' -> ('zstd', 3); 'none' -> ('none', 0)"""
+    method, _, level = (spec or 'none').partition(':')
+    if method == 'none':
+        return 'none', 0
+    if method not in COMPRESSION_LEVELS:
+        raise BackupError(f"Неизвестный метод сжатия: {method}")
+    low, high = COMPRESSION_LEVELS[method]
+    try:
+        level = int(level) if level else low
+    except ValueError:
+        raise BackupError(f"Некорректный уровень сжатия: {spec}")
+    if not low <= level <= high:
+        raise BackupError(f"Уровень {method} должен быть от {low} до {high}")
+    return method, level
+
+
+class _StderrProgress:
+    """Считает строки --verbose вида «dumping contents of table ...» — прогресс по таблицам"""
+
+    def __init__(self, marker, on_line=None):
+        self.marker = marker
+        self.on_line = on_line
+        self.done = 0
+        self.last = ''
+        self.tail = []
+
+    def feed(self, line):
+        line = line.decode(errors='replace').rstrip()
+        self.tail = (self.tail + [line])[-20:]
+        if self.on_line:
+            self.on_line(line)
+        if self.marker in line:
+            self.done += 1
+            self.last = line.split(': ', 1)[-1]
+
+
+def run_with_progress(cmd, marker, total, progress, sink=None, on_line=None):
+    """
+    Запускает pg_dump/pg_restore с --verbose. Если задан sink, stdout процесса
+    передаётся ему кусками по BACKUP_CHUNK_SIZE — дамп не копится в памяти.
+    on_line получает каждую строку stderr (например, для замера времени по таблицам).
+    """
+    process = subprocess.Popen(
+        cmd, env=pg_env(),
+        stdout=subprocess.PIPE if sink else subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    state = _StderrProgress(marker, on_line)
+    reported = 0
+
+    def report():
+        nonlocal reported
+        if progress and total and state.done != reported:
+            reported = state.done
+            progress(min(99, state.done * 100 // total), state.last)
+
+    if sink is None:
+        for line in process.stderr:
+            state.feed(line)
+            report()
+    else:
+        # stderr читаем в отдельном потоке, иначе процесс встанет на заполненном канале
+        def read_stderr():
+            for line in process.stderr:
+                state.feed(line)
+
+        reader = threading.Thread(target=read_stderr, daemon=True)
+        reader.start()
+        chunk_size = _chunk_size()
+        while chunk := process.stdout.read(chunk_size):
+            sink(chunk)
+            report()
+        reader.join()
+
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd[0], stderr='\n'.join(state.tail))
+    report()
+    return state.done
+
+
+def _hash_file(path, digest=None):
+    digest = digest or hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(_chunk_size()):
+            digest.update(chunk)
+    return digest
+
+
+def _directory_digest(path):
+    """SHA-256 каталога: по порядку имён — имя файла и SHA-256 его содержимого; плюс общий размер"""
+    digest, size = hashlib.sha256(), 0
+    for name in sorted(os.listdir(path)):
+        full = os.path.join(path, name)
+        digest.update(name.encode() + b'\0' + _hash_file(full).digest())
+        size += os.path.getsize(full)
+    return digest.hexdigest(), size
+
+
+def backup_checksum(backup):
+    """Пересчитать SHA-256 бэкапа на диске (для проверки перед восстановлением)"""
+    path = backup.file.path
+    if os.path.isdir(path):
+        return _directory_digest(path)[0]
+    return _hash_file(path).hexdigest()
+
+
+def create_backup(progress=None, compression=None, jobs=None):
+    """
+    pg_dump в MEDIA_ROOT/backups с записью размера, длительности и SHA-256.
+    jobs > 1 — формат directory с параллельным дампом, иначе custom, который
+    потоком пишется в файл и хэшируется на лету.
+    """
+    compression = compression or getattr(settings, 'BACKUP_COMPRESSION', 'zstd:3')
+    jobs = max(1, int(jobs or getattr(settings, 'BACKUP_JOBS', 1)))
+    method, level = parse_compression(compression)
+
+    backup_dir = os.path.join(settings.MEDIA_ROOT, 'backups')
+    os.makedirs(backup_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+    fmt = BackupFile.FORMAT_DIRECTORY if jobs > 1 else BackupFile.FORMAT_CUSTOM
+    filename = f"backup_{stamp}.dir" if jobs > 1 else f"backup_{stamp}.dump"
+    target = os.path.join(backup_dir, filename)
+
+    cmd = [
+        "pg_dump", *connection_args(),
+        "--dbname", settings.DATABASES["default"]["NAME"],
+        f"--format={fmt}",
+        f"--compress={method}:{level}" if method != 'none' else "--compress=0",
+        "--verbose",
+    ]
+    started = time.monotonic()
+    # Манифест и дамп — из одного снимка: pg_dump подключается к снимку, экспортированному
+    # отдельным соединением, поэтому проверка после восстановления сравнивает ровно те же данные.
+    # Основное соединение остаётся свободным для записи прогресса задачи.
+    snapshot_conn = raw_connection()
+    try:
+        with snapshot_conn.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            cursor.execute("SELECT pg_export_snapshot()")
+            snapshot = cursor.fetchone()[0]
+            manifest = table_manifest(cursor)
+        cmd.append(f"--snapshot={snapshot}")
+        sha256, size = _dump(cmd, fmt, target, jobs, "dumping contents of table", len(manifest), progress)
+    finally:
+        snapshot_conn.rollback()
+        snapshot_conn.close()
+
+    backup = BackupFile.objects.create(
+        file=f"backups/{filename}",
+        format=fmt,
+        compression=f"{method}:{level}" if method != 'none' else 'none',
+        jobs=jobs,
+        size_bytes=size,
+        duration=timedelta(seconds=time.monotonic() - started),
+        sha256=sha256,
+        manifest=manifest,
+    )
+    apply_retention()
+    return backup
+
+
+def _dump(cmd, fmt, target, jobs, marker, total, progress):
+    """Выполняет pg_dump в target; возвращает (sha256, размер)"""
+    if fmt == BackupFile.FORMAT_DIRECTORY:
+        try:
+            run_with_progress(cmd + ["--jobs", str(jobs), "--file", target], marker, total, progress)
+        except Exception:
+            shutil.rmtree(target, ignore_errors=True)
+            raise
+        sha256, size = _directory_digest(target)
+    else:
+        partial = target + '.part'
+        digest, size = hashlib.sha256(), 0
+        try:
+            with open(partial, 'wb') as out:
+                def sink(chunk):
+                    nonlocal size
+                    out.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                run_with_progress(cmd, marker, total, progress, sink=sink)
+            os.replace(partial, target)
+        except Exception:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        sha256 = digest.hexdigest()
+    return sha256, size
+
+
+def delete_backup(backup):
+    path = backup.file.path
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+    backup.delete()
+
+
+def apply_retention(keep_last=None, keep_days=None):
+    """Удаляет бэкапы сверх последних keep_last, если они к тому же старше keep_days дней"""
+    keep_last = getattr(settings, 'BACKUP_KEEP_LAST', 7) if keep_last is None else keep_last
+    keep_days = getattr(settings, 'BACKUP_KEEP_DAYS', 30) if keep_days is None else keep_days
+    threshold = timezone.now() - timedelta(days=keep_days)
+
+    expired = BackupFile.objects.order_by('-created_at', '-id')[keep_last:]
+    removed = 0
+    for backup in expired:
+        if backup.created_at < threshold:
+            delete_backup(backup)
+            removed += 1
+    return removed
+
+
+def stream_file(path):
+    chunk_size = _chunk_size()
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def stream_directory_tar(path):
+    """
+    Tar-архив каталога дампа, собираемый на лету: заголовок, содержимое кусками,
+    выравнивание до 512 байт. В памяти — не больше одного куска.
+    """
+    base = os.path.basename(path.rstrip(os.sep))
+    for name in sorted(os.listdir(path)):
+        full = os.path.join(path, name)
+        stat = os.stat(full)
+        info = tarfile.TarInfo(f"{base}/{name}")
+        info.size = stat.st_size
+        info.mtime = int(stat.st_mtime)
+        info.mode = 0o644
+        yield info.tobuf(tarfile.GNU_FORMAT)
+        yield from stream_file(full)
+        remainder = info.size % tarfile.BLOCKSIZE
+        if remainder:
+            yield b'\0' * (tarfile.BLOCKSIZE - remainder)
+    yield b'\0' * (tarfile.BLOCKSIZE * 2)
@@ -0,0 +1,115 @@
+# main/basket_ops.py
+from django.db import DatabaseError, connection, transaction
+
+from .recommendations import schedule_refresh
+
+MAX_OPERATIONS = 100
+# Количество одного товара в корзине; больше — переполнение сумм в сводке корзины (NUMERIC(12,2))
+MAX_QUANTITY = 999
+# id товара — BIGINT в запросах; вне диапазона — ошибка приведения типа вместо ответа 400
+MAX_PRODUCT_ID = 2 ** 63 - 1
+
+# Новые позиции и изменения количества — один upsert по уникальному (user_id, product_id).
+# Несуществующие товары отбрасываются JOIN'ом, неизменившиеся строки не трогаются,
+# чтобы не будить триггер сводки корзины впустую.
+UPSERT_SQL = """
+    INSERT INTO main_basket (user_id, product_id, quantity, created_at)
+    SELECT %s, op.product_id, op.quantity, NOW()
+    FROM unnest(%s::BIGINT[], %s::INT[]) AS op(product_id, quantity)
+    JOIN main_product p ON p.id = op.product_id
+    ON CONFLICT (user_id, product_id) DO UPDATE
+        SET quantity = EXCLUDED.quantity
+        WHERE main_basket.quantity <> EXCLUDED.quantity
+"""
+
+# Добавление в корзину: вставка или инкремент на стороне БД за один запрос.
+# Без чтения-изменения-записи параллельные клики не теряют обновления.
+ADD_SQL = """
+    INSERT INTO main_basket (user_id, product_id, quantity, created_at)
+    SELECT %s, id, %s, NOW()
+    FROM main_product
+    WHERE id = %s
+    ON CONFLICT (user_id, product_id) DO UPDATE
+        SET quantity = LEAST(main_basket.quantity + EXCLUDED.quantity, %s)
+    RETURNING quantity
+"""
+
+DELETE_SQL = """
+    DELETE FROM main_basket
+    WHERE user_id = %s AND product_id = ANY(%s::BIGINT[])
+"""
+
+
+class BasketOperationError(ValueError):
+    pass
+
+
+class EmptyBasket(Exception):
+    pass
+
+
+def parse_operations(items):
+    """
+    [{'product_id': 1, 'quantity': 3}, ...] -> {product_id: quantity}.
+    quantity — итоговое количество, 0 удаляет позицию; при повторах побеждает последняя операция.
+    """
+    if not isinstance(items, list) or not items:
+        raise BasketOperationError('Передайте непустой список операций')
+    if len(items) > MAX_OPERATIONS:
+        raise BasketOperationError(f'Не больше {MAX_OPERATIONS} операций за запрос')
+
+    operations = {}
+    for item in items:
+        try:
+            product_id = int(item['product_id'])
+            quantity = int(item['quantity'])
+        except (KeyError, TypeError, ValueError):
+            raise BasketOperationError(f'Некорректная операция: {item!r}')
+        if not 0 < product_id <= MAX_PRODUCT_ID:
+            raise BasketOperationError(f'Некорректный id товара: {product_id}')
+        if not 0 <= quantity <= MAX_QUANTITY:
+            raise BasketOperationError(f'Количество товара {product_id} — от 0 до {MAX_QUANTITY}')
+        operations[product_id] = quantity
+    return operations
+
+
+def apply_basket_operations(user_id, operations):
+    """Применяет {product_id: quantity} к корзине пользователя одной транзакцией"""
+    # Порядок по product_id — параллельные пачки блокируют строки в одном порядке
+    upserts = sorted((pid, qty) for pid, qty in operations.items() if qty > 0)
+    removals = sorted(pid for pid, qty in operations.items() if qty == 0)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        if upserts:
+            cursor.execute(UPSERT_SQL, [user_id, [pid for pid, _ in upserts], [qty for _, qty in upserts]])
+        if removals:
+            cursor.execute(DELETE_SQL, [user_id, removals])
+
+
+def add_to_basket(user_id, product_id, quantity=1):
+    """Атомарно добавляет товар в корзину (не больше MAX_QUANTITY); новое количество или None, если товара нет"""
+    with connection.cursor() as cursor:
+        cursor.execute(ADD_SQL, [user_id, quantity, product_id, MAX_QUANTITY])
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def checkout(user_id, idempotency_key=None):
+    """
+    Оформляет заказ процедурой create_order_from_basket и возвращает его id.
+    С тем же idempotency_key повторный вызов вернёт уже созданный заказ.
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("CALL create_order_from_basket(%s, %s, NULL)", [user_id, idempotency_key])
+            order_id = cursor.fetchone()[0]
+    except DatabaseError as e:
+        # no_data_found (P0002) — процедура сообщает о пустой корзине
+        # (sqlstate — psycopg 3, pgcode — psycopg2)
+        cause = e.__cause__
+        if (getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)) == 'P0002':
+            raise EmptyBasket() from e
+        raise
+    # Новый заказ — новые совместные покупки для «Похожих товаров»
+    transaction.on_commit(schedule_refresh)
+    return order_id
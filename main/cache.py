@@ -0,0 +1,82 @@
+# main/cache.py
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+_MISSING = object()
+
+
+def fragment_cache():
+    return caches[getattr(settings, 'FRAGMENT_CACHE_ALIAS', 'default')]
+
+
+def _version_key(scope, obj_id):
+    return f"ver:{scope}:{obj_id}"
+
+
+def get_version(scope, obj_id):
+    """
+    Текущая версия игры/товара. Ключи фрагментов включают версию, поэтому
+    инвалидация — это просто увеличение счётчика, старые записи вытеснит LRU/TTL.
+    """
+    cache = fragment_cache()
+    key = _version_key(scope, obj_id)
+    version = cache.get(key)
+    if version is None:
+        # Начинаем с текущего времени: после вытеснения счётчика версия не «откатится» назад
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key, 0)
+    return version
+
+
+def bump_version(scope, obj_id):
+    cache = fragment_cache()
+    key = _version_key(scope, obj_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def invalidate_product(product_id, game_id=None):
+    bump_version('product', product_id)
+    if game_id is not None:
+        bump_version('game', game_id)
+
+
+def fragment_key(*parts):
+    raw = ':'.join(str(p) for p in parts)
+    return f"frag:{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def get_cached(key):
+    """(True, значение) или (False, None), если фрагмента нет в кэше"""
+    value = fragment_cache().get(key, _MISSING)
+    if value is _MISSING:
+        return False, None
+    return True, value
+
+
+def store(key, value, timeout=None):
+    fragment_cache().set(key, value, timeout if timeout is not None else getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 600))
+
+
+def get_or_build(key, builder, timeout=None):
+    """Значение фрагмента из кэша или результат builder() (исключения не кэшируются)"""
+    hit, value = get_cached(key)
+    if not hit:
+        value = builder()
+        store(key, value, timeout)
+    return value
+
+
+def apply_discount_to_product(product_id, discount_percent):
+    """Вызов процедуры apply_discount_to_product со сбросом кэша товара и его игры"""
+    with connection.cursor() as cursor:
+        cursor.execute("CALL apply_discount_to_product(%s, %s)", [product_id, discount_percent])
+        cursor.execute("SELECT game_id FROM main_product WHERE id = %s", [product_id])
+        row = cursor.fetchone()
+    invalidate_product(product_id, row[0] if row else None)
@@ -0,0 +1,133 @@
+# main/conditional.py
+import hashlib
+
+from django.db import connection
+from django.db.models import Count, Max
+
+from .counters import get_counters
+from .loaders import request_loader
+
+# Состояние страниц игры одним запросом: её товары и категории плюс список игр
+# в навигации. MAX(updated_at) ловит изменения, COUNT(*) — удаления.
+GAME_STATE_SQL = """
+    SELECT
+        GREATEST(
+            (SELECT MAX(updated_at) FROM main_product WHERE game_id = g.id),
+            (SELECT MAX(updated_at) FROM main_category WHERE game_id = g.id),
+            (SELECT MAX(updated_at) FROM main_game)
+        ),
+        (SELECT COUNT(*) FROM main_product WHERE game_id = g.id),
+        (SELECT COUNT(*) FROM main_category WHERE game_id = g.id),
+        (SELECT COUNT(*) FROM main_game)
+    FROM main_game g
+    WHERE g.id = {game_id}
+"""
+
+
+# Страница товара: состояние его игры плюс «Похожие товары» — последний завершённый пересчёт
+# индекса (id и время) и MAX(updated_at)/число соседей товара: соседи бывают из других игр.
+# GREATEST пропускает NULL — пока пересчётов и соседей нет, остаётся время игры.
+PRODUCT_STATE_SQL = """
+    SELECT
+        GREATEST(game_state.last_modified, run.finished_at, neighbors.last_modified),
+        game_state.products, game_state.categories, game_state.games,
+        COALESCE(run.id, 0), neighbors.count
+    FROM (""" + GAME_STATE_SQL.format(game_id='(SELECT game_id FROM main_product WHERE id = %s)') + """)
+        AS game_state(last_modified, products, categories, games)
+    LEFT JOIN LATERAL (
+        SELECT id, finished_at FROM main_recommendationrun
+        WHERE finished_at IS NOT NULL
+        ORDER BY id DESC
+        LIMIT 1
+    ) run ON TRUE
+    CROSS JOIN LATERAL (
+        SELECT MAX(p.updated_at) AS last_modified, COUNT(*) AS count
+        FROM main_productneighbor n
+        JOIN main_product p ON p.id = n.neighbor_id
+        WHERE n.product_id = %s
+    ) neighbors
+"""
+
+
+def make_etag(*parts):
+    return hashlib.md5(':'.join(str(p) for p in parts).encode()).hexdigest()
+
+
+def _state(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return {'last_modified': row[0], 'counts': row[1:]}
+
+
+def game_state(game_id):
+    return _state(GAME_STATE_SQL.format(game_id='%s'), [game_id])
+
+
+def product_game_state(product_id):
+    """Состояние игры товара и его «Похожих товаров» (индекс пересчитывается отдельно от игры)"""
+    return _state(PRODUCT_STATE_SQL, [product_id, product_id])
+
+
+def collection_state(queryset):
+    """MAX(updated_at) и количество строк выборки — одним агрегатом"""
+    state = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('pk'))
+    return {'last_modified': state['last_modified'], 'counts': (state['count'],)}
+
+
+def _page_state(request, key, loader, *args):
+    """Состояние считается один раз за запрос: condition() спрашивает и ETag, и Last-Modified"""
+    cache = request.__dict__.setdefault('_conditional_state', {})
+    if key not in cache:
+        cache[key] = loader(*args)
+    return cache[key]
+
+
+def _user_parts(request):
+    # Шапка страницы содержит счётчики корзины и вишлиста — они тоже часть ответа
+    if not request.user.is_authenticated:
+        return ('anon',)
+    counters = get_counters(request)
+    return (request.user.id, counters.basket_count, counters.wishlist_count)
+
+
+def _etag(request, state, *extra):
+    if state is None:
+        return None
+    return make_etag(state['last_modified'].isoformat(), *state['counts'], *_user_parts(request), *extra)
+
+
+def _last_modified(request, state):
+    # Для вошедших пользователей страница зависит и от корзины — сравнение только по ETag
+    if state is None or request.user.is_authenticated:
+        return None
+    return state['last_modified']
+
+
+def catalog_etag(request, game_id):
+    return _etag(request, _page_state(request, ('game', game_id), game_state, game_id))
+
+
+def catalog_last_modified(request, game_id):
+    return _last_modified(request, _page_state(request, ('game', game_id), game_state, game_id))
+
+
+def in_wishlist(request, product_id):
+    """
+    Есть ли товар в вишлисте пользователя. Через загрузчик запроса: отметки для всех
+    товаров, запрошенных страницей до первого обращения, — одним запросом.
+    """
+    if not request.user.is_authenticated:
+        return False
+    return request_loader(request, 'wishlist').load(product_id).get()
+
+
+def product_etag(request, product_id):
+    state = _page_state(request, ('product', product_id), product_game_state, product_id)
+    return _etag(request, state, product_id, in_wishlist(request, product_id))
+
+
+def product_last_modified(request, product_id):
+    return _last_modified(request, _page_state(request, ('product', product_id), product_game_state, product_id))
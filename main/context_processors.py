@@ -1,28 +1,15 @@
-from .models import Game, Basket, Wishlist
-from django.contrib.auth.models import User
+from django.utils.functional import SimpleLazyObject
 
+from .models import Game
+from .counters import get_counters
 
-def call_pg_function(func_name, *args):
-    """Вызов PostgreSQL-функции"""
-    with connection.cursor() as cursor:
-        placeholders = ', '.join(['%s'] * len(args))
-        cursor.execute(f"SELECT {func_name}({placeholders})", args)
-        return cursor.fetchone()[0]
 
 def cart_and_wishlist_counts(request):
-    basket_count = 0
-    wishlist_count = 0
-    if request.user.is_authenticated:
-        try:
-            basket_count = call_pg_function('get_basket_count', request.user.id)
-            wishlist_count = call_pg_function('get_wishlist_count', request.user.id)
-        except Exception:
-
-            basket_count = Basket.objects.filter(user=request.user).count()
-            wishlist_count = Wishlist.objects.filter(user=request.user).count()
+    """Счётчики для шапки: запрос в БД выполняется, только если шаблон их прочитает"""
+    counters = get_counters(request)
     return {
-        'basket_items_count': basket_count,
-        'wishlist_count': wishlist_count,
+        'basket_items_count': SimpleLazyObject(lambda: counters.basket_count),
+        'wishlist_count': SimpleLazyObject(lambda: counters.wishlist_count),
     }
 
 def games_context(request):
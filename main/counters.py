@@ -0,0 +1,74 @@
+# main/counters.py
+from decimal import Decimal
+
+from django.db import connection
+
+
+class UserCounters:
+    """Счётчики корзины и списка желаний пользователя, загружаемые не чаще раза за запрос"""
+
+    def __init__(self, user):
+        self.user = user
+        self._basket = None
+        self._wishlist = None
+        self._total = None
+
+    @property
+    def loaded(self):
+        return self._basket is not None
+
+    def _load(self):
+        if self.loaded:
+            return
+        if not self.user.is_authenticated:
+            self._basket, self._wishlist, self._total = 0, 0, Decimal('0.00')
+            return
+        # Оба счётчика и сумма корзины — одним запросом
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT get_basket_count(%s), get_wishlist_count(%s), get_basket_total(%s)",
+                [self.user.id, self.user.id, self.user.id],
+            )
+            self._basket, self._wishlist, self._total = cursor.fetchone()
+
+    @property
+    def basket_count(self):
+        self._load()
+        return self._basket
+
+    @property
+    def wishlist_count(self):
+        self._load()
+        return self._wishlist
+
+    @property
+    def basket_total(self):
+        self._load()
+        if self._total is None:
+            # Сумма сброшена после изменения корзины — перечитываем всё
+            self.invalidate()
+            self._load()
+        return self._total
+
+    def adjust(self, basket=0, wishlist=0):
+        """Поправить уже загруженные значения после изменения корзины/вишлиста"""
+        if self.loaded:
+            self._basket = max(self._basket + basket, 0)
+            self._wishlist = max(self._wishlist + wishlist, 0)
+            if basket:
+                # Сумму по одному количеству не восстановить — перечитается при обращении
+                self._total = None
+
+    def invalidate(self):
+        self._basket = None
+        self._wishlist = None
+        self._total = None
+
+
+def get_counters(request):
+    """Счётчики текущего запроса (создаются при первом обращении)"""
+    counters = getattr(request, '_user_counters', None)
+    if counters is None:
+        counters = UserCounters(request.user)
+        request._user_counters = counters
+    return counters
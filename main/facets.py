@@ -0,0 +1,102 @@
+# main/facets.py
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connection
+
+from .cache import fragment_cache, get_version
+
+# Границы ценовых корзин гистограммы: [0, 100), [100, 500), ..., [10000, ∞)
+PRICE_BUCKETS = getattr(settings, 'CATALOG_PRICE_BUCKETS', [0, 100, 500, 1000, 5000, 10000])
+FACETS_CACHE_TIMEOUT = getattr(settings, 'CATALOG_FACETS_CACHE_TIMEOUT', 300)
+
+# Один проход по товарам игры: GROUPING SETS считает и категории, и ценовые корзины.
+# Счётчик по категориям учитывает фильтр цены (но не выбор категорий), гистограмма цен —
+# наоборот, поэтому соседние значения фасета показывают, сколько товаров добавит клик.
+FACETS_SQL = """
+    SELECT
+        GROUPING(category_id) AS no_category,
+        GROUPING(bucket) AS no_bucket,
+        category_id,
+        bucket,
+        COUNT(*) FILTER (WHERE price_ok) AS by_category,
+        COUNT(*) FILTER (WHERE category_ok) AS by_price,
+        COUNT(*) FILTER (WHERE price_ok AND category_ok) AS matched
+    FROM (
+        SELECT
+            category_id,
+            width_bucket(price, %(buckets)s::NUMERIC[]) AS bucket,
+            (%(min_price)s::NUMERIC IS NULL OR price >= %(min_price)s)
+                AND (%(max_price)s::NUMERIC IS NULL OR price <= %(max_price)s) AS price_ok,
+            (%(categories)s::BIGINT[] IS NULL OR category_id = ANY(%(categories)s::BIGINT[])) AS category_ok
+        FROM main_product
+        WHERE game_id = %(game_id)s
+    ) p
+    GROUP BY GROUPING SETS ((category_id), (bucket), ())
+"""
+
+
+def _decimal(value):
+    if value in (None, ''):
+        return None
+    try:
+        number = Decimal(str(value))
+    except InvalidOperation:
+        return None
+    return number if number.is_finite() else None
+
+
+def normalize_filters(params):
+    """Фильтры каталога из QueryDict в каноническом виде (для SQL и ключа кэша)"""
+    categories = sorted({int(c) for c in params.getlist('category') if str(c).isdigit()})
+    return {
+        'categories': categories or None,
+        'min_price': _decimal(params.get('min_price')),
+        'max_price': _decimal(params.get('max_price')),
+    }
+
+
+def _cache_key(game_id, filters):
+    raw = json.dumps(filters, default=str, sort_keys=True)
+    version = get_version('game', game_id)
+    return f"catalog_facets:{game_id}:{version}:{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def compute_facets(game_id, filters):
+    with connection.cursor() as cursor:
+        cursor.execute(FACETS_SQL, {
+            'game_id': game_id,
+            'buckets': PRICE_BUCKETS,
+            **filters,
+        })
+        rows = cursor.fetchall()
+
+    categories, histogram, total = {}, {}, 0
+    for no_category, no_bucket, category_id, bucket, by_category, by_price, matched in rows:
+        if not no_category:
+            categories[category_id] = by_category
+        elif not no_bucket:
+            histogram[bucket] = by_price
+        else:
+            total = matched
+
+    price_buckets = []
+    for index, lower in enumerate(PRICE_BUCKETS, start=1):
+        upper = PRICE_BUCKETS[index] if index < len(PRICE_BUCKETS) else None
+        price_buckets.append({'min': lower, 'max': upper, 'count': histogram.get(index, 0)})
+
+    return {'total': total, 'categories': categories, 'price_buckets': price_buckets}
+
+
+def catalog_facets(game_id, params):
+    """Фасеты каталога для текущих фильтров (кэшируются по версии игры и нормализованным параметрам)"""
+    filters = normalize_filters(params)
+    key = _cache_key(game_id, filters)
+    cache = fragment_cache()
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(game_id, filters)
+        cache.set(key, facets, FACETS_CACHE_TIMEOUT)
+    return facets
@@ -3,6 +3,7 @@ from django import forms
 from .models import Game, Category, Product, User, Order, Review
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
+from django.core.validators import FileExtensionValidator
 
 class LoginForm(AuthenticationForm):
     username = forms.CharField(
@@ -48,6 +49,19 @@ class ProductForm(forms.ModelForm):
             'game': forms.Select(attrs={'class': 'form-select'}),
         }
 
+class ProductImportForm(forms.Form):
+    file = forms.FileField(
+        label='Файл CSV или JSONL',
+        validators=[FileExtensionValidator(allowed_extensions=['csv', 'jsonl', 'ndjson'])],
+    )
+    batch_size = forms.IntegerField(
+        label='Размер пачки',
+        required=False,
+        min_value=1,
+        max_value=10000,
+        help_text='Сколько строк записывать за один bulk_create/bulk_update (по умолчанию PRODUCT_IMPORT_BATCH_SIZE)',
+    )
+
 class UserForm(forms.ModelForm):
     password = forms.CharField(widget=forms.PasswordInput(attrs={'class': 'form-control'}))
 
@@ -0,0 +1,179 @@
+# main/images.py
+"""
+Уменьшенные копии изображений товаров и логотипов игр.
+
+Копии лежат рядом с оригиналом: products/game_1/product_5/thumbs/sword_320w.webp.
+Какие ширины уже готовы, записано в JSON-поле модели (image_variants / logo_variants)
+вместе с именем исходного файла — шаблонам и API не нужны ни лишние запросы, ни
+обращения к хранилищу. Пока копий нет (или оригинал заменён), отдаётся оригинал.
+Генерацию ставит в очередь сохранение изображения (main/signals.py), старые файлы
+догоняет manage.py generate_thumbnails; чтение страниц в БД не пишет.
+"""
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .cache import bump_version, invalidate_product
+from .models import Game, Product
+
+# модель -> (поле изображения, поле со списком готовых копий)
+IMAGE_FIELDS = {
+    'product': ('image', 'image_variants'),
+    'game': ('logo', 'logo_variants'),
+}
+MODELS = {'product': Product, 'game': Game}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def _settings():
+    return (
+        tuple(sorted(getattr(settings, 'THUMBNAIL_WIDTHS', (160, 320, 640)))),
+        getattr(settings, 'THUMBNAIL_FORMAT', 'webp'),
+        getattr(settings, 'THUMBNAIL_QUALITY', 80),
+    )
+
+
+def model_key(instance):
+    return 'game' if isinstance(instance, Game) else 'product'
+
+
+def derivative_name(source, width, fmt):
+    directory, filename = os.path.split(source)
+    stem = os.path.splitext(filename)[0]
+    return f"{directory}/thumbs/{stem}_{width}w.{EXTENSIONS[fmt]}"
+
+
+def current_variants(instance):
+    """Готовые копии для текущего файла: {'width': W, 'widths': {'320': name}} или None"""
+    image_field, variants_field = IMAGE_FIELDS[model_key(instance)]
+    image = getattr(instance, image_field)
+    variants = getattr(instance, variants_field) or {}
+    if not image or variants.get('source') != image.name or variants.get('format') != _settings()[1]:
+        return None
+    return variants
+
+
+def thumbnail_url(instance, width):
+    """URL самой узкой копии не уже width; без копий — оригинал (None, если изображения нет)"""
+    image_field, _ = IMAGE_FIELDS[model_key(instance)]
+    image = getattr(instance, image_field)
+    if not image:
+        return None
+    variants = current_variants(instance)
+    if variants is None:
+        return image.url
+    for candidate in sorted(int(w) for w in variants['widths']):
+        if candidate >= width:
+            return default_storage.url(variants['widths'][str(candidate)])
+    return image.url
+
+
+def srcset(instance):
+    """'…_160w.webp 160w, …_320w.webp 320w, оригинал 1200w' — или '', пока копий нет"""
+    image_field, _ = IMAGE_FIELDS[model_key(instance)]
+    variants = current_variants(instance)
+    if variants is None:
+        return ''
+    entries = [
+        f"{default_storage.url(name)} {width}w"
+        for width, name in sorted(variants['widths'].items(), key=lambda item: int(item[0]))
+    ]
+    entries.append(f"{getattr(instance, image_field).url} {variants['width']}w")
+    return ', '.join(entries)
+
+
+def schedule(instance):
+    """Поставить генерацию в очередь, если задача для этого объекта ещё не ждёт в ней"""
+    from .jobs import enqueue
+    from .models import Job
+
+    model = model_key(instance)
+    queued = Job.objects.filter(
+        name='generate_thumbnails', status=Job.STATUS_QUEUED, kwargs__model=model, kwargs__pk=instance.pk,
+    )
+    if not queued.exists():
+        enqueue('generate_thumbnails', model=model, pk=instance.pk)
+
+
+def _render(image, width, fmt, quality):
+    from PIL import Image
+
+    height = max(1, round(image.height * width / image.width))
+    # reducing_gap: сначала быстрое уменьшение в целое число раз, затем LANCZOS
+    resized = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    if fmt == 'jpeg' and resized.mode != 'RGB':
+        background = Image.new('RGB', resized.size, 'white')
+        background.paste(resized, mask=resized.getchannel('A') if 'A' in resized.getbands() else None)
+        resized = background
+    buffer = io.BytesIO()
+    resized.save(buffer, format=fmt.upper(), quality=quality, **({'method': 4} if fmt == 'webp' else {'optimize': True}))
+    return buffer.getvalue()
+
+
+def generate(model, pk, force=False):
+    """
+    Создаёт недостающие копии для объекта и записывает их в его JSON-поле.
+    Возвращает число созданных файлов (0 — всё уже было готово или изображения нет).
+    """
+    from PIL import Image, ImageOps
+
+    image_field, variants_field = IMAGE_FIELDS[model]
+    instance = MODELS[model].objects.filter(pk=pk).first()
+    if instance is None or not getattr(instance, image_field):
+        return 0
+    if not force and current_variants(instance) is not None:
+        return 0
+
+    widths, fmt, quality = _settings()
+    source = getattr(instance, image_field).name
+    with default_storage.open(source, 'rb') as f:
+        image = Image.open(f)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'P') else 'RGB')
+
+        created, ready = 0, {}
+        # Увеличенных копий не делаем: шире оригинала браузер возьмёт сам оригинал
+        for width in (w for w in widths if w < image.width):
+            name = derivative_name(source, width, fmt)
+            if force or not default_storage.exists(name):
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+                default_storage.save(name, ContentFile(_render(image, width, fmt, quality)))
+                created += 1
+            ready[str(width)] = name
+        original_width = image.width
+
+    variants = {'source': source, 'format': fmt, 'width': original_width, 'widths': ready}
+    # Условие на имя файла: если оригинал успели заменить, копии старого не записываем
+    MODELS[model].objects.filter(pk=pk, **{image_field: source}).update(**{variants_field: variants})
+    if model == 'product':
+        invalidate_product(pk, instance.game_id)
+    else:
+        bump_version('game', pk)
+    return created
+
+
+def stale_ids(model, force=False):
+    """id объектов с изображением, у которых копии не созданы или устарели"""
+    image_field, variants_field = IMAGE_FIELDS[model]
+    queryset = MODELS[model].objects.exclude(**{f'{image_field}__isnull': True}).exclude(**{image_field: ''})
+    for pk, name, variants in queryset.order_by('pk').values_list('pk', image_field, variants_field).iterator():
+        variants = variants or {}
+        if force or variants.get('source') != name or variants.get('format') != _settings()[1]:
+            yield pk
+
+
+def generate_in_process(args):
+    """Точка входа процесса пула для manage.py generate_thumbnails: (model, pk, force) -> (pk, создано, ошибка)"""
+    from django.db import close_old_connections
+
+    model, pk, force = args
+    close_old_connections()
+    try:
+        return pk, generate(model, pk, force=force), None
+    except Exception as e:
+        return pk, 0, f"{type(e).__name__}: {e}"
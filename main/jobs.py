@@ -0,0 +1,153 @@
+# main/jobs.py
+"""
+Очередь фоновых задач поверх таблицы main_job — без внешнего брокера.
+
+    @task('backup')
+    def backup(job):
+        job.progress(50, 'Половина готова')
+        return {'backup_id': 1}
+
+    enqueue('backup', created_by=request.user)
+
+Задачи выполняет manage.py runworker. Модуль не импортирует модели на уровне
+модуля: run_job вызывается в дочерних процессах пула, где Django ещё не настроен.
+"""
+import logging
+import os
+import socket
+import traceback
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+# Следующая задача из очереди: SKIP LOCKED позволяет нескольким обработчикам
+# разбирать очередь параллельно, не блокируя друг друга
+CLAIM_SQL = """
+    UPDATE main_job
+    SET status = 'running', started_at = NOW(), heartbeat_at = NOW(), worker = %s
+    WHERE id = (
+        SELECT id FROM main_job
+        WHERE status = 'queued'
+        ORDER BY id
+        FOR UPDATE SKIP LOCKED
+        LIMIT 1
+    )
+    RETURNING id
+"""
+
+
+class UnknownTask(KeyError):
+    pass
+
+
+def task(name):
+    """Регистрирует функцию как фоновую задачу: fn(job, **kwargs) -> JSON-совместимый результат"""
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(name, created_by=None, **kwargs):
+    from .models import Job
+
+    if name not in TASKS:
+        raise UnknownTask(name)
+    return Job.objects.create(name=name, kwargs=kwargs, created_by=created_by)
+
+
+def claim_next(worker=None):
+    """Переводит следующую задачу в running и возвращает её id (или None, если очередь пуста)"""
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute(CLAIM_SQL, [worker or worker_name()])
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+class JobContext:
+    """То, что получает задача: параметры и отчёт о прогрессе"""
+
+    def __init__(self, job):
+        self.job = job
+        self.id = job.id
+
+    def progress(self, percent, message=''):
+        from django.utils import timezone
+        from .models import Job
+
+        percent = max(0, min(100, int(percent)))
+        Job.objects.filter(id=self.id).update(
+            progress=percent, message=message[:255], heartbeat_at=timezone.now(),
+        )
+
+
+def run_job(job_id):
+    """Выполняет уже захваченную (running) задачу и фиксирует итог"""
+    from django.utils import timezone
+    from .models import Job
+
+    job = Job.objects.get(id=job_id)
+    func = TASKS.get(job.name)
+    try:
+        if func is None:
+            raise UnknownTask(job.name)
+        result = func(JobContext(job), **job.kwargs)
+    except Exception as e:
+        logger.exception("Задача #%s (%s) завершилась ошибкой", job.id, job.name)
+        Job.objects.filter(id=job.id).update(
+            status=Job.STATUS_FAILED,
+            message=str(e)[:255],
+            error=traceback.format_exc(),
+            finished_at=timezone.now(),
+        )
+        return False
+
+    Job.objects.filter(id=job.id).update(
+        status=Job.STATUS_DONE,
+        progress=100,
+        result=result,
+        finished_at=timezone.now(),
+    )
+    return True
+
+
+def init_worker_process():
+    """initializer пула процессов: настроить Django (реестр задач загрузит MainConfig.ready)"""
+    import django
+    django.setup()
+
+
+def run_job_in_process(job_id):
+    """Точка входа дочернего процесса пула"""
+    from django.db import close_old_connections
+    close_old_connections()
+    try:
+        return run_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def fail_job(job_id, message):
+    """Пометить задачу проваленной снаружи (процесс пула упал, задача зависла)"""
+    from django.utils import timezone
+    from .models import Job
+
+    Job.objects.filter(id=job_id, status=Job.STATUS_RUNNING).update(
+        status=Job.STATUS_FAILED, message=message[:255], finished_at=timezone.now(),
+    )
+
+
+def requeue_job(job_id):
+    """Вернуть захваченную, но не начатую задачу в очередь (пул процессов не принял её)"""
+    from .models import Job
+
+    Job.objects.filter(id=job_id, status=Job.STATUS_RUNNING).update(
+        status=Job.STATUS_QUEUED, started_at=None, heartbeat_at=None, worker='',
+    )
@@ -0,0 +1,227 @@
+# main/loaders.py
+"""
+Загрузка данных страницы: независимые выборки — параллельно, поиск по ключам — пачками.
+
+    fetch = Fanout('product')
+    fetch.add('product', lambda: load_product(product_id, version))
+    fetch.add('reviews', lambda: load_reviews(product_id, version))
+    fetch.add('similar', lambda product: load_similar_products(product, version), after=['product'])
+    data = fetch.run()
+
+Каждая выборка выполняется в потоке общего пула со своим соединением с БД. Выборка
+с after= стартует, как только готовы её зависимости, не дожидаясь остальных: время
+страницы — самый длинный путь по зависимостям, а не сумма всех запросов.
+
+Внутри транзакции (TestCase, ATOMIC_REQUESTS, transaction.atomic) выборки идут по
+очереди в текущем потоке: другие соединения не видят её незакоммиченных данных.
+
+DataLoader собирает ключи, запрошенные разными частями страницы, и загружает
+недостающие одним запросом; загрузчики живут один запрос (request_loader).
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .models import Wishlist
+from .query_budget import count_queries, record_queries
+
+logger = logging.getLogger(__name__)
+
+# Время — в мс от начала run(); thread — чтобы в трассировке было видно распараллеливание
+Span = namedtuple('Span', 'name start duration queries thread')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.LOADER_MAX_WORKERS, thread_name_prefix='loader',
+            )
+        return _executor
+
+
+def _sequential():
+    return getattr(settings, 'LOADER_MAX_WORKERS', 4) <= 1 or connection.in_atomic_block
+
+
+class Fanout:
+    def __init__(self, name):
+        self.name = name
+        self.tasks = {}
+        self.trace = []
+        self.elapsed = None
+
+    def add(self, name, func, after=()):
+        """func(*результаты after) — зависимости должны быть добавлены раньше"""
+        unknown = [dep for dep in after if dep not in self.tasks]
+        if unknown:
+            raise ValueError(f"{self.name}.{name}: неизвестные зависимости {', '.join(unknown)}")
+        self.tasks[name] = (func, tuple(after))
+        return self
+
+    def run(self):
+        """{имя: результат}; исключение первой упавшей выборки пробрасывается (Http404 и т. п.)"""
+        started = time.perf_counter()
+        self.trace = []
+        concurrent = not _sequential()
+        try:
+            results = self._run_concurrent(started) if concurrent else self._run_sequential(started)
+        finally:
+            self.elapsed = (time.perf_counter() - started) * 1000
+            if concurrent:
+                # Запросы потоков пула не видны счётчику потока запроса — добавляем их query_budget
+                record_queries(sum(span.queries for span in self.trace))
+            self._log()
+        return results
+
+    def _call(self, name, func, args, started, release):
+        begin = time.perf_counter()
+        try:
+            with count_queries() as counter:
+                return func(*args)
+        finally:
+            self.trace.append(Span(
+                name, (begin - started) * 1000, (time.perf_counter() - begin) * 1000,
+                counter['count'], threading.current_thread().name,
+            ))
+            if release:
+                # Поток пула не проходит request_finished: соединение возвращаем сами
+                close_old_connections()
+
+    def _run_sequential(self, started):
+        results = {}
+        for name, (func, after) in self.tasks.items():
+            results[name] = self._call(name, func, [results[dep] for dep in after], started, False)
+        return results
+
+    def _run_concurrent(self, started):
+        executor = _get_executor()
+        results, pending, running = {}, dict(self.tasks), {}
+
+        def submit_ready():
+            for name, (func, after) in list(pending.items()):
+                if all(dep in results for dep in after):
+                    del pending[name]
+                    args = [results[dep] for dep in after]
+                    running[executor.submit(self._call, name, func, args, started, True)] = name
+
+        submit_ready()
+        try:
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+                submit_ready()
+        finally:
+            # После ошибки не ждём остальных: ещё не начатые отменяем, начатые доработают сами
+            for future in running:
+                future.cancel()
+        return results
+
+    def _log(self):
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        lines = [f"{self.name}: {self.elapsed:.1f} мс, выборок {len(self.trace)}"]
+        for span in sorted(self.trace, key=lambda s: s.start):
+            lines.append(
+                f"  {span.name:<14} {span.start:7.1f} → {span.start + span.duration:7.1f} мс"
+                f"  запросов {span.queries}  [{span.thread}]"
+            )
+        logger.debug('\n'.join(lines))
+
+    def server_timing(self, response):
+        """Заголовок Server-Timing: время каждой выборки видно в DevTools браузера"""
+        if getattr(settings, 'LOADER_SERVER_TIMING', False) and self.elapsed is not None:
+            entries = [f"{span.name};dur={span.duration:.1f}" for span in self.trace]
+            entries.append(f"{self.name};desc=fanout;dur={self.elapsed:.1f}")
+            existing = response.get('Server-Timing')
+            response['Server-Timing'] = ', '.join(([existing] if existing else []) + entries)
+        return response
+
+
+class DataLoader:
+    """
+    load(key) ставит ключ в очередь и возвращает отложенное значение; первое обращение
+    к любому из них загружает всю очередь одним вызовом batch(keys) -> {key: value}.
+    Загруженное запоминается на время жизни загрузчика; отсутствующие ключи — default.
+    """
+
+    class Deferred:
+        __slots__ = ('loader', 'key')
+
+        def __init__(self, loader, key):
+            self.loader = loader
+            self.key = key
+
+        def get(self):
+            return self.loader.get(self.key)
+
+    def __init__(self, batch, default=None):
+        self.batch = batch
+        self.default = default
+        self._values = {}
+        self._queue = []
+        # Загрузчик запроса могут читать потоки Fanout
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        with self._lock:
+            if key not in self._values and key not in self._queue:
+                self._queue.append(key)
+        return self.Deferred(self, key)
+
+    def load_many(self, keys):
+        for key in keys:
+            self.load(key)
+        self.dispatch()
+        return [self._values.get(key, self.default) for key in keys]
+
+    def prime(self, key, value):
+        with self._lock:
+            self._values.setdefault(key, value)
+
+    def get(self, key):
+        self.dispatch()
+        return self._values.get(key, self.default)
+
+    def dispatch(self):
+        with self._lock:
+            keys, self._queue = self._queue, []
+            if keys:
+                loaded = self.batch(keys)
+                for key in keys:
+                    self._values[key] = loaded.get(key, self.default)
+
+
+def wishlisted_products(user):
+    """Какие из товаров в вишлисте пользователя — одним запросом на все ключи"""
+    def batch(product_ids):
+        if not user.is_authenticated:
+            return {}
+        found = Wishlist.objects.filter(user=user, product_id__in=product_ids).values_list('product_id', flat=True)
+        return {product_id: True for product_id in found}
+    return batch
+
+
+# имя -> фабрика batch-функции от пользователя запроса
+LOADERS = {
+    'wishlist': (wishlisted_products, False),
+}
+
+
+def request_loader(request, name):
+    """Загрузчик текущего запроса: ключи со всей страницы копятся в одном экземпляре"""
+    loaders = request.__dict__.setdefault('_data_loaders', {})
+    if name not in loaders:
+        factory, default = LOADERS[name]
+        loaders[name] = DataLoader(factory(request.user), default=default)
+    return loaders[name]
@@ -0,0 +1,153 @@
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+SERVERS = {
+    'wsgi': {'SERVER_MODE': 'wsgi', 'ASYNC_VIEWS': '0'},
+    'asgi': {'SERVER_MODE': 'asgi', 'ASYNC_VIEWS': '1'},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает gunicorn с потоками (WSGI, синхронные views) и gunicorn с воркерами uvicorn "
+        "(ASGI, асинхронные страницы) под большим числом одновременных клиентов. "
+        "Серверы запускаются по очереди на одном порту с одинаковым числом воркеров"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--urls', default='/,/api/games/',
+            help="Пути через запятую; клиенты перебирают их по кругу (например /,/catalog/1/,/prodinfo/1/)",
+        )
+        parser.add_argument('--clients', type=int, default=100, help="Одновременных клиентов (keep-alive соединений)")
+        parser.add_argument('--duration', type=float, default=20.0, help="Длительность замера для сервера, с")
+        parser.add_argument('--workers', type=int, default=2, help="Воркеров gunicorn у каждого сервера")
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--servers', default='wsgi,asgi', help="Какие серверы сравнить")
+        parser.add_argument('--header', action='append', default=[], help="Доп. заголовок 'Name: value' (например Cookie)")
+
+    def handle(self, *args, **options):
+        servers = [s.strip() for s in options['servers'].split(',') if s.strip()]
+        unknown = set(servers) - set(SERVERS)
+        if unknown:
+            raise CommandError(f"Неизвестные серверы: {', '.join(sorted(unknown))}")
+        urls = [u.strip() for u in options['urls'].split(',') if u.strip()]
+        headers = dict(h.split(':', 1) for h in options['header'])
+        headers = {name.strip(): value.strip() for name, value in headers.items()}
+
+        results = {}
+        for server in servers:
+            process = self.start(server, options)
+            try:
+                self.wait_ready(options['port'], urls[0], process)
+                self.load(options['port'], urls, headers, min(options['clients'], 10), 2.0)  # прогрев
+                results[server] = self.load(
+                    options['port'], urls, headers, options['clients'], options['duration'],
+                )
+            finally:
+                process.terminate()
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+        baseline = results.get('wsgi', {}).get('rps')
+        for server, r in results.items():
+            speedup = f", x{r['rps'] / baseline:.2f} к wsgi" if baseline and server != 'wsgi' else ''
+            self.stdout.write(
+                f"{server:>5}: {r['rps']:.0f} запр/с, p50 {r['p50_ms']:.1f} мс, p95 {r['p95_ms']:.1f} мс, "
+                f"p99 {r['p99_ms']:.1f} мс, ошибок {r['errors']}{speedup}"
+            )
+
+    def start(self, server, options):
+        env = {
+            **os.environ, **SERVERS[server],
+            'GUNICORN_BIND': f"127.0.0.1:{options['port']}",
+            'GUNICORN_WORKERS': str(options['workers']),
+        }
+        # Лог сервера — во временный файл: непрочитанный PIPE переполнился бы и остановил сервер
+        log = tempfile.TemporaryFile(mode='w+')
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py'],
+            env=env, stdout=subprocess.DEVNULL, stderr=log, text=True,
+        )
+        process.log = log
+        return process
+
+    def wait_ready(self, port, url, process, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                process.log.seek(0)
+                raise CommandError(f"Сервер не запустился: {process.log.read().strip()[-2000:]}")
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                connection.request('GET', url)
+                connection.getresponse().read()
+                connection.close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f"Сервер не ответил за {timeout:.0f} с")
+
+    def load(self, port, urls, headers, clients, duration):
+        latencies, errors = [], []
+        lock = threading.Lock()
+        start = threading.Barrier(clients + 1)
+        deadline = []
+
+        def run(offset):
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            local, failed, i = [], 0, offset
+            start.wait()
+            while time.monotonic() < deadline[0]:
+                url = urls[i % len(urls)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', url, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status >= 500:
+                        failed += 1
+                except (OSError, http.client.HTTPException):
+                    failed += 1
+                    connection.close()
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                local.append((time.perf_counter() - started) * 1000)
+            connection.close()
+            with lock:
+                latencies.extend(local)
+                errors.append(failed)
+
+        workers = [threading.Thread(target=run, args=(n,)) for n in range(clients)]
+        for worker in workers:
+            worker.start()
+        deadline.append(time.monotonic() + duration)
+        started = time.monotonic()
+        start.wait()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+
+        latencies.sort()
+
+        def percentile(p):
+            return latencies[max(0, int(len(latencies) * p) - 1)] if latencies else 0
+
+        return {
+            'requests': len(latencies),
+            'rps': len(latencies) / elapsed,
+            'p50_ms': statistics.median(latencies) if latencies else 0,
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'errors': sum(errors),
+        }
@@ -0,0 +1,103 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+
+MODES = ['off', 'persistent', 'pool']
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает запросы в секунду при разных DB_CONNECTION_MODE: off (соединение на запрос), "
+        "persistent (CONN_MAX_AGE) и pool (psycopg_pool). Каждый режим — отдельный процесс, "
+        "потому что режим читается из окружения при загрузке settings"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='/api/games/', help="Что запрашивать (через тестовый клиент Django)")
+        parser.add_argument('--threads', type=int, default=4, help="Параллельных потоков (как потоков gthread-воркера)")
+        parser.add_argument('--duration', type=float, default=10.0, help="Длительность замера для режима, с")
+        parser.add_argument('--modes', default=','.join(MODES), help="Какие режимы сравнить")
+        parser.add_argument('--worker', action='store_true', help="Служебный: замер в текущем процессе, вывод JSON")
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self.stdout.write(json.dumps(self.measure(options['url'], options['threads'], options['duration'])))
+            return
+
+        modes = [m.strip() for m in options['modes'].split(',') if m.strip()]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Неизвестные режимы: {', '.join(sorted(unknown))}")
+
+        results = {}
+        for mode in modes:
+            env = {**os.environ, 'DB_CONNECTION_MODE': mode, 'GUNICORN_THREADS': str(options['threads'])}
+            process = subprocess.run(
+                [
+                    sys.executable, sys.argv[0], 'bench_connections', '--worker',
+                    '--url', options['url'],
+                    '--threads', str(options['threads']),
+                    '--duration', str(options['duration']),
+                ],
+                env=env, capture_output=True, text=True,
+            )
+            if process.returncode != 0:
+                raise CommandError(f"Режим {mode}: {process.stderr.strip()[-2000:]}")
+            results[mode] = json.loads(process.stdout.strip().splitlines()[-1])
+
+        baseline = results.get('off', {}).get('rps')
+        for mode, r in results.items():
+            speedup = f", x{r['rps'] / baseline:.2f} к off" if baseline and mode != 'off' else ''
+            self.stdout.write(
+                f"{mode:>10}: {r['rps']:.0f} запр/с, p50 {r['p50_ms']:.1f} мс, p99 {r['p99_ms']:.1f} мс, "
+                f"ошибок {r['errors']}{speedup}"
+            )
+
+    def measure(self, url, threads, duration):
+        latencies, errors = [], []
+        lock = threading.Lock()
+        # Прогрев: импорт модулей, первый пул/соединение не должны попасть в замер
+        Client().get(url)
+        connections.close_all()
+        deadline = time.monotonic() + duration
+
+        def run():
+            client = Client()
+            local, failed = [], 0
+            try:
+                while time.monotonic() < deadline:
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    local.append((time.perf_counter() - started) * 1000)
+                    if response.status_code >= 500:
+                        failed += 1
+            finally:
+                connections.close_all()
+            with lock:
+                latencies.extend(local)
+                errors.append(failed)
+
+        workers = [threading.Thread(target=run) for _ in range(threads)]
+        started = time.monotonic()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'rps': len(latencies) / elapsed,
+            'p50_ms': statistics.median(latencies) if latencies else 0,
+            'p99_ms': latencies[int(len(latencies) * 0.99) - 1] if latencies else 0,
+            'errors': sum(errors),
+        }
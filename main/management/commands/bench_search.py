@@ -0,0 +1,94 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from main.models import Game, Category, Product
+from main.search import search_products, search_page
+
+BENCH_GAME = 'Search benchmark'
+
+WORDS = [
+    'меч', 'щит', 'танк', 'самолёт', 'броня', 'шлем', 'лук', 'стрела', 'посох', 'кольцо',
+    'амулет', 'зелье', 'свиток', 'дракон', 'легендарный', 'редкий', 'эпический', 'огненный',
+    'ледяной', 'тёмный', 'светлый', 'древний', 'королевский', 'боевой', 'золотой', 'серебряный',
+    'sword', 'shield', 'tank', 'fighter', 'armor', 'helmet', 'bow', 'staff', 'ring', 'dragon',
+]
+
+
+def typo(word):
+    """Слово с одной перестановкой букв — проверка триграммного поиска"""
+    if len(word) < 4:
+        return word
+    i = random.randrange(1, len(word) - 2)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+class Command(BaseCommand):
+    help = "Нагружает поиск товаров: создаёт синтетический каталог и измеряет p50/p99 времени ответа"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help="Сколько синтетических товаров создать перед замером")
+        parser.add_argument('--batch', type=int, default=10000, help="Размер пачки bulk_create при заполнении")
+        parser.add_argument('--queries', type=int, default=200, help="Сколько поисковых запросов выполнить")
+        parser.add_argument('--cleanup', action='store_true', help="Удалить синтетический каталог после замера")
+
+    def seed(self, total, batch):
+        game, _ = Game.objects.get_or_create(name=BENCH_GAME)
+        categories = [
+            Category.objects.get_or_create(name=f'Категория {i}', game=game)[0] for i in range(20)
+        ]
+        created = 0
+        started = time.perf_counter()
+        while created < total:
+            size = min(batch, total - created)
+            Product.objects.bulk_create([
+                Product(
+                    name=' '.join(random.sample(WORDS, 3)),
+                    description=' '.join(random.choices(WORDS, k=20)),
+                    price=random.randint(10, 10000),
+                    category=random.choice(categories),
+                    game=game,
+                )
+                for _ in range(size)
+            ], batch_size=batch)
+            created += size
+            self.stdout.write(f"  создано {created}/{total}")
+        self.stdout.write(f"Заполнение: {time.perf_counter() - started:.1f} с")
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE main_product")
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'], options['batch'])
+
+        timings = []
+        for _ in range(options['queries']):
+            words = random.sample(WORDS, random.choice([1, 2]))
+            if random.random() < 0.3:
+                words[0] = typo(words[0])
+            text = ' '.join(words)
+
+            started = time.perf_counter()
+            search_page(search_products(text), page=random.randint(1, 3), per_page=12)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        self.stdout.write(
+            f"Запросов: {len(timings)}, товаров: {Product.objects.count()}\n"
+            f"p50: {statistics.median(timings):.1f} мс, p99: {p99:.1f} мс, max: {timings[-1]:.1f} мс"
+        )
+
+        if options['cleanup']:
+            # Синтетические товары ни на что не ссылаются — удаляем одним запросом, без каскада в Python
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM main_product WHERE game_id IN (SELECT id FROM main_game WHERE name = %s)",
+                    [BENCH_GAME],
+                )
+            Game.objects.filter(name=BENCH_GAME).delete()
+            self.stdout.write("Синтетический каталог удалён")
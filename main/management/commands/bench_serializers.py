@@ -0,0 +1,58 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import Product
+from api.serializers import ProductSerializer, FlatProductListSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает время сериализации списка товаров: вложенный ProductSerializer "
+        "против облегчённого FlatProductListSerializer (в пересчёте на 1000 товаров)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000, help="Сколько товаров сериализовать за прогон")
+        parser.add_argument('--repeat', type=int, default=5, help="Число прогонов (берётся медиана)")
+        parser.add_argument('--fields', default='', help="Sparse fieldset для облегчённого пути: id,name,price")
+
+    def measure(self, fetch, serialize, repeat):
+        fetch_ms, serialize_ms = [], []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = fetch()
+            fetched = time.perf_counter()
+            serialize(rows)
+            fetch_ms.append((fetched - started) * 1000)
+            serialize_ms.append((time.perf_counter() - fetched) * 1000)
+        return statistics.median(fetch_ms), statistics.median(serialize_ms)
+
+    def handle(self, *args, **options):
+        limit = options['products']
+        available = Product.objects.count()
+        if available < limit:
+            raise CommandError(
+                f"В базе {available} товаров, нужно {limit}. Заполните каталог: manage.py bench_search --seed {limit}"
+            )
+
+        flat = FlatProductListSerializer(FlatProductListSerializer.parse_fields(options['fields']))
+        paths = {
+            'ProductSerializer (вложенный)': (
+                lambda: list(Product.objects.select_related('category__game', 'game').order_by('id')[:limit]),
+                lambda rows: ProductSerializer(rows, many=True).data,
+            ),
+            'FlatProductListSerializer': (
+                lambda: list(Product.objects.order_by('id').values(*flat.columns())[:limit]),
+                flat.to_representation,
+            ),
+        }
+
+        scale = 1000 / limit
+        for name, (fetch, serialize) in paths.items():
+            fetch_ms, serialize_ms = self.measure(fetch, serialize, options['repeat'])
+            self.stdout.write(
+                f"{name}: запрос {fetch_ms * scale:.1f} мс, сериализация {serialize_ms * scale:.1f} мс "
+                f"на 1000 товаров"
+            )
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.recommendations import refresh
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает индекс похожих товаров (ProductNeighbor) по совместным покупкам, вишлистам "
+        "и близости цены в категории. По умолчанию — только товары с новыми заказами и записями вишлистов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help="Пересчитать все товары (учитывает удаления и сдвиг нормировки)")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        run = refresh(full=options['full'], progress=lambda percent, message: self.stdout.write(f"  {message}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"{run.get_mode_display()}: товаров {run.products_updated}, соседей {run.neighbors_written}, "
+            f"{time.monotonic() - started:.1f} с"
+        ))
@@ -0,0 +1,52 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from main.images import IMAGE_FIELDS, generate_in_process, stale_ids
+from main.jobs import init_worker_process
+
+
+class Command(BaseCommand):
+    help = (
+        "Создаёт уменьшенные копии изображений товаров и логотипов игр, которых ещё нет. "
+        "В обычной работе копии готовятся в фоне при загрузке и первом показе — команда для заполнения"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(IMAGE_FIELDS), action='append',
+                            help="Только товары или только игры (по умолчанию — все)")
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                            help="Размер пула процессов (декодирование и сжатие упираются в CPU)")
+        parser.add_argument('--force', action='store_true', help="Пересоздать и уже готовые копии")
+
+    def handle(self, *args, **options):
+        for model in options['model'] or sorted(IMAGE_FIELDS):
+            ids = list(stale_ids(model, force=options['force']))
+            if not ids:
+                self.stdout.write(f"{model}: всё готово")
+                continue
+            self.stdout.write(f"{model}: {len(ids)} изображений")
+            created, failed = self.run_pool(model, ids, options)
+            self.stdout.write(self.style.SUCCESS(f"{model}: создано копий {created}, ошибок {failed}"))
+
+    def run_pool(self, model, ids, options):
+        # spawn: дочерние процессы не наследуют открытые соединения с БД родителя
+        connections.close_all()
+        created = failed = 0
+        pool = ProcessPoolExecutor(
+            max_workers=max(1, options['processes']),
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker_process,
+        )
+        with pool:
+            tasks = ((model, pk, options['force']) for pk in ids)
+            for done, (pk, count, error) in enumerate(pool.map(generate_in_process, tasks, chunksize=16), 1):
+                created += count
+                if error:
+                    failed += 1
+                    self.stderr.write(f"{model} #{pk}: {error}")
+                if done % 500 == 0:
+                    self.stdout.write(f"  {done}/{len(ids)}")
+        return created, failed
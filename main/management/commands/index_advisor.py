@@ -0,0 +1,94 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from main.models import Category, Product, Basket, Order, OrderItem, Review, Wishlist
+from main.queries import discounted_products_per_game
+
+
+def hot_queries(game_id, user_id, product_id, category_ids):
+    """Именованные «горячие» запросы сайта с подставленными примерами параметров"""
+    return {
+        'index_discounts': discounted_products_per_game(),
+        'catalog_filter': Product.objects.filter(
+            game_id=game_id, category_id__in=category_ids, price__gte=0, price__lte=1000
+        ).order_by('price'),
+        'catalog_discounted': Product.objects.filter(game_id=game_id, discount__isnull=False),
+        'basket_items': Basket.objects.filter(user_id=user_id),
+        'basket_lookup': Basket.objects.filter(user_id=user_id, product_id=product_id),
+        'user_orders': Order.objects.filter(user_id=user_id).order_by('-created_at'),
+        'product_reviews': Review.objects.filter(product_id=product_id).order_by('created_at'),
+        'review_purchase_check': OrderItem.objects.filter(product_id=product_id, order__user_id=user_id),
+        'wishlist_items': Wishlist.objects.filter(user_id=user_id),
+    }
+
+
+def iter_plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from iter_plan_nodes(child)
+
+
+class Command(BaseCommand):
+    help = "Запускает EXPLAIN для «горячих» запросов и сообщает о последовательных сканах больших таблиц"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-rows', type=int, default=10000,
+            help="Сообщать о Seq Scan только по таблицам не меньше этого размера (по pg_class.reltuples)",
+        )
+        parser.add_argument('--analyze', action='store_true', help="EXPLAIN ANALYZE (запросы будут выполнены)")
+        parser.add_argument('--query', action='append', help="Проверить только указанные запросы")
+        parser.add_argument('--game', type=int, help="id игры для примеров")
+        parser.add_argument('--user', type=int, help="id пользователя для примеров")
+        parser.add_argument('--product', type=int, help="id товара для примеров")
+
+    def table_sizes(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname, c.reltuples::BIGINT FROM pg_class c "
+                "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE c.relkind = 'r' AND n.nspname = current_schema()"
+            )
+            return dict(cursor.fetchall())
+
+    def handle(self, *args, **options):
+        sample = Product.objects.values('id', 'game_id').first() or {'id': 0, 'game_id': 0}
+        user_id = options['user'] or (Order.objects.values_list('user_id', flat=True).first() or 0)
+        game_id = options['game'] or sample['game_id']
+        # Фильтр каталога — по настоящим категориям выбранной игры, иначе план не похож на боевой
+        category_ids = list(Category.objects.filter(game_id=game_id).order_by('id').values_list('id', flat=True)[:2])
+        queries = hot_queries(game_id, user_id, options['product'] or sample['id'], category_ids or [0])
+
+        if options['query']:
+            unknown = set(options['query']) - set(queries)
+            if unknown:
+                raise CommandError(f"Неизвестные запросы: {', '.join(sorted(unknown))}. Доступны: {', '.join(queries)}")
+            queries = {name: queries[name] for name in options['query']}
+
+        sizes = self.table_sizes()
+        problems = 0
+
+        for name, queryset in queries.items():
+            plan = json.loads(queryset.explain(format='json', analyze=options['analyze']))[0]['Plan']
+            scans = [
+                node for node in iter_plan_nodes(plan)
+                if node['Node Type'] == 'Seq Scan'
+                and sizes.get(node['Relation Name'], 0) >= options['min_rows']
+            ]
+            if not scans:
+                self.stdout.write(f"  OK  {name} (cost {plan['Total Cost']})")
+                continue
+
+            problems += 1
+            for node in scans:
+                self.stdout.write(self.style.WARNING(
+                    f"SEQ  {name}: {node['Relation Name']} "
+                    f"(~{sizes[node['Relation Name']]} строк, фильтр: {node.get('Filter', '—')})"
+                ))
+
+        if problems:
+            self.stdout.write(self.style.WARNING(f"Запросов с последовательным сканом: {problems}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Последовательных сканов больших таблиц не найдено"))
@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+# Фактические значения, посчитанные по main_basket / main_wishlist
+ACTUAL_SQL = """
+    SELECT
+        COALESCE(b.user_id, w.user_id) AS user_id,
+        COALESCE(b.basket_count, 0) AS basket_count,
+        COALESCE(w.wishlist_count, 0) AS wishlist_count,
+        COALESCE(b.basket_total, 0) AS basket_total
+    FROM (
+        SELECT b.user_id, SUM(b.quantity) AS basket_count, SUM(b.quantity * p.price) AS basket_total
+        FROM main_basket b
+        JOIN main_product p ON p.id = b.product_id
+        GROUP BY b.user_id
+    ) b
+    FULL JOIN (
+        SELECT user_id, COUNT(*) AS wishlist_count
+        FROM main_wishlist
+        GROUP BY user_id
+    ) w ON w.user_id = b.user_id
+"""
+
+DRIFT_SQL = f"""
+    WITH actual AS ({ACTUAL_SQL})
+    SELECT
+        COALESCE(a.user_id, s.user_id),
+        s.basket_count, a.basket_count,
+        s.wishlist_count, a.wishlist_count,
+        s.basket_total, a.basket_total
+    FROM actual a
+    FULL JOIN main_usercartsummary s ON s.user_id = a.user_id
+    WHERE COALESCE(s.basket_count, 0) <> COALESCE(a.basket_count, 0)
+       OR COALESCE(s.wishlist_count, 0) <> COALESCE(a.wishlist_count, 0)
+       OR COALESCE(s.basket_total, 0) <> COALESCE(a.basket_total, 0)
+    ORDER BY 1
+"""
+
+
+class Command(BaseCommand):
+    help = "Проверяет и перестраивает сводку корзин/вишлистов (main_usercartsummary)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Только проверить расхождения, ничего не меняя (код выхода 1 при расхождении)",
+        )
+        parser.add_argument(
+            '--limit', type=int, default=20,
+            help="Сколько расхождений выводить",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                if not options['check']:
+                    # Блокируем запись в корзины и вишлисты на время пересборки
+                    cursor.execute(
+                        "LOCK TABLE main_basket, main_wishlist IN SHARE ROW EXCLUSIVE MODE"
+                    )
+                cursor.execute(DRIFT_SQL)
+                drift = cursor.fetchall()
+
+                for row in drift[:options['limit']]:
+                    user_id, s_basket, a_basket, s_wish, a_wish, s_total, a_total = row
+                    self.stdout.write(
+                        f"user {user_id}: корзина {s_basket} → {a_basket}, "
+                        f"вишлист {s_wish} → {a_wish}, сумма {s_total} → {a_total}"
+                    )
+
+                if options['check']:
+                    if drift:
+                        raise CommandError(f"Найдено расхождений: {len(drift)}")
+                    self.stdout.write(self.style.SUCCESS("Сводка совпадает с данными"))
+                    return
+
+                cursor.execute("DELETE FROM main_usercartsummary")
+                cursor.execute(
+                    "INSERT INTO main_usercartsummary (user_id, basket_count, wishlist_count, basket_total) "
+                    f"SELECT user_id, basket_count, wishlist_count, basket_total FROM ({ACTUAL_SQL}) actual"
+                )
+                rebuilt = cursor.rowcount
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Сводка перестроена: {rebuilt} пользователей, исправлено расхождений: {len(drift)}"
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from main.cache import fragment_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Полный пересчёт рейтингов товаров по main_review. "
+        "В обычной работе рейтинги ведёт триггер trg_review_rating — команда нужна для восстановления"
+    )
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            cursor.execute("CALL recalculate_product_ratings()")
+            cursor.execute("""
+                SELECT COUNT(*)
+                FROM main_product p
+                LEFT JOIN (
+                    SELECT product_id, SUM(rating) AS rating_sum, COUNT(*) AS rating_count
+                    FROM main_review
+                    GROUP BY product_id
+                ) r ON r.product_id = p.id
+                WHERE p.rating_sum <> COALESCE(r.rating_sum, 0)
+                   OR p.rating_count <> COALESCE(r.rating_count, 0)
+            """)
+            mismatched = cursor.fetchone()[0]
+
+        # Процедура меняет рейтинги в обход сигналов — сбрасываем кэш фрагментов целиком
+        fragment_cache().clear()
+
+        if mismatched:
+            self.stderr.write(f"После пересчёта остались расхождения: {mismatched}")
+        else:
+            self.stdout.write(self.style.SUCCESS("Рейтинги товаров пересчитаны"))
@@ -0,0 +1,58 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections
+
+from main.analytics import VIEWS, due_views, refresh_view
+
+
+class Command(BaseCommand):
+    help = (
+        "Обновляет материализованные представления аналитики (REFRESH MATERIALIZED VIEW CONCURRENTLY). "
+        "С --loop работает постоянно и обновляет каждое по расписанию ANALYTICS_REFRESH_INTERVALS"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', action='append', choices=sorted(VIEWS),
+                            help="Только указанные представления (по умолчанию — все)")
+        parser.add_argument('--loop', action='store_true', help="Не выходить: обновлять по расписанию")
+        parser.add_argument('--poll', type=float, default=10.0, help="Как часто проверять расписание в --loop, с")
+        parser.add_argument('--no-concurrently', action='store_true',
+                            help="Обычный REFRESH — для ещё не заполненных представлений (блокирует чтение)")
+
+    def handle(self, *args, **options):
+        views = options['view'] or list(VIEWS)
+        concurrently = not options['no_concurrently']
+        if not options['loop']:
+            for name in views:
+                self.refresh(name, concurrently, strict=True)
+            return
+
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.stdout.write(f"Обновление по расписанию: {', '.join(views)}")
+        while not self.stopping:
+            close_old_connections()
+            for name in due_views():
+                if name in views and not self.stopping:
+                    self.refresh(name, concurrently, strict=False)
+            time.sleep(options['poll'])
+
+    def stop(self, signum, frame):
+        # Начатое обновление доработает, новых не начинаем
+        self.stopping = True
+
+    def refresh(self, name, concurrently, strict):
+        try:
+            refresh = refresh_view(name, concurrently=concurrently)
+        except DatabaseError as e:
+            if strict:
+                raise CommandError(f"{name}: {e}")
+            # В цикле ошибка одного обновления не останавливает расписание — повтор при следующей проверке
+            self.stderr.write(f"{name}: {e}")
+            return
+        self.stdout.write(
+            f"{name}: {refresh.row_count} строк за {refresh.duration.total_seconds():.2f} с"
+        )
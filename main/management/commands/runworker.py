@@ -0,0 +1,183 @@
+import multiprocessing
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, connections
+from django.utils import timezone
+
+from main.jobs import (
+    claim_next, fail_job, init_worker_process, requeue_job, run_job, run_job_in_process, worker_name,
+)
+from main.models import Job
+
+
+class Heartbeat(threading.Thread):
+    """
+    Раз в interval секунд отмечает heartbeat_at у задач этого обработчика — и тех, что
+    долго не сообщают о прогрессе (большая таблица в pg_restore). Задачи, у которых
+    отметки нет дольше --stale-after, принадлежали упавшему обработчику.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name='job-heartbeat', daemon=True)
+        self.interval = interval
+        self.jobs = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def add(self, job_id):
+        with self.lock:
+            self.jobs.add(job_id)
+
+    def discard(self, job_id):
+        with self.lock:
+            self.jobs.discard(job_id)
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                with self.lock:
+                    job_ids = list(self.jobs)
+                if not job_ids:
+                    continue
+                try:
+                    Job.objects.filter(id__in=job_ids, status=Job.STATUS_RUNNING).update(heartbeat_at=timezone.now())
+                except DatabaseError:
+                    # БД недоступна — отметим в следующий раз
+                    connection.close()
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class Command(BaseCommand):
+    help = "Обработчик фоновых задач из таблицы main_job (бэкапы, восстановление, очистка)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help="Размер пула процессов")
+        parser.add_argument('--poll', type=float, default=2.0, help="Пауза между опросами пустой очереди, с")
+        parser.add_argument('--once', action='store_true', help="Выполнить всё, что есть в очереди, и выйти")
+        parser.add_argument('--sync', action='store_true', help="Без пула: задачи по одной в текущем процессе")
+        parser.add_argument(
+            '--heartbeat', type=float, default=30.0,
+            help="Как часто обработчик отмечает свои running-задачи живыми, с",
+        )
+        parser.add_argument(
+            '--stale-after', type=int, default=300,
+            help="Через сколько секунд без отметки running-задача считается зависшей (обработчик упал)",
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.worker = worker_name()
+        self.heartbeat = Heartbeat(options['heartbeat'])
+        self.heartbeat.start()
+        self.stdout.write(f"Обработчик {self.worker} запущен")
+
+        try:
+            if options['sync']:
+                self.run_sync(options)
+            else:
+                self.run_pool(options)
+        finally:
+            self.heartbeat.stop()
+
+    def stop(self, signum, frame):
+        # Текущие задачи доработают, новые не берём
+        self.stopping = True
+
+    def fail_stale(self, seconds):
+        """Проверяется на каждом опросе: задачи упавшего обработчика не висят до следующего рестарта"""
+        threshold = timezone.now() - timedelta(seconds=seconds)
+        stale = Job.objects.filter(status=Job.STATUS_RUNNING, heartbeat_at__lt=threshold)
+        for job_id in stale.values_list('id', flat=True):
+            fail_job(job_id, "Нет отметки обработчика — он, вероятно, был остановлен")
+            self.stderr.write(f"Задача #{job_id} помечена как зависшая")
+
+    def run_sync(self, options):
+        while not self.stopping:
+            self.fail_stale(options['stale_after'])
+            job_id = claim_next(self.worker)
+            if job_id is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll'])
+                continue
+            self.heartbeat.add(job_id)
+            try:
+                ok = run_job(job_id)
+            finally:
+                self.heartbeat.discard(job_id)
+            self.stdout.write(f"Задача #{job_id}: {'готово' if ok else 'ошибка'}")
+
+    def run_pool(self, options):
+        # Упавший дочерний процесс (например, OOM killer) ломает весь пул — создаём новый
+        while not self.run_until_broken(options):
+            self.stderr.write("Пул процессов сломан, создаём новый")
+
+    def run_until_broken(self, options):
+        """False — пул сломан и задачи в нём провалены; True — обработчик остановлен или очередь разобрана"""
+        # spawn: дочерние процессы не наследуют открытые соединения с БД родителя
+        connections.close_all()
+        running = {}
+        pool = ProcessPoolExecutor(
+            max_workers=options['processes'],
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker_process,
+        )
+        with pool:
+            while True:
+                self.fail_stale(options['stale_after'])
+                while not self.stopping and len(running) < options['processes']:
+                    job_id = claim_next(self.worker)
+                    if job_id is None:
+                        break
+                    try:
+                        future = pool.submit(run_job_in_process, job_id)
+                    except BrokenProcessPool:
+                        requeue_job(job_id)
+                        self.fail_running(running, "Процесс обработчика завершился аварийно")
+                        return False
+                    running[future] = job_id
+                    self.heartbeat.add(job_id)
+
+                if not running:
+                    if self.stopping or options['once']:
+                        return True
+                    time.sleep(options['poll'])
+                    continue
+
+                done, _ = wait(running, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    job_id = running.pop(future)
+                    self.heartbeat.discard(job_id)
+                    try:
+                        ok = future.result()
+                    except Exception as e:
+                        # Дочерний процесс упал, не успев записать итог
+                        fail_job(job_id, f"Процесс обработчика завершился аварийно: {e}")
+                        broken = broken or isinstance(e, BrokenProcessPool)
+                        ok = False
+                    self.stdout.write(f"Задача #{job_id}: {'готово' if ok else 'ошибка'}")
+                if broken:
+                    # Остальные процессы сломанного пула остановлены — их задачи не завершатся
+                    self.fail_running(running, "Пул процессов обработчика сломан")
+                    return False
+
+    def fail_running(self, running, message):
+        for job_id in running.values():
+            self.heartbeat.discard(job_id)
+            fail_job(job_id, message)
+            self.stdout.write(f"Задача #{job_id}: ошибка")
+        running.clear()
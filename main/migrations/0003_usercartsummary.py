@@ -0,0 +1,221 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_alter_order_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCartSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('basket_count', models.IntegerField(default=0)),
+                ('wishlist_count', models.IntegerField(default=0)),
+                ('basket_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+
+        # 🔹 ТРИГГЕРЫ: поддержка сводки при изменении корзины, вишлиста и цен
+        migrations.RunSQL(
+            sql="""
+                -- Применить приращения к сводке пользователя.
+                -- Строку создаём только при добавлении, чтобы каскадное удаление
+                -- пользователя не «воскрешало» уже удалённую сводку.
+                CREATE OR REPLACE FUNCTION cart_summary_apply(
+                    p_user_id INT, p_basket INT, p_wishlist INT, p_total NUMERIC, p_create BOOLEAN
+                )
+                RETURNS VOID AS $$
+                BEGIN
+                    UPDATE main_usercartsummary
+                    SET basket_count = basket_count + p_basket,
+                        wishlist_count = wishlist_count + p_wishlist,
+                        basket_total = basket_total + p_total
+                    WHERE user_id = p_user_id;
+
+                    IF NOT FOUND AND p_create THEN
+                        INSERT INTO main_usercartsummary (user_id, basket_count, wishlist_count, basket_total)
+                        VALUES (p_user_id, p_basket, p_wishlist, p_total)
+                        ON CONFLICT (user_id) DO UPDATE SET
+                            basket_count = main_usercartsummary.basket_count + EXCLUDED.basket_count,
+                            wishlist_count = main_usercartsummary.wishlist_count + EXCLUDED.wishlist_count,
+                            basket_total = main_usercartsummary.basket_total + EXCLUDED.basket_total;
+                    END IF;
+                END;
+                $$ LANGUAGE plpgsql;
+
+                -- 1. Корзина
+                CREATE OR REPLACE FUNCTION basket_summary_trigger()
+                RETURNS TRIGGER AS $$
+                BEGIN
+                    IF TG_OP = 'UPDATE'
+                       AND NEW.quantity = OLD.quantity
+                       AND NEW.user_id = OLD.user_id
+                       AND NEW.product_id = OLD.product_id THEN
+                        RETURN NULL;
+                    END IF;
+
+                    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                        PERFORM cart_summary_apply(
+                            OLD.user_id, -OLD.quantity, 0,
+                            -OLD.quantity * COALESCE((SELECT price FROM main_product WHERE id = OLD.product_id), 0),
+                            FALSE
+                        );
+                    END IF;
+
+                    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                        PERFORM cart_summary_apply(
+                            NEW.user_id, NEW.quantity, 0,
+                            NEW.quantity * COALESCE((SELECT price FROM main_product WHERE id = NEW.product_id), 0),
+                            TRUE
+                        );
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE TRIGGER trg_basket_summary
+                AFTER INSERT OR UPDATE OR DELETE ON main_basket
+                FOR EACH ROW
+                EXECUTE FUNCTION basket_summary_trigger();
+
+                -- 2. Список желаний
+                CREATE OR REPLACE FUNCTION wishlist_summary_trigger()
+                RETURNS TRIGGER AS $$
+                BEGIN
+                    IF TG_OP = 'UPDATE' AND NEW.user_id = OLD.user_id THEN
+                        RETURN NULL;
+                    END IF;
+
+                    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                        PERFORM cart_summary_apply(OLD.user_id, 0, -1, 0, FALSE);
+                    END IF;
+
+                    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                        PERFORM cart_summary_apply(NEW.user_id, 0, 1, 0, TRUE);
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE TRIGGER trg_wishlist_summary
+                AFTER INSERT OR UPDATE OR DELETE ON main_wishlist
+                FOR EACH ROW
+                EXECUTE FUNCTION wishlist_summary_trigger();
+
+                -- 3. Изменение цены товара пересчитывает суммы корзин, где он лежит
+                CREATE OR REPLACE FUNCTION product_price_summary_trigger()
+                RETURNS TRIGGER AS $$
+                BEGIN
+                    UPDATE main_usercartsummary s
+                    SET basket_total = s.basket_total + d.delta
+                    FROM (
+                        SELECT user_id, SUM(quantity) * (NEW.price - OLD.price) AS delta
+                        FROM main_basket
+                        WHERE product_id = NEW.id
+                        GROUP BY user_id
+                    ) d
+                    WHERE s.user_id = d.user_id;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE TRIGGER trg_product_price_summary
+                AFTER UPDATE OF price ON main_product
+                FOR EACH ROW
+                WHEN (OLD.price IS DISTINCT FROM NEW.price)
+                EXECUTE FUNCTION product_price_summary_trigger();
+                """,
+            reverse_sql="""
+                DROP TRIGGER IF EXISTS trg_basket_summary ON main_basket;
+                DROP TRIGGER IF EXISTS trg_wishlist_summary ON main_wishlist;
+                DROP TRIGGER IF EXISTS trg_product_price_summary ON main_product;
+                DROP FUNCTION IF EXISTS basket_summary_trigger();
+                DROP FUNCTION IF EXISTS wishlist_summary_trigger();
+                DROP FUNCTION IF EXISTS product_price_summary_trigger();
+                DROP FUNCTION IF EXISTS cart_summary_apply(INT, INT, INT, NUMERIC, BOOLEAN);
+                """
+        ),
+
+        # 🔹 Начальное заполнение сводки
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO main_usercartsummary (user_id, basket_count, wishlist_count, basket_total)
+                SELECT
+                    COALESCE(b.user_id, w.user_id),
+                    COALESCE(b.basket_count, 0),
+                    COALESCE(w.wishlist_count, 0),
+                    COALESCE(b.basket_total, 0)
+                FROM (
+                    SELECT b.user_id, SUM(b.quantity) AS basket_count, SUM(b.quantity * p.price) AS basket_total
+                    FROM main_basket b
+                    JOIN main_product p ON p.id = b.product_id
+                    GROUP BY b.user_id
+                ) b
+                FULL JOIN (
+                    SELECT user_id, COUNT(*) AS wishlist_count
+                    FROM main_wishlist
+                    GROUP BY user_id
+                ) w ON w.user_id = b.user_id;
+                """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+
+        # 🔹 ФУНКЦИИ: чтение одной строки сводки вместо агрегатов
+        migrations.RunSQL(
+            sql="""
+                CREATE OR REPLACE FUNCTION get_basket_count(p_user_id INT)
+                RETURNS INT AS $$
+                BEGIN
+                    RETURN COALESCE((SELECT basket_count FROM main_usercartsummary WHERE user_id = p_user_id), 0);
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE OR REPLACE FUNCTION get_wishlist_count(p_user_id INT)
+                RETURNS INT AS $$
+                BEGIN
+                    RETURN COALESCE((SELECT wishlist_count FROM main_usercartsummary WHERE user_id = p_user_id), 0);
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE OR REPLACE FUNCTION get_basket_total(p_user_id INT)
+                RETURNS NUMERIC(10,2) AS $$
+                BEGIN
+                    RETURN COALESCE((SELECT basket_total FROM main_usercartsummary WHERE user_id = p_user_id), 0.00);
+                END;
+                $$ LANGUAGE plpgsql;
+                """,
+            reverse_sql="""
+                CREATE OR REPLACE FUNCTION get_basket_count(p_user_id INT)
+                RETURNS INT AS $$
+                BEGIN
+                    RETURN COALESCE((SELECT SUM(quantity) FROM main_basket WHERE user_id = p_user_id), 0);
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE OR REPLACE FUNCTION get_wishlist_count(p_user_id INT)
+                RETURNS INT AS $$
+                BEGIN
+                    RETURN COALESCE((SELECT COUNT(*) FROM main_wishlist WHERE user_id = p_user_id), 0);
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE OR REPLACE FUNCTION get_basket_total(p_user_id INT)
+                RETURNS NUMERIC(10,2) AS $$
+                BEGIN
+                    RETURN COALESCE((
+                        SELECT SUM(b.quantity * p.price)
+                        FROM main_basket b
+                        JOIN main_product p ON b.product_id = p.id
+                        WHERE b.user_id = p_user_id
+                    ), 0.00);
+                END;
+                $$ LANGUAGE plpgsql;
+                """
+        ),
+    ]
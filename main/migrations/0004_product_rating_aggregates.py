@@ -0,0 +1,123 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_usercartsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+
+        # 🔹 ПРОЦЕДУРА: полный пересчёт (офлайн-восстановление) теперь заполняет и агрегаты
+        migrations.RunSQL(
+            sql="""
+                CREATE OR REPLACE PROCEDURE recalculate_product_ratings()
+                LANGUAGE plpgsql
+                AS $$
+                BEGIN
+                    UPDATE main_product p
+                    SET rating_sum = agg.rating_sum,
+                        rating_count = agg.rating_count,
+                        average_rating = agg.average_rating
+                    FROM (
+                        SELECT
+                            p2.id,
+                            COALESCE(r.rating_sum, 0) AS rating_sum,
+                            COALESCE(r.rating_count, 0) AS rating_count,
+                            COALESCE(ROUND(r.rating_sum::NUMERIC / r.rating_count, 2), 0.00) AS average_rating
+                        FROM main_product p2
+                        LEFT JOIN (
+                            SELECT product_id, SUM(rating) AS rating_sum, COUNT(*) AS rating_count
+                            FROM main_review
+                            GROUP BY product_id
+                        ) r ON r.product_id = p2.id
+                    ) agg
+                    WHERE p.id = agg.id
+                      AND (p.rating_sum, p.rating_count, p.average_rating) IS DISTINCT FROM
+                          (agg.rating_sum, agg.rating_count, agg.average_rating);
+
+                    RAISE NOTICE 'Средние рейтинги для всех товаров успешно пересчитаны.';
+                END;
+                $$;
+
+                CALL recalculate_product_ratings();
+                """,
+            reverse_sql="""
+                CREATE OR REPLACE PROCEDURE recalculate_product_ratings()
+                LANGUAGE plpgsql
+                AS $$
+                BEGIN
+                    UPDATE main_product
+                    SET average_rating = COALESCE((
+                        SELECT ROUND(AVG(rating), 2)
+                        FROM main_review
+                        WHERE main_review.product_id = main_product.id
+                    ), 0.00);
+
+                    RAISE NOTICE 'Средние рейтинги для всех товаров успешно пересчитаны.';
+                END;
+                $$;
+                """
+        ),
+
+        # 🔹 ТРИГГЕР: инкрементальное обновление рейтинга одного товара
+        migrations.RunSQL(
+            sql="""
+                CREATE OR REPLACE FUNCTION product_rating_apply(p_product_id BIGINT, p_sum INT, p_count INT)
+                RETURNS VOID AS $$
+                BEGIN
+                    UPDATE main_product
+                    SET rating_sum = rating_sum + p_sum,
+                        rating_count = rating_count + p_count,
+                        average_rating = CASE
+                            WHEN rating_count + p_count > 0
+                            THEN ROUND((rating_sum + p_sum)::NUMERIC / (rating_count + p_count), 2)
+                            ELSE 0.00
+                        END
+                    WHERE id = p_product_id;
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE OR REPLACE FUNCTION review_rating_trigger()
+                RETURNS TRIGGER AS $$
+                BEGIN
+                    IF TG_OP = 'UPDATE'
+                       AND NEW.rating = OLD.rating
+                       AND NEW.product_id = OLD.product_id THEN
+                        RETURN NULL;
+                    END IF;
+
+                    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                        PERFORM product_rating_apply(OLD.product_id, -OLD.rating, -1);
+                    END IF;
+
+                    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                        PERFORM product_rating_apply(NEW.product_id, NEW.rating, 1);
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE TRIGGER trg_review_rating
+                AFTER INSERT OR UPDATE OR DELETE ON main_review
+                FOR EACH ROW
+                EXECUTE FUNCTION review_rating_trigger();
+                """,
+            reverse_sql="""
+                DROP TRIGGER IF EXISTS trg_review_rating ON main_review;
+                DROP FUNCTION IF EXISTS review_rating_trigger();
+                DROP FUNCTION IF EXISTS product_rating_apply(BIGINT, INT, INT);
+                """
+        ),
+    ]
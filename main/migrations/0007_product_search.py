@@ -0,0 +1,59 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('main', '0006_product_keyset_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+
+        # 🔹 ТРИГГЕР: поддержка search_vector при изменении названия/описания
+        migrations.RunSQL(
+            sql="""
+                CREATE OR REPLACE FUNCTION product_search_vector_update()
+                RETURNS TRIGGER AS $$
+                BEGIN
+                    NEW.search_vector :=
+                        setweight(to_tsvector('russian', COALESCE(NEW.name, '')), 'A') ||
+                        setweight(to_tsvector('russian', COALESCE(NEW.description, '')), 'B');
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE TRIGGER trg_product_search_vector
+                BEFORE INSERT OR UPDATE OF name, description ON main_product
+                FOR EACH ROW
+                EXECUTE FUNCTION product_search_vector_update();
+
+                UPDATE main_product
+                SET search_vector =
+                    setweight(to_tsvector('russian', COALESCE(name, '')), 'A') ||
+                    setweight(to_tsvector('russian', COALESCE(description, '')), 'B');
+                """,
+            reverse_sql="""
+                DROP TRIGGER IF EXISTS trg_product_search_vector ON main_product;
+                DROP FUNCTION IF EXISTS product_search_vector_update();
+                """
+        ),
+
+        AddIndexConcurrently(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='product_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,73 @@
+import django.utils.timezone
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('main', '0007_product_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+
+        # 🔹 ТРИГГЕР: updated_at для изменений в обход ORM (процедуры скидок, рейтинги, bulk update)
+        migrations.RunSQL(
+            sql="""
+                CREATE OR REPLACE FUNCTION touch_updated_at()
+                RETURNS TRIGGER AS $$
+                BEGIN
+                    -- clock_timestamp(), а не NOW(): время начала транзакции могло
+                    -- оказаться раньше уже записанных значений
+                    NEW.updated_at := clock_timestamp();
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE TRIGGER trg_game_touch
+                BEFORE UPDATE ON main_game
+                FOR EACH ROW
+                EXECUTE FUNCTION touch_updated_at();
+
+                CREATE TRIGGER trg_category_touch
+                BEFORE UPDATE ON main_category
+                FOR EACH ROW
+                EXECUTE FUNCTION touch_updated_at();
+
+                CREATE TRIGGER trg_product_touch
+                BEFORE UPDATE ON main_product
+                FOR EACH ROW
+                EXECUTE FUNCTION touch_updated_at();
+                """,
+            reverse_sql="""
+                DROP TRIGGER IF EXISTS trg_product_touch ON main_product;
+                DROP TRIGGER IF EXISTS trg_category_touch ON main_category;
+                DROP TRIGGER IF EXISTS trg_game_touch ON main_game;
+                DROP FUNCTION IF EXISTS touch_updated_at();
+                """
+        ),
+
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(fields=['game', 'updated_at'], name='product_game_updated_idx'),
+        ),
+    ]
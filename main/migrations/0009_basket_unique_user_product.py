@@ -0,0 +1,43 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_updated_at'),
+    ]
+
+    operations = [
+        # 🔹 ДУБЛИКАТЫ: сливаем повторные строки корзины в самую раннюю, количества складываем
+        migrations.RunSQL(
+            sql="""
+                WITH ranked AS (
+                    SELECT id,
+                           FIRST_VALUE(id) OVER w AS keep_id,
+                           SUM(quantity) OVER (PARTITION BY user_id, product_id) AS total_quantity
+                    FROM main_basket
+                    WINDOW w AS (PARTITION BY user_id, product_id ORDER BY id)
+                ),
+                merged AS (
+                    UPDATE main_basket b
+                    SET quantity = r.total_quantity
+                    FROM ranked r
+                    WHERE b.id = r.id AND r.id = r.keep_id AND b.quantity <> r.total_quantity
+                )
+                DELETE FROM main_basket b
+                USING ranked r
+                WHERE b.id = r.id AND r.id <> r.keep_id;
+                """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+
+        migrations.RemoveIndex(
+            model_name='basket',
+            name='basket_user_product_idx',
+        ),
+        # Уникальный индекс заменяет обычный (user, product)
+        migrations.AddConstraint(
+            model_name='basket',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='basket_user_product_uniq'),
+        ),
+    ]
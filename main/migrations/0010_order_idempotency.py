@@ -0,0 +1,141 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_basket_unique_user_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('user', 'idempotency_key'), name='order_user_idempotency_uniq'),
+        ),
+
+        # 🔹 ПРОЦЕДУРА: оформление заказа одним проходом по корзине
+        migrations.RunSQL(
+            sql="""
+                DROP PROCEDURE IF EXISTS create_order_from_basket(INT);
+
+                CREATE OR REPLACE PROCEDURE create_order_from_basket(
+                    IN p_user_id INT,
+                    IN p_idempotency_key VARCHAR(64) DEFAULT NULL,
+                    INOUT p_order_id INT DEFAULT NULL
+                )
+                LANGUAGE plpgsql
+                AS $$
+                DECLARE
+                    v_total DECIMAL(10,2);
+                BEGIN
+                    -- Повторная отправка той же формы — возвращаем уже созданный заказ
+                    IF p_idempotency_key IS NOT NULL THEN
+                        SELECT id INTO p_order_id
+                        FROM main_order
+                        WHERE user_id = p_user_id AND idempotency_key = p_idempotency_key;
+                        IF FOUND THEN
+                            RETURN;
+                        END IF;
+                    END IF;
+
+                    -- Один проход по корзине: строки корзины блокируются (FOR UPDATE),
+                    -- цены товаров — от изменения до конца транзакции (FOR SHARE),
+                    -- поэтому позиции и сумма заказа видят одни и те же цены.
+                    WITH locked AS (
+                        SELECT b.product_id, b.quantity, p.price
+                        FROM main_basket b
+                        JOIN main_product p ON p.id = b.product_id
+                        WHERE b.user_id = p_user_id
+                        ORDER BY b.product_id
+                        FOR UPDATE OF b
+                        FOR SHARE OF p
+                    ),
+                    new_order AS (
+                        INSERT INTO main_order (user_id, total_price, status, created_at, idempotency_key)
+                        SELECT p_user_id, 0, 'на рассмотрении', NOW(), p_idempotency_key
+                        WHERE EXISTS (SELECT 1 FROM locked)
+                        ON CONFLICT (user_id, idempotency_key) DO NOTHING
+                        RETURNING id
+                    ),
+                    items AS (
+                        INSERT INTO main_orderitem (order_id, product_id, quantity, price)
+                        SELECT o.id, l.product_id, l.quantity, l.price
+                        FROM locked l
+                        CROSS JOIN new_order o
+                        RETURNING product_id, quantity, price
+                    ),
+                    cleared AS (
+                        DELETE FROM main_basket b
+                        USING items i
+                        WHERE b.user_id = p_user_id AND b.product_id = i.product_id
+                    )
+                    SELECT o.id, (SELECT SUM(i.quantity * i.price) FROM items i)
+                    INTO p_order_id, v_total
+                    FROM new_order o;
+
+                    IF p_order_id IS NULL THEN
+                        -- Параллельный запрос с тем же ключом успел первым и забрал корзину
+                        IF p_idempotency_key IS NOT NULL THEN
+                            SELECT id INTO p_order_id
+                            FROM main_order
+                            WHERE user_id = p_user_id AND idempotency_key = p_idempotency_key;
+                            IF FOUND THEN
+                                RETURN;
+                            END IF;
+                        END IF;
+                        RAISE EXCEPTION 'Корзина пуста' USING ERRCODE = 'no_data_found';
+                    END IF;
+
+                    -- Сумма — из фактически вставленных позиций
+                    UPDATE main_order SET total_price = v_total WHERE id = p_order_id;
+                END;
+                $$;
+                """,
+            reverse_sql="""
+                DROP PROCEDURE IF EXISTS create_order_from_basket(INT, VARCHAR, INT);
+
+                CREATE OR REPLACE PROCEDURE create_order_from_basket(IN p_user_id INT)
+                LANGUAGE plpgsql
+                AS $$
+                DECLARE
+                    v_count INT;
+                    v_total DECIMAL(10,2) := 0;
+                    v_new_order_id INT;
+                BEGIN
+                    SELECT COUNT(*) INTO v_count
+                    FROM main_basket
+                    WHERE user_id = p_user_id;
+
+                    IF v_count = 0 THEN
+                        RAISE EXCEPTION 'Корзина пуста';
+                    END IF;
+
+                    SELECT COALESCE(SUM(b.quantity * p.price), 0)
+                    INTO v_total
+                    FROM main_basket b
+                    JOIN main_product p ON b.product_id = p.id
+                    WHERE b.user_id = p_user_id;
+
+                    INSERT INTO main_order (user_id, total_price, status, created_at)
+                    VALUES (p_user_id, v_total, 'на рассмотрении', NOW())
+                    RETURNING id INTO v_new_order_id;
+
+                    INSERT INTO main_orderitem (order_id, product_id, quantity, price)
+                    SELECT v_new_order_id, b.product_id, b.quantity, p.price
+                    FROM main_basket b
+                    JOIN main_product p ON b.product_id = p.id
+                    WHERE b.user_id = p_user_id;
+
+                    DELETE FROM main_basket WHERE user_id = p_user_id;
+
+                    RAISE NOTICE 'Заказ % создан для пользователя % со статусом "на рассмотрении"', v_new_order_id, p_user_id;
+                END;
+                $$;
+                """
+        ),
+    ]
@@ -0,0 +1,40 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_order_idempotency'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='задача')),
+                ('kwargs', models.JSONField(blank=True, default=dict, verbose_name='параметры')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='queued', max_length=20, verbose_name='статус')),
+                ('progress', models.PositiveSmallIntegerField(default=0, verbose_name='прогресс, %')),
+                ('message', models.CharField(blank=True, max_length=255, verbose_name='сообщение')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='результат')),
+                ('error', models.TextField(blank=True, verbose_name='ошибка')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='обработчик')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='создана')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='начата')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='завершена')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='автор')),
+            ],
+            options={
+                'verbose_name': 'Фоновая задача',
+                'verbose_name_plural': 'Фоновые задачи',
+                'ordering': ['-id'],
+                'indexes': [models.Index(condition=models.Q(('status', 'queued')), fields=['id'], name='job_queued_idx')],
+            },
+        ),
+    ]
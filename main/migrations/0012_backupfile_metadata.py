@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backupfile',
+            name='format',
+            field=models.CharField(choices=[('custom', 'Один файл (custom)'), ('directory', 'Каталог (directory, параллельный)')], default='custom', max_length=20, verbose_name='формат'),
+        ),
+        migrations.AddField(
+            model_name='backupfile',
+            name='compression',
+            field=models.CharField(blank=True, max_length=20, verbose_name='сжатие'),
+        ),
+        migrations.AddField(
+            model_name='backupfile',
+            name='jobs',
+            field=models.PositiveSmallIntegerField(default=1, verbose_name='потоков pg_dump'),
+        ),
+        migrations.AddField(
+            model_name='backupfile',
+            name='size_bytes',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='размер, байт'),
+        ),
+        migrations.AddField(
+            model_name='backupfile',
+            name='duration',
+            field=models.DurationField(blank=True, null=True, verbose_name='длительность'),
+        ),
+        migrations.AddField(
+            model_name='backupfile',
+            name='sha256',
+            field=models.CharField(blank=True, max_length=64, verbose_name='SHA-256'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_backupfile_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backupfile',
+            name='manifest',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='манифест'),
+        ),
+        migrations.CreateModel(
+            name='RestoreRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('running', 'Выполняется'), ('verified', 'Проверено'), ('swapped', 'Рабочая БД заменена'), ('failed', 'Ошибка')], default='running', max_length=20, verbose_name='статус')),
+                ('jobs', models.PositiveSmallIntegerField(default=1, verbose_name='потоков pg_restore')),
+                ('scratch_database', models.CharField(max_length=100, verbose_name='временная БД')),
+                ('previous_database', models.CharField(blank=True, max_length=100, verbose_name='прежняя БД')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='начато')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='завершено')),
+                ('table_timings', models.JSONField(blank=True, default=dict, verbose_name='время по таблицам')),
+                ('verification', models.JSONField(blank=True, default=dict, verbose_name='проверка')),
+                ('error', models.TextField(blank=True, verbose_name='ошибка')),
+                ('backup', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='main.backupfile', verbose_name='бэкап')),
+            ],
+            options={
+                'verbose_name': 'Восстановление',
+                'verbose_name_plural': 'Восстановления',
+                'ordering': ['-id'],
+            },
+        ),
+    ]
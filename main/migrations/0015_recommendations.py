@@ -0,0 +1,45 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='место')),
+                ('score', models.FloatField(verbose_name='сходство')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbor_of', to='main.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='main.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'rank'), name='productneighbor_product_rank_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RecommendationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.CharField(choices=[('full', 'Полный'), ('incremental', 'Инкрементальный')], max_length=20, verbose_name='режим')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='начат')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='завершён')),
+                ('last_order_id', models.BigIntegerField(default=0, verbose_name='последний заказ')),
+                ('last_wishlist_id', models.BigIntegerField(default=0, verbose_name='последняя запись вишлиста')),
+                ('last_product_id', models.BigIntegerField(default=0, verbose_name='последний товар')),
+                ('products_updated', models.IntegerField(default=0, verbose_name='товаров пересчитано')),
+                ('neighbors_written', models.IntegerField(default=0, verbose_name='соседей записано')),
+            ],
+            options={
+                'verbose_name': 'Пересчёт рекомендаций',
+                'verbose_name_plural': 'Пересчёты рекомендаций',
+                'ordering': ['-id'],
+            },
+        ),
+    ]
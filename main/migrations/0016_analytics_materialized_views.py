@@ -0,0 +1,201 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_recommendations'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(max_length=100, unique=True, verbose_name='представление')),
+                ('refreshed_at', models.DateTimeField(verbose_name='обновлено')),
+                ('duration', models.DurationField(verbose_name='длительность')),
+                ('row_count', models.BigIntegerField(default=0, verbose_name='строк')),
+            ],
+            options={
+                'verbose_name': 'Обновление аналитики',
+                'verbose_name_plural': 'Обновления аналитики',
+            },
+        ),
+        migrations.CreateModel(
+            name='ActiveOrderView',
+            fields=[
+                ('order', models.OneToOneField(db_column='order_id', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='+', serialize=False, to='main.order', verbose_name='заказ')),
+                ('created_at', models.DateTimeField(verbose_name='дата заказа')),
+                ('status', models.CharField(choices=[('на рассмотрении', 'На рассмотрении'), ('доставлен', 'Доставлен'), ('отменён', 'Отменён')], max_length=50, verbose_name='статус')),
+                ('user_name', models.CharField(max_length=150, verbose_name='пользователь')),
+                ('user_email', models.CharField(max_length=254, verbose_name='email')),
+                ('total', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='сумма')),
+                ('items_count', models.IntegerField(verbose_name='позиций')),
+            ],
+            options={
+                'verbose_name': 'Активный заказ',
+                'verbose_name_plural': 'Аналитика: активные заказы',
+                'db_table': 'active_orders_view',
+                'ordering': ['-created_at'],
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TopSellingProductView',
+            fields=[
+                ('product', models.OneToOneField(db_column='id', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='+', serialize=False, to='main.product', verbose_name='товар')),
+                ('rank', models.IntegerField(verbose_name='место')),
+                ('name', models.CharField(max_length=100, verbose_name='название')),
+                ('game_id', models.BigIntegerField()),
+                ('game_name', models.CharField(max_length=100, verbose_name='игра')),
+                ('total_sold', models.BigIntegerField(verbose_name='продано, шт.')),
+                ('orders_count', models.BigIntegerField(verbose_name='заказов')),
+            ],
+            options={
+                'verbose_name': 'Самый продаваемый товар',
+                'verbose_name_plural': 'Аналитика: самые продаваемые товары',
+                'db_table': 'top_selling_products_view',
+                'ordering': ['rank'],
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TopWishlistView',
+            fields=[
+                ('user', models.OneToOneField(db_column='user_id', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+                ('rank', models.IntegerField(verbose_name='место')),
+                ('username', models.CharField(max_length=150, verbose_name='логин')),
+                ('email', models.CharField(max_length=254, verbose_name='email')),
+                ('wishlist_count', models.BigIntegerField(verbose_name='в списке желаний')),
+            ],
+            options={
+                'verbose_name': 'Пользователь с большим списком желаний',
+                'verbose_name_plural': 'Аналитика: списки желаний',
+                'db_table': 'top_wishlists_view',
+                'ordering': ['rank'],
+                'managed': False,
+            },
+        ),
+
+        # 🔹 МАТЕРИАЛИЗОВАННЫЕ ПРЕДСТАВЛЕНИЯ вместо обычных из 0001: агрегаты считаются при
+        # обновлении (manage.py refresh_analytics), а не при каждом чтении.
+        # Статусы — значения Order.STATUS_CHOICES: 'cancelled' → 'отменён', 'completed' → 'доставлен'.
+        # Уникальные индексы обязательны для REFRESH MATERIALIZED VIEW CONCURRENTLY.
+        migrations.RunSQL(
+            sql="""
+                DROP VIEW IF EXISTS active_orders_view;
+                DROP VIEW IF EXISTS top_selling_products_view;
+                DROP VIEW IF EXISTS top_wishlists_view;
+
+                -- 1. Активные (не отменённые) заказы с суммой и числом позиций
+                CREATE MATERIALIZED VIEW active_orders_view AS
+                SELECT
+                    o.id AS order_id,
+                    o.created_at,
+                    o.status,
+                    u.username AS user_name,
+                    u.email AS user_email,
+                    SUM(oi.quantity * oi.price) AS total,
+                    COUNT(oi.id)::INT AS items_count
+                FROM main_order o
+                JOIN auth_user u ON o.user_id = u.id
+                JOIN main_orderitem oi ON o.id = oi.order_id
+                WHERE o.status <> 'отменён'
+                GROUP BY o.id, o.created_at, o.status, u.username, u.email;
+
+                CREATE UNIQUE INDEX active_orders_view_pk ON active_orders_view (order_id);
+                -- Дашборд: последние заказы без сортировки всего представления
+                CREATE INDEX active_orders_view_created_idx ON active_orders_view (created_at DESC, order_id DESC);
+
+                -- 2. Топ-100 товаров по продажам в доставленных заказах
+                CREATE MATERIALIZED VIEW top_selling_products_view AS
+                SELECT
+                    p.id,
+                    (ROW_NUMBER() OVER (ORDER BY SUM(oi.quantity) DESC, p.id))::INT AS rank,
+                    p.name,
+                    p.game_id,
+                    g.name AS game_name,
+                    SUM(oi.quantity) AS total_sold,
+                    COUNT(DISTINCT o.id) AS orders_count
+                FROM main_product p
+                JOIN main_orderitem oi ON p.id = oi.product_id
+                JOIN main_order o ON oi.order_id = o.id
+                JOIN main_game g ON p.game_id = g.id
+                WHERE o.status = 'доставлен'
+                GROUP BY p.id, p.name, p.game_id, g.name
+                ORDER BY total_sold DESC, p.id
+                LIMIT 100;
+
+                CREATE UNIQUE INDEX top_selling_products_view_pk ON top_selling_products_view (id);
+
+                -- 3. Топ-100 пользователей по размеру списка желаний
+                CREATE MATERIALIZED VIEW top_wishlists_view AS
+                SELECT
+                    u.id AS user_id,
+                    (ROW_NUMBER() OVER (ORDER BY COUNT(w.id) DESC, u.id))::INT AS rank,
+                    u.username,
+                    u.email,
+                    COUNT(w.id) AS wishlist_count
+                FROM auth_user u
+                LEFT JOIN main_wishlist w ON u.id = w.user_id
+                GROUP BY u.id, u.username, u.email
+                ORDER BY wishlist_count DESC, u.id
+                LIMIT 100;
+
+                CREATE UNIQUE INDEX top_wishlists_view_pk ON top_wishlists_view (user_id);
+                """,
+            reverse_sql="""
+                DROP MATERIALIZED VIEW IF EXISTS active_orders_view;
+                DROP MATERIALIZED VIEW IF EXISTS top_selling_products_view;
+                DROP MATERIALIZED VIEW IF EXISTS top_wishlists_view;
+
+                CREATE OR REPLACE VIEW active_orders_view AS
+                SELECT
+                    o.id AS order_id,
+                    o.created_at,
+                    o.status,
+                    u.username AS user_name,
+                    u.email AS user_email,
+                    SUM(oi.quantity * oi.price) AS total,
+                    COUNT(oi.id) AS items_count
+                FROM main_order o
+                JOIN auth_user u ON o.user_id = u.id
+                JOIN main_orderitem oi ON o.id = oi.order_id
+                WHERE o.status != 'cancelled'
+                GROUP BY o.id, o.created_at, o.status, u.username, u.email;
+
+                CREATE OR REPLACE VIEW top_selling_products_view AS
+                SELECT
+                    p.id,
+                    p.name,
+                    p.game_id,
+                    g.name AS game_name,
+                    SUM(oi.quantity) AS total_sold,
+                    COUNT(DISTINCT o.id) AS orders_count
+                FROM main_product p
+                JOIN main_orderitem oi ON p.id = oi.product_id
+                JOIN main_order o ON oi.order_id = o.id
+                JOIN main_game g ON p.game_id = g.id
+                WHERE o.status = 'completed'
+                GROUP BY p.id, p.name, p.game_id, g.name
+                ORDER BY total_sold DESC
+                LIMIT 5;
+
+                CREATE OR REPLACE VIEW top_wishlists_view AS
+                SELECT
+                    u.id AS user_id,
+                    u.username,
+                    u.email,
+                    COUNT(w.id) AS wishlist_count
+                FROM auth_user u
+                LEFT JOIN main_wishlist w ON u.id = w.user_id
+                GROUP BY u.id, u.username, u.email
+                ORDER BY wishlist_count DESC
+                LIMIT 10;
+                """
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.utils import timezone
 from django.db import models
+from django.db.models import Q
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import User
 from django.core.validators import FileExtensionValidator
 import os
@@ -13,6 +16,8 @@ def game_logo_path(instance, filename):
 
 class Game(models.Model):
     name = models.CharField(max_length=100)
+    # Поддерживается и триггером touch_updated_at — для UPDATE в обход ORM
+    updated_at = models.DateTimeField(auto_now=True)
     # Было: logo_url = models.URLField(...)
     logo = models.ImageField(
         upload_to=game_logo_path,
@@ -20,6 +25,8 @@ class Game(models.Model):
         null=True,
         validators=[FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'webp'])]
     )
+    # Готовые уменьшенные копии логотипа (см. main/images.py)
+    logo_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -35,6 +42,7 @@ class Game(models.Model):
 class Category(models.Model):
     name = models.CharField(max_length=100)
     game = models.ForeignKey(Game, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -53,18 +61,54 @@ class Product(models.Model):
         validators=[FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'webp'])],
         verbose_name="Изображение"
     )
+    # Готовые уменьшенные копии: {'source': имя оригинала, 'width': W, 'widths': {'320': имя}}
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     average_rating = models.DecimalField(
         max_digits=3,
         decimal_places=2,
         default=0.00,
         editable=False
     )
+    # Сумма и количество оценок — обновляются триггером на main_review
+    rating_sum = models.IntegerField(default=0, editable=False)
+    rating_count = models.IntegerField(default=0, editable=False)
+    # Полнотекстовый индекс по name/description — заполняется триггером trg_product_search_vector
+    search_vector = SearchVectorField(null=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     game = models.ForeignKey(Game, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            # Главная: первые товары со скидкой по каждой игре
+            models.Index(fields=['game', 'id'], condition=Q(discount__isnull=False), name='product_game_discounted_idx'),
+            # Каталог: игра + категории + диапазон/сортировка по цене
+            models.Index(fields=['game', 'category', 'price'], name='product_game_cat_price_idx'),
+            # Keyset-пагинация каталога: (price, id) и id внутри игры
+            models.Index(fields=['game', 'price', 'id'], name='product_game_price_id_idx'),
+            models.Index(fields=['game', 'id'], name='product_game_id_idx'),
+            # Поиск: полнотекстовый и триграммный (опечатки)
+            GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+            GinIndex(fields=['name'], name='product_name_trgm_idx', opclasses=['gin_trgm_ops']),
+            # MAX(updated_at) по игре для ETag каталога
+            models.Index(fields=['game', 'updated_at'], name='product_game_updated_idx'),
+        ]
+
+    # Поля, которые пишет только триггер product_rating_apply: save() загруженного раньше
+    # объекта не должен затирать оценки, добавленные после его загрузки
+    TRIGGER_FIELDS = ('rating_sum', 'rating_count', 'average_rating')
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert'):
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = [f.name for f in self._meta.concrete_fields if not f.primary_key]
+            kwargs['update_fields'] = [name for name in update_fields if name not in self.TRIGGER_FIELDS]
+        super().save(*args, **kwargs)
+
     @property
     def image_url(self):
         """Возвращает URL изображения, если оно есть. Иначе — None."""
@@ -79,6 +123,12 @@ class Basket(models.Model):
     quantity = models.IntegerField(default=1)
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        constraints = [
+            # Одна строка на товар: на этом держатся upsert'ы корзины (ON CONFLICT)
+            models.UniqueConstraint(fields=['user', 'product'], name='basket_user_product_uniq'),
+        ]
+
     def __str__(self):
         return f"Корзина пользователя {self.user.username}"
 
@@ -94,6 +144,17 @@ class Order(models.Model):
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(default=timezone.now, verbose_name="дата заказа")
     status = models.CharField(max_length=50, choices=STATUS_CHOICES, default='на рассмотрении')
+    # Ключ формы оформления: повторная отправка возвращает уже созданный заказ
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # «Мои заказы»: заказы пользователя, новые сверху
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='order_user_idempotency_uniq'),
+        ]
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
@@ -101,6 +162,12 @@ class OrderItem(models.Model):
     quantity = models.IntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        indexes = [
+            # Проверка покупки в триггере prevent_review_without_purchase
+            models.Index(fields=['product', 'order'], name='orderitem_product_order_idx'),
+        ]
+
 class Review(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -108,6 +175,11 @@ class Review(models.Model):
     comment = models.TextField()
     created_at = models.DateTimeField(default=timezone.now, verbose_name="Дата отзыва")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='review_product_created_idx'),
+        ]
+
 class Wishlist(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -121,15 +193,237 @@ class Wishlist(models.Model):
     def __str__(self):
         return f"{self.user.username} — {self.product.name}"
 
+class UserCartSummary(models.Model):
+    """Денормализованные счётчики корзины и вишлиста — поддерживаются триггерами в БД"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    basket_count = models.IntegerField(default=0)
+    wishlist_count = models.IntegerField(default=0)
+    basket_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"Сводка корзины {self.user.username}"
+
 def backup_path(instance, filename):
     return f"backups/{filename}"
 
 class BackupFile(models.Model):
+    FORMAT_CUSTOM = 'custom'
+    FORMAT_DIRECTORY = 'directory'
+    FORMAT_CHOICES = [
+        (FORMAT_CUSTOM, 'Один файл (custom)'),
+        (FORMAT_DIRECTORY, 'Каталог (directory, параллельный)'),
+    ]
+
     file = models.FileField(upload_to=backup_path)
     created_at = models.DateTimeField(auto_now_add=True)
+    format = models.CharField(max_length=20, choices=FORMAT_CHOICES, default=FORMAT_CUSTOM, verbose_name="формат")
+    compression = models.CharField(max_length=20, blank=True, verbose_name="сжатие")
+    jobs = models.PositiveSmallIntegerField(default=1, verbose_name="потоков pg_dump")
+    size_bytes = models.BigIntegerField(null=True, blank=True, verbose_name="размер, байт")
+    duration = models.DurationField(null=True, blank=True, verbose_name="длительность")
+    sha256 = models.CharField(max_length=64, blank=True, verbose_name="SHA-256")
+    # Строки и контрольные суммы таблиц в снимке, из которого сделан дамп: {"public.main_product": {"rows": .., "checksum": ..}}
+    manifest = models.JSONField(null=True, blank=True, editable=False, verbose_name="манифест")
 
     def __str__(self):
         return os.path.basename(self.file.name)
     class Meta:
         verbose_name = "Бэкап"
-        verbose_name_plural = "Бэкапы"
\ No newline at end of file
+        verbose_name_plural = "Бэкапы"
+
+class Job(models.Model):
+    """Фоновая задача: ставится в очередь из админки/вьюх, выполняется manage.py runworker"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Готово'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    name = models.CharField(max_length=100, verbose_name="задача")
+    kwargs = models.JSONField(default=dict, blank=True, verbose_name="параметры")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED, verbose_name="статус")
+    progress = models.PositiveSmallIntegerField(default=0, verbose_name="прогресс, %")
+    message = models.CharField(max_length=255, blank=True, verbose_name="сообщение")
+    result = models.JSONField(null=True, blank=True, verbose_name="результат")
+    error = models.TextField(blank=True, verbose_name="ошибка")
+    created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, verbose_name="автор")
+    worker = models.CharField(max_length=100, blank=True, verbose_name="обработчик")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="создана")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="начата")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="завершена")
+    # Обновляется при каждом сообщении о прогрессе — по нему видны «зависшие» задачи
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        ordering = ['-id']
+        indexes = [
+            # Выбор следующей задачи обработчиком: WHERE status = 'queued' ORDER BY id
+            models.Index(fields=['id'], condition=Q(status='queued'), name='job_queued_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.name} ({self.get_status_display()})"
+
+    @property
+    def duration(self):
+        if self.started_at and self.finished_at:
+            return self.finished_at - self.started_at
+        return None
+
+
+class RestoreRun(models.Model):
+    """Восстановление бэкапа: временная БД, проверка по манифесту, подмена рабочей БД"""
+    STATUS_CHOICES = [
+        ('running', 'Выполняется'),
+        ('verified', 'Проверено'),
+        ('swapped', 'Рабочая БД заменена'),
+        ('failed', 'Ошибка'),
+    ]
+
+    backup = models.ForeignKey(BackupFile, null=True, on_delete=models.SET_NULL, verbose_name="бэкап")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running', verbose_name="статус")
+    jobs = models.PositiveSmallIntegerField(default=1, verbose_name="потоков pg_restore")
+    scratch_database = models.CharField(max_length=100, verbose_name="временная БД")
+    previous_database = models.CharField(max_length=100, blank=True, verbose_name="прежняя БД")
+    started_at = models.DateTimeField(default=timezone.now, verbose_name="начато")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="завершено")
+    # {"public.main_product": секунды} — для планирования окон восстановления
+    table_timings = models.JSONField(default=dict, blank=True, verbose_name="время по таблицам")
+    # {"public.main_product": {"expected_rows", "actual_rows", "checksum_ok"}}
+    verification = models.JSONField(default=dict, blank=True, verbose_name="проверка")
+    error = models.TextField(blank=True, verbose_name="ошибка")
+
+    class Meta:
+        verbose_name = "Восстановление"
+        verbose_name_plural = "Восстановления"
+        ordering = ['-id']
+
+    def __str__(self):
+        return f"Восстановление #{self.id} ({self.get_status_display()})"
+
+    @property
+    def duration(self):
+        if self.finished_at:
+            return self.finished_at - self.started_at
+        return None
+
+
+class ProductNeighbor(models.Model):
+    """Похожий товар: top-K соседей каждого товара, считаются main/recommendations.py"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='neighbor_of')
+    rank = models.PositiveSmallIntegerField(verbose_name="место")
+    score = models.FloatField(verbose_name="сходство")
+
+    class Meta:
+        constraints = [
+            # Он же индекс чтения: WHERE product_id = X ORDER BY rank
+            models.UniqueConstraint(fields=['product', 'rank'], name='productneighbor_product_rank_uniq'),
+        ]
+
+
+class RecommendationRun(models.Model):
+    """Пересчёт похожих товаров: полный или по заказам и вишлистам, появившимся после прошлого"""
+    MODE_CHOICES = [
+        ('full', 'Полный'),
+        ('incremental', 'Инкрементальный'),
+    ]
+
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES, verbose_name="режим")
+    started_at = models.DateTimeField(default=timezone.now, verbose_name="начат")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="завершён")
+    # Водяные знаки: следующий инкрементальный пересчёт возьмёт строки с id больше этих
+    last_order_id = models.BigIntegerField(default=0, verbose_name="последний заказ")
+    last_wishlist_id = models.BigIntegerField(default=0, verbose_name="последняя запись вишлиста")
+    last_product_id = models.BigIntegerField(default=0, verbose_name="последний товар")
+    products_updated = models.IntegerField(default=0, verbose_name="товаров пересчитано")
+    neighbors_written = models.IntegerField(default=0, verbose_name="соседей записано")
+
+    class Meta:
+        verbose_name = "Пересчёт рекомендаций"
+        verbose_name_plural = "Пересчёты рекомендаций"
+        ordering = ['-id']
+
+    def __str__(self):
+        return f"Рекомендации #{self.id} ({self.get_mode_display()})"
+
+    @property
+    def duration(self):
+        if self.finished_at:
+            return self.finished_at - self.started_at
+        return None
+
+
+# Материализованные представления аналитики (миграция 0016): обновляются manage.py refresh_analytics,
+# чтение — из готовых строк, без агрегации заказов
+
+class ActiveOrderView(models.Model):
+    order = models.OneToOneField(Order, primary_key=True, on_delete=models.DO_NOTHING, db_column='order_id', related_name='+', verbose_name="заказ")
+    created_at = models.DateTimeField(verbose_name="дата заказа")
+    status = models.CharField(max_length=50, choices=Order.STATUS_CHOICES, verbose_name="статус")
+    user_name = models.CharField(max_length=150, verbose_name="пользователь")
+    user_email = models.CharField(max_length=254, verbose_name="email")
+    total = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="сумма")
+    items_count = models.IntegerField(verbose_name="позиций")
+
+    class Meta:
+        managed = False
+        db_table = 'active_orders_view'
+        verbose_name = "Активный заказ"
+        verbose_name_plural = "Аналитика: активные заказы"
+        ordering = ['-created_at']
+
+
+class TopSellingProductView(models.Model):
+    product = models.OneToOneField(Product, primary_key=True, on_delete=models.DO_NOTHING, db_column='id', related_name='+', verbose_name="товар")
+    rank = models.IntegerField(verbose_name="место")
+    name = models.CharField(max_length=100, verbose_name="название")
+    game_id = models.BigIntegerField()
+    game_name = models.CharField(max_length=100, verbose_name="игра")
+    total_sold = models.BigIntegerField(verbose_name="продано, шт.")
+    orders_count = models.BigIntegerField(verbose_name="заказов")
+
+    class Meta:
+        managed = False
+        db_table = 'top_selling_products_view'
+        verbose_name = "Самый продаваемый товар"
+        verbose_name_plural = "Аналитика: самые продаваемые товары"
+        ordering = ['rank']
+
+
+class TopWishlistView(models.Model):
+    user = models.OneToOneField(User, primary_key=True, on_delete=models.DO_NOTHING, db_column='user_id', related_name='+', verbose_name="пользователь")
+    rank = models.IntegerField(verbose_name="место")
+    username = models.CharField(max_length=150, verbose_name="логин")
+    email = models.CharField(max_length=254, verbose_name="email")
+    wishlist_count = models.BigIntegerField(verbose_name="в списке желаний")
+
+    class Meta:
+        managed = False
+        db_table = 'top_wishlists_view'
+        verbose_name = "Пользователь с большим списком желаний"
+        verbose_name_plural = "Аналитика: списки желаний"
+        ordering = ['rank']
+
+
+class AnalyticsRefresh(models.Model):
+    """Когда и за сколько обновлялось материализованное представление"""
+    view_name = models.CharField(max_length=100, unique=True, verbose_name="представление")
+    refreshed_at = models.DateTimeField(verbose_name="обновлено")
+    duration = models.DurationField(verbose_name="длительность")
+    # Число строк на момент обновления — дашборд показывает его без COUNT(*)
+    row_count = models.BigIntegerField(default=0, verbose_name="строк")
+
+    class Meta:
+        verbose_name = "Обновление аналитики"
+        verbose_name_plural = "Обновления аналитики"
+
+    def __str__(self):
+        return self.view_name
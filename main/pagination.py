@@ -0,0 +1,143 @@
+# main/pagination.py
+import base64
+import binascii
+import json
+from decimal import Decimal
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Сортировки каталога: поля ключа (последнее всегда id — делает ключ уникальным)
+SORT_ORDERINGS = {
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+    'default': ('id',),
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({'v': [str(v) for v in values], 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, direction = payload['v'], payload['d']
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        raise InvalidCursor(cursor)
+    if direction not in ('n', 'p') or not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values, direction
+
+
+def _field(name):
+    return name.lstrip('-')
+
+
+def keyset_after(ordering, values, reverse=False):
+    """Условие «строго после values» в порядке ordering (или в обратном при reverse)"""
+    (first, *rest), (first_value, *rest_values) = ordering, values
+    descending = first.startswith('-') != reverse
+    name = _field(first)
+    strict = Q(**{f'{name}__{"lt" if descending else "gt"}': first_value})
+    if not rest:
+        return strict
+    # Дублирующее нестрогое условие даёт планировщику границу диапазона индекса
+    bound = Q(**{f'{name}__{"lte" if descending else "gte"}': first_value})
+    return bound & (strict | keyset_after(rest, rest_values, reverse))
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по плану запроса — без COUNT(*)"""
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Постраничный вывод для админки больших таблиц: число строк — оценка планировщика"""
+
+    @cached_property
+    def count(self):
+        return estimate_count(self.object_list)
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Пагинация по ключу сортировки (keyset): страница выбирается условием
+    «после последней строки предыдущей страницы», а не OFFSET, поэтому
+    глубокие страницы работают так же быстро, как первая.
+    """
+
+    def __init__(self, queryset, per_page, ordering=SORT_ORDERINGS['default']):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+
+    def _key(self, obj):
+        if isinstance(obj, dict):
+            return [obj[_field(f)] for f in self.ordering]
+        return [getattr(obj, _field(f)) for f in self.ordering]
+
+    def _reversed_ordering(self):
+        return [f[1:] if f.startswith('-') else f'-{f}' for f in self.ordering]
+
+    def _parse_values(self, raw):
+        if len(raw) != len(self.ordering):
+            raise InvalidCursor(raw)
+        try:
+            return [int(v) if _field(f) == 'id' else Decimal(v) for f, v in zip(self.ordering, raw)]
+        except (ArithmeticError, ValueError):
+            raise InvalidCursor(raw)
+
+    def get_page(self, cursor=None):
+        direction = 'n'
+        queryset = self.queryset.order_by(*self.ordering)
+        if cursor:
+            raw, direction = decode_cursor(cursor)
+            values = self._parse_values(raw)
+            if direction == 'p':
+                queryset = self.queryset.order_by(*self._reversed_ordering())
+            queryset = queryset.filter(keyset_after(self.ordering, values, reverse=direction == 'p'))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if direction == 'p':
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, bool(cursor)
+
+        return KeysetPage(
+            rows,
+            has_next=has_next,
+            has_previous=has_previous,
+            next_cursor=encode_cursor(self._key(rows[-1]), 'n') if has_next and rows else None,
+            previous_cursor=encode_cursor(self._key(rows[0]), 'p') if has_previous and rows else None,
+        )
@@ -0,0 +1,100 @@
+# main/pool_metrics.py
+"""
+Метрики соединений с БД по процессу (воркеру gunicorn).
+
+В режиме pool (DB_CONNECTION_MODE) — статистика psycopg_pool за интервал:
+выдачи соединений, суммарное ожидание, запросы, вставшие в очередь (пул исчерпан),
+и ошибки ожидания (PoolTimeout). В остальных режимах — сколько раз за интервал
+Django открывал новое соединение.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_connects = 0
+
+
+@receiver(connection_created)
+def _count_connect(sender, connection, **kwargs):
+    global _connects
+    with _lock:
+        _connects += 1
+
+
+def _pop_connects():
+    global _connects
+    with _lock:
+        value, _connects = _connects, 0
+    return value
+
+
+def get_pool(alias=DEFAULT_DB_ALIAS):
+    """ConnectionPool процесса или None, если пул не включён"""
+    return getattr(connections[alias], 'pool', None)
+
+
+def pop_stats(alias=DEFAULT_DB_ALIAS):
+    """Метрики с прошлого вызова (счётчики обнуляются)"""
+    stats = {'mode': settings.DB_CONNECTION_MODE, 'connects': _pop_connects()}
+    pool = get_pool(alias)
+    if pool is not None:
+        raw = pool.pop_stats()
+        stats.update(
+            checkouts=raw.get('requests_num', 0),
+            wait_ms=raw.get('requests_wait_ms', 0),
+            exhausted=raw.get('requests_queued', 0),
+            timeouts=raw.get('requests_errors', 0),
+            pool_size=raw.get('pool_size', 0),
+            pool_available=raw.get('pool_available', 0),
+            pool_max=raw.get('pool_max', 0),
+        )
+    return stats
+
+
+def log_stats(alias=DEFAULT_DB_ALIAS):
+    stats = pop_stats(alias)
+    if stats.get('timeouts'):
+        level = logging.WARNING
+    else:
+        level = logging.INFO
+    logger.log(level, ' '.join(f"{key}={value}" for key, value in stats.items()))
+
+
+class PoolStatsLogger(threading.Thread):
+    def __init__(self, interval):
+        super().__init__(name='db-pool-stats', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                log_stats()
+            except Exception:
+                logger.exception("Не удалось снять метрики пула")
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start_stats_logger(interval=None):
+    interval = settings.DB_POOL_STATS_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return None
+    thread = PoolStatsLogger(interval)
+    thread.start()
+    return thread
+
+
+def close_pool(alias=DEFAULT_DB_ALIAS):
+    """Закрыть пул при остановке воркера — соединения не висят на стороне Postgres до таймаута"""
+    connection = connections[alias]
+    if get_pool(alias) is not None:
+        connection.close_pool()
@@ -0,0 +1,278 @@
+# main/product_io.py
+"""
+Массовый импорт и экспорт товаров (CSV и JSONL).
+
+Формат строки: id, name, description, price, discount, category, game.
+price — цена без скидки: скидку применяет триггер trg_update_price_on_discount,
+поэтому выгрузка, загруженная обратно, не меняет цены. Игра и категория — по имени.
+Строка с id обновляет существующий товар, без id — создаёт новый.
+
+Импорт читает файл потоком и пишет пачками bulk_create/bulk_update; ошибки
+собираются по строкам и не прерывают загрузку остального файла.
+"""
+import csv
+import io
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.db.models import Case, F, When
+
+from .cache import bump_version, invalidate_product
+from .models import Category, Game, Product
+
+FIELDS = ['id', 'name', 'description', 'price', 'discount', 'category', 'game']
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+# Обновляемые колонки; old_price сбрасывается — при скидке его заново выставит триггер
+UPDATE_FIELDS = ['name', 'description', 'price', 'old_price', 'discount', 'category', 'game']
+# В отчёт попадают первые N ошибок, остальные только считаются
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def detect_format(filename):
+    name = filename.lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    raise ImportFormatError(f"Неизвестный формат файла: {filename} (нужен .csv или .jsonl)")
+
+
+def read_rows(fileobj, fmt):
+    """(номер строки, dict) из бинарного файла — без чтения файла целиком"""
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(text, dialect=dialect)
+        missing = {'name', 'price', 'category', 'game'} - set(reader.fieldnames or ())
+        if missing:
+            raise ImportFormatError(f"В заголовке CSV нет колонок: {', '.join(sorted(missing))}")
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_no, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, ImportFormatError(f"Некорректный JSON: {e}")
+                continue
+            yield line_no, row if isinstance(row, dict) else ImportFormatError("Ожидается JSON-объект")
+
+
+class NameLookup:
+    """Игры и категории по имени — загружаются один раз на весь импорт"""
+
+    def __init__(self):
+        self.games = dict(Game.objects.values_list('name', 'id'))
+        self.categories = {
+            (game_id, name): category_id
+            for category_id, game_id, name in Category.objects.values_list('id', 'game_id', 'name')
+        }
+
+    def resolve(self, game_name, category_name):
+        game_id = self.games.get((game_name or '').strip())
+        if game_id is None:
+            raise ValidationError({'game': f"Игра «{game_name}» не найдена"})
+        category_id = self.categories.get((game_id, (category_name or '').strip()))
+        if category_id is None:
+            raise ValidationError({'category': f"Категория «{category_name}» игры «{game_name}» не найдена"})
+        return game_id, category_id
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def _blank_to_none(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def build_product(row, lookup):
+    """Непроверенная строка -> несохранённый Product; ValidationError со словарём ошибок по полям"""
+    try:
+        game_id, category_id = lookup.resolve(row.get('game'), row.get('category'))
+    except ValidationError as e:
+        errors = e.message_dict
+        game_id = category_id = None
+    else:
+        errors = {}
+
+    product_id = _blank_to_none(row.get('id'))
+    product = Product(
+        id=product_id,
+        name=(row.get('name') or '').strip(),
+        description=row.get('description') or '',
+        price=_blank_to_none(row.get('price')),
+        old_price=None,
+        discount=_blank_to_none(row.get('discount')),
+        category_id=category_id,
+        game_id=game_id,
+    )
+    try:
+        # Связи уже проверены справочником — без запроса на каждую строку
+        product.full_clean(exclude=['category', 'game', 'image'], validate_unique=False, validate_constraints=False)
+    except ValidationError as e:
+        errors.update(e.message_dict)
+    if errors:
+        raise ValidationError(errors)
+    return product
+
+
+class ProductImporter:
+    def __init__(self, batch_size=None, progress=None):
+        self.batch_size = batch_size or getattr(settings, 'PRODUCT_IMPORT_BATCH_SIZE', 1000)
+        self.progress = progress
+        self.lookup = NameLookup()
+        self.report = ImportReport()
+        self.games_touched = set()
+
+    def run(self, fileobj, fmt, size=None):
+        batch = []
+        for line, row in read_rows(fileobj, fmt):
+            self.report.rows += 1
+            if isinstance(row, Exception):
+                self.report.add_error(line, {'__all__': [str(row)]})
+                continue
+            try:
+                batch.append((line, build_product(row, self.lookup)))
+            except ValidationError as e:
+                self.report.add_error(line, e.message_dict)
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+                self._report_progress(fileobj, size)
+        if batch:
+            self.flush(batch)
+
+        for game_id in self.games_touched:
+            bump_version('game', game_id)
+        return self.report
+
+    def _report_progress(self, fileobj, size):
+        if self.progress and size:
+            self.progress(
+                min(99, fileobj.tell() * 100 // size),
+                f"Строк: {self.report.rows}, ошибок: {self.report.error_count}",
+            )
+
+    def flush(self, batch):
+        """Пачка одной транзакцией; при ошибке БД — построчно, чтобы найти виноватые строки"""
+        new = [product for _, product in batch if product.id is None]
+        try:
+            with transaction.atomic():
+                self._write(batch)
+        except DatabaseError:
+            # bulk_create мог успеть проставить id откатившимся строкам
+            for product in new:
+                product.id = None
+            for line, product in batch:
+                try:
+                    with transaction.atomic():
+                        self._write([(line, product)])
+                except DatabaseError as e:
+                    self.report.add_error(line, {'__all__': [str(e).strip()]})
+
+    def _write(self, batch):
+        ids = [product.id for _, product in batch if product.id is not None]
+        # Один запрос на пачку: какие id существуют и в какой игре они были до обновления
+        existing = dict(Product.objects.filter(id__in=ids).values_list('id', 'game_id')) if ids else {}
+
+        creates, updates, missing = [], {}, []
+        for line, product in batch:
+            if product.id is None:
+                creates.append(product)
+            elif product.id in existing:
+                # Повтор id в пачке — побеждает последняя строка
+                updates[product.id] = product
+            else:
+                missing.append(line)
+
+        if creates:
+            Product.objects.bulk_create(creates, batch_size=self.batch_size)
+        if updates:
+            Product.objects.bulk_update(updates.values(), UPDATE_FIELDS, batch_size=self.batch_size)
+
+        for line in missing:
+            self.report.add_error(line, {'id': ["Товар с таким id не найден"]})
+        self.report.created += len(creates)
+        self.report.updated += len(updates)
+        # bulk-операции не шлют post_save — кэш фрагментов сбрасываем сами
+        for product in updates.values():
+            invalidate_product(product.id)
+            self.games_touched.add(existing[product.id])
+        self.games_touched.update(product.game_id for product in creates)
+        self.games_touched.update(product.game_id for product in updates.values())
+
+
+def import_products(fileobj, fmt, batch_size=None, progress=None, size=None):
+    return ProductImporter(batch_size=batch_size, progress=progress).run(fileobj, fmt, size=size).as_dict()
+
+
+def export_rows(queryset, chunk_size=None):
+    """Строки выгрузки серверным курсором: в памяти одновременно не больше chunk_size товаров"""
+    chunk_size = chunk_size or getattr(settings, 'PRODUCT_EXPORT_CHUNK_SIZE', 2000)
+    return (
+        queryset.order_by('id')
+        .annotate(base_price=Case(
+            When(discount__gt=0, old_price__isnull=False, then=F('old_price')),
+            default=F('price'),
+        ))
+        .values_list('id', 'name', 'description', 'base_price', 'discount', 'category__name', 'game__name')
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+class _Echo:
+    """Псевдобуфер для csv.writer: write() возвращает строку, а не пишет её"""
+
+    def write(self, value):
+        return value
+
+
+def stream_export(queryset, fmt, chunk_size=None):
+    rows = export_rows(queryset, chunk_size)
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        # BOM — чтобы Excel открыл UTF-8 без мастера импорта
+        yield '\ufeff' + writer.writerow(FIELDS)
+        for row in rows:
+            yield writer.writerow(['' if value is None else value for value in row])
+    else:
+        for row in rows:
+            record = dict(zip(FIELDS, row))
+            record['price'] = str(record['price'])
+            yield json.dumps(record, ensure_ascii=False) + '\n'
@@ -0,0 +1,31 @@
+# main/queries.py
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Product
+
+
+def discounted_products_per_game(limit=4):
+    """Первые `limit` товаров со скидкой для каждой игры — одним запросом (оконная функция)"""
+    return (
+        Product.objects
+        .filter(discount__isnull=False)
+        .select_related('game', 'category')
+        .annotate(game_rank=Window(
+            expression=RowNumber(),
+            partition_by=[F('game_id')],
+            order_by=F('id').asc(),
+        ))
+        .filter(game_rank__lte=limit)
+        .order_by('game_id', 'game_rank')
+    )
+
+
+def games_with_discounts(limit=4):
+    """Список [{'game': Game, 'products': [Product, ...]}] для игр, у которых есть скидки"""
+    grouped = []
+    for product in discounted_products_per_game(limit):
+        if not grouped or grouped[-1]['game'].id != product.game_id:
+            grouped.append({'game': product.game, 'products': []})
+        grouped[-1]['products'].append(product)
+    return grouped
@@ -0,0 +1,94 @@
+# main/query_budget.py
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from django.urls import resolve
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+# Счётчики, открытые в текущем потоке: к ним добавляются запросы, выполненные за него в других потоках
+_active = threading.local()
+
+
+@contextmanager
+def count_queries():
+    """Считает SQL-запросы, выполненные внутри блока: with count_queries() as counter: ... counter['count']"""
+    counter = {'count': 0}
+    stack = _active.__dict__.setdefault('counters', [])
+
+    def wrapper(execute, sql, params, many, context):
+        counter['count'] += 1
+        return execute(sql, params, many, context)
+
+    stack.append(counter)
+    try:
+        with connection.execute_wrapper(wrapper):
+            yield counter
+    finally:
+        stack.remove(counter)
+
+
+def record_queries(count):
+    """Учесть запросы, выполненные для текущего потока в других (main/loaders.py)"""
+    for counter in getattr(_active, 'counters', ()):
+        counter['count'] += count
+
+
+def query_budget(max_queries):
+    """
+    Объявляет максимальное число SQL-запросов для view (включая отрисовку шаблона).
+    Превышение пишется в лог, а при QUERY_BUDGET_STRICT = True — приводит к исключению.
+    Для классов: @method_decorator(query_budget(5), name='dispatch').
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped(request, *args, **kwargs):
+            with count_queries() as counter:
+                response = view_func(request, *args, **kwargs)
+                # TemplateResponse рисуется лениво — запросы шаблона тоже должны попасть в счёт
+                if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+                    response.render()
+
+            response.query_count = counter['count']
+            if counter['count'] > max_queries:
+                message = f"{request.path}: {counter['count']} SQL-запросов при бюджете {max_queries}"
+                if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+
+        wrapped.query_budget = max_queries
+        return wrapped
+    return decorator
+
+
+def get_view_budget(path):
+    """Бюджет, объявленный для view по указанному URL (или None)"""
+    view = resolve(path).func
+    view_class = getattr(view, 'view_class', None)
+    if view_class is not None:
+        return getattr(view_class.dispatch, 'query_budget', None)
+    return getattr(view, 'query_budget', None)
+
+
+class QueryBudgetTestMixin:
+    """Примесь для TestCase: проверяет, что view уложилась в объявленный бюджет запросов"""
+
+    def assertQueryBudget(self, path, data=None):
+        budget = get_view_budget(path)
+        self.assertIsNotNone(budget, f"Для {path} не объявлен query_budget")
+        response = self.client.get(path, data)
+        self.assertLessEqual(
+            response.query_count, budget,
+            f"{path}: {response.query_count} SQL-запросов при бюджете {budget}",
+        )
+        return response
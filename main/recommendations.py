@@ -0,0 +1,261 @@
+# main/recommendations.py
+"""
+Похожие товары: индекс top-K соседей, рассчитанный заранее.
+
+Сходство двух товаров — взвешенная сумма трёх сигналов (RECOMMENDATION_WEIGHTS):
+  orders   — как часто их покупают в одном заказе (косинус по матрице заказ × товар);
+  wishlist — как часто они вместе в вишлистах (косинус по матрице пользователь × товар);
+  category — одна категория и близкая цена (соседи по цене в пределах окна).
+Матрицы разрежённые (scipy.sparse), произведения считаются целиком, без циклов по парам.
+Для каждого товара в ProductNeighbor хранятся RECOMMENDATION_TOP_K лучших соседей —
+страница товара и API читают их одним запросом по индексу (product_id, rank).
+
+Инкрементальный пересчёт берёт заказы, записи вишлистов и товары с id больше
+водяных знаков прошлого прогона и пересчитывает строки только затронутых товаров.
+Удаления и сдвиг нормировки у незатронутых товаров учитывает полный пересчёт
+(manage.py build_recommendations --full, например раз в сутки).
+"""
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .cache import bump_version
+from .models import Order, OrderItem, Product, ProductNeighbor, RecommendationRun, Wishlist
+
+DEFAULT_WEIGHTS = {'orders': 1.0, 'wishlist': 0.5, 'category': 0.2}
+# Ключ pg_advisory_xact_lock: два пересчёта не пишут индекс одновременно
+ADVISORY_LOCK_KEY = 7_240_024
+
+
+def _options():
+    return (
+        {**DEFAULT_WEIGHTS, **getattr(settings, 'RECOMMENDATION_WEIGHTS', {})},
+        getattr(settings, 'RECOMMENDATION_TOP_K', 12),
+        getattr(settings, 'RECOMMENDATION_PRICE_WINDOW', 10),
+    )
+
+
+class Catalog:
+    """Товары в порядке id: позиция в массиве — номер столбца во всех матрицах"""
+
+    def __init__(self):
+        import numpy as np
+
+        rows = list(Product.objects.order_by('id').values_list('id', 'category_id', 'price'))
+        self.ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self.categories = np.array([r[1] for r in rows], dtype=np.int64)
+        self.prices = np.array([float(r[2]) for r in rows], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def positions(self, product_ids):
+        """Позиции товаров по id; несуществующие (удалённые) отбрасываются"""
+        import numpy as np
+
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        found = np.searchsorted(self.ids, product_ids)
+        found = np.clip(found, 0, max(len(self.ids) - 1, 0))
+        return found[self.ids[found] == product_ids] if len(self.ids) else found[:0]
+
+
+def incidence(catalog, pairs):
+    """Бинарная матрица группа × товар из пар (id группы, id товара): заказы или пользователи"""
+    import numpy as np
+    from scipy import sparse
+
+    pairs = np.fromiter(
+        (value for pair in pairs for value in pair), dtype=np.int64,
+    ).reshape(-1, 2)
+    if not len(pairs) or not len(catalog):
+        return sparse.csr_matrix((0, len(catalog)), dtype=np.float32)
+    columns = np.searchsorted(catalog.ids, pairs[:, 1])
+    columns = np.clip(columns, 0, len(catalog.ids) - 1)
+    known = catalog.ids[columns] == pairs[:, 1]
+    groups, rows = np.unique(pairs[known, 0], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns[known])), shape=(len(groups), len(catalog)),
+    )
+    # Один товар дважды в заказе (или повтор строки) — всё равно одно вхождение
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix
+
+
+def cosine(matrix, rows):
+    """Строки rows матрицы косинусного сходства столбцов: |A∩B| / sqrt(|A|·|B|)"""
+    import numpy as np
+    from scipy import sparse
+
+    counts = np.asarray(matrix.sum(axis=0)).ravel()
+    inverse = np.divide(1.0, np.sqrt(counts), out=np.zeros_like(counts, dtype=np.float64), where=counts > 0)
+    columns = matrix.tocsc()
+    co_occurrence = (columns[:, rows].T @ columns).tocsr()
+    return (sparse.diags(inverse[rows]) @ co_occurrence @ sparse.diags(inverse)).tocsr()
+
+
+def proximity(catalog, rows, window):
+    """
+    Одна категория и близкая цена: у каждого товара до window соседей по цене с каждой
+    стороны, вес min(цен)/max(цен), убывающий с расстоянием в списке.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    n = len(catalog)
+    order = np.lexsort((catalog.prices, catalog.categories))
+    sources, targets, scores = [], [], []
+    for offset in range(1, window + 1):
+        left, right = order[:-offset], order[offset:]
+        same = catalog.categories[left] == catalog.categories[right]
+        left, right = left[same], right[same]
+        low = np.minimum(catalog.prices[left], catalog.prices[right])
+        high = np.maximum(catalog.prices[left], catalog.prices[right])
+        score = np.divide(low, high, out=np.ones_like(low), where=high > 0) * (1 - offset / (window + 1))
+        sources += [left, right]
+        targets += [right, left]
+        scores += [score, score]
+    if not sources:
+        return sparse.csr_matrix((len(rows), n))
+    matrix = sparse.csr_matrix(
+        (np.concatenate(scores), (np.concatenate(sources), np.concatenate(targets))), shape=(n, n),
+    )
+    return matrix[rows]
+
+
+def similarity(catalog, rows):
+    """Строки rows итоговой матрицы сходства товар × товар"""
+    weights, _, window = _options()
+    orders = incidence(catalog, OrderItem.objects.values_list('order_id', 'product_id').iterator(chunk_size=10000))
+    wishlists = incidence(catalog, Wishlist.objects.values_list('user_id', 'product_id').iterator(chunk_size=10000))
+    return (
+        weights['orders'] * cosine(orders, rows)
+        + weights['wishlist'] * cosine(wishlists, rows)
+        + weights['category'] * proximity(catalog, rows, window)
+    ).tocsr()
+
+
+def top_neighbors(catalog, scores, rows, k):
+    """[(id товара, [(id соседа, сходство), ...])] — k лучших в строке, без самого товара"""
+    import numpy as np
+
+    result = []
+    for i, row in enumerate(rows):
+        start, end = scores.indptr[i], scores.indptr[i + 1]
+        columns, values = scores.indices[start:end], scores.data[start:end]
+        keep = (columns != row) & (values > 0)
+        columns, values = columns[keep], values[keep]
+        if len(values) > k:
+            best = np.argpartition(-values, k)[:k]
+            columns, values = columns[best], values[best]
+        # Равные оценки — по id соседа, чтобы порядок не менялся от прогона к прогону
+        ordering = np.lexsort((catalog.ids[columns], -values))
+        result.append((
+            int(catalog.ids[row]),
+            [(int(catalog.ids[c]), float(v)) for c, v in zip(columns[ordering], values[ordering])],
+        ))
+    return result
+
+
+def _affected_products(last, catalog):
+    new_products = set(OrderItem.objects.filter(order_id__gt=last.last_order_id).values_list('product_id', flat=True))
+    new_products |= set(Wishlist.objects.filter(id__gt=last.last_wishlist_id).values_list('product_id', flat=True))
+    new_products |= set(Product.objects.filter(id__gt=last.last_product_id).values_list('id', flat=True))
+    return catalog.positions(sorted(new_products))
+
+
+def refresh(full=False, progress=None):
+    """
+    Пересчитывает индекс: полностью (full=True или прогонов ещё не было) или только товары,
+    затронутые новыми заказами, вишлистами и товарами. Возвращает RecommendationRun.
+    """
+    import numpy as np
+
+    started = time.monotonic()
+    last = RecommendationRun.objects.filter(finished_at__isnull=False).order_by('-id').first()
+    full = full or last is None
+    # Водяные знаки — до чтения данных: всё, что появится во время расчёта, возьмёт следующий прогон
+    run = RecommendationRun.objects.create(
+        mode='full' if full else 'incremental',
+        last_order_id=Order.objects.aggregate(m=Max('id'))['m'] or 0,
+        last_wishlist_id=Wishlist.objects.aggregate(m=Max('id'))['m'] or 0,
+        last_product_id=Product.objects.aggregate(m=Max('id'))['m'] or 0,
+    )
+
+    catalog = Catalog()
+    rows = np.arange(len(catalog)) if full else _affected_products(last, catalog)
+    if progress:
+        progress(10, f"Товаров к пересчёту: {len(rows)} из {len(catalog)}")
+
+    neighbors = []
+    if len(rows):
+        _, k, _ = _options()
+        neighbors = top_neighbors(catalog, similarity(catalog, rows), rows, k)
+    if progress:
+        progress(70, f"Сходство посчитано за {time.monotonic() - started:.1f} с")
+
+    written = _write(neighbors, full)
+    run.products_updated = len(rows)
+    run.neighbors_written = written
+    run.finished_at = timezone.now()
+    run.save(update_fields=['products_updated', 'neighbors_written', 'finished_at'])
+    if len(rows):
+        # Фрагменты «Похожих товаров» всех страниц строятся заново
+        bump_version('recommendations', 0)
+    return run
+
+
+def _write(neighbors, full):
+    rows = [
+        ProductNeighbor(product_id=product_id, neighbor_id=neighbor_id, rank=rank, score=score)
+        for product_id, items in neighbors
+        for rank, (neighbor_id, score) in enumerate(items, 1)
+    ]
+    # Одна транзакция: страницы видят либо старых соседей товара, либо новых целиком
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [ADVISORY_LOCK_KEY])
+        if full:
+            ProductNeighbor.objects.all().delete()
+        else:
+            ProductNeighbor.objects.filter(product_id__in=[product_id for product_id, _ in neighbors]).delete()
+        ProductNeighbor.objects.bulk_create(rows, batch_size=5000)
+    return len(rows)
+
+
+def schedule_refresh():
+    """
+    Инкрементальный пересчёт после нового заказа. Пока пересчёт ждёт в очереди, новый
+    не ставится — он и так возьмёт все заказы; заказы во время пересчёта поставят следующий.
+    """
+    from .jobs import enqueue
+    from .models import Job
+
+    if not Job.objects.filter(name='refresh_recommendations', status=Job.STATUS_QUEUED).exists():
+        enqueue('refresh_recommendations')
+
+
+def neighbors(product_id):
+    """Соседи товара по порядку, сходство — в .score; один запрос по индексу (product_id, rank)"""
+    return (
+        Product.objects.filter(neighbor_of__product_id=product_id)
+        .annotate(score=F('neighbor_of__score'))
+        .order_by('neighbor_of__rank')
+    )
+
+
+def similar_products(product, limit=4):
+    """
+    Соседи из индекса одним запросом; пока индекс для товара не построен — товары той же
+    категории с лучшим рейтингом (второй запрос только в этом случае).
+    """
+    found = list(neighbors(product.id)[:limit])
+    if found:
+        return found
+    return list(
+        Product.objects.filter(category_id=product.category_id).exclude(id=product.id)
+        .order_by('-average_rating', 'id')[:limit]
+    )
@@ -0,0 +1,255 @@
+# main/restore.py
+"""
+Восстановление бэкапа в несколько этапов:
+
+1. SHA-256 файла сверяется с записанным при создании бэкапа;
+2. pg_restore -j N во временную БД <рабочая>_restore_<id> с замером времени по таблицам;
+3. строки и контрольные суммы таблиц временной БД сверяются с манифестом бэкапа
+   и оглавлением дампа (pg_restore --list);
+4. только при успешной проверке временная БД переименовывается в рабочую,
+   прежняя остаётся как <рабочая>_old_<id> для отката.
+"""
+import re
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import connection
+from django.utils import timezone
+
+from .backups import backup_checksum, connection_args, pg_env, raw_connection, run_with_progress, table_manifest
+from .models import RestoreRun
+
+# pg_restore --list: «3001; 0 16420 TABLE DATA public main_product admin»
+TOC_TABLE_DATA_RE = re.compile(r'^\d+; \d+ \d+ TABLE DATA (\S+) (\S+) ')
+# pg_restore --verbose -j N: «launching item 3001 TABLE DATA public main_product»
+ITEM_RE = re.compile(r'(launching|finished) item \d+ TABLE DATA (\S+) (\S+)')
+# pg_restore --verbose в один поток: «processing data for table "public.main_product"»
+PROCESSING_RE = re.compile(r'processing data for table "([^"]+)"')
+
+
+class RestoreError(Exception):
+    pass
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def dump_tables(path):
+    """Таблицы, данные которых есть в оглавлении дампа"""
+    result = subprocess.run(
+        ["pg_restore", "--list", path], env=pg_env(), check=True, capture_output=True, text=True,
+    )
+    tables = set()
+    for line in result.stdout.splitlines():
+        match = TOC_TABLE_DATA_RE.match(line)
+        if match:
+            tables.add(f"{match.group(1)}.{match.group(2)}")
+    return tables
+
+
+class TableTimer:
+    """Время загрузки каждой таблицы по строкам --verbose (и для -j N, и для одного потока)"""
+
+    def __init__(self):
+        self.started = {}
+        self.timings = {}
+        self.current = None
+
+    def __call__(self, line):
+        now = time.monotonic()
+        match = ITEM_RE.search(line)
+        if match:
+            table = f"{match.group(2)}.{match.group(3)}"
+            if match.group(1) == 'launching':
+                self.started[table] = now
+            elif table in self.started:
+                self.timings[table] = round(now - self.started.pop(table), 3)
+            return
+
+        # В один поток таблица грузится до следующего элемента оглавления
+        if self.current and line.startswith('pg_restore: '):
+            table, began = self.current
+            self.timings[table] = round(now - began, 3)
+            self.current = None
+        match = PROCESSING_RE.search(line)
+        if match:
+            self.current = (match.group(1), now)
+
+    def finish(self):
+        if self.current:
+            table, began = self.current
+            self.timings[table] = round(time.monotonic() - began, 3)
+            self.current = None
+        return self.timings
+
+
+def _maintenance(sql_statements):
+    """DDL над базами (CREATE/DROP/ALTER DATABASE) — из служебной БД, вне транзакции"""
+    conn = raw_connection(getattr(settings, 'RESTORE_MAINTENANCE_DB', 'postgres'))
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            for sql, params in sql_statements:
+                cursor.execute(sql, params)
+    finally:
+        conn.close()
+
+
+def _drop_database(name):
+    _maintenance([(f"DROP DATABASE IF EXISTS {_quote(name)} WITH (FORCE)", None)])
+
+
+def verify(run, manifest, toc_tables):
+    """Сверяет временную БД с манифестом бэкапа; результат — в run.verification"""
+    conn = raw_connection(run.scratch_database)
+    try:
+        with conn.cursor() as cursor:
+            actual = table_manifest(cursor)
+    finally:
+        conn.close()
+
+    report, ok = {}, True
+    for table, expected in manifest.items():
+        got = actual.get(table)
+        entry = {
+            'expected_rows': expected['rows'],
+            'actual_rows': got['rows'] if got else None,
+            'checksum_ok': bool(got) and got['checksum'] == expected['checksum'],
+            'in_toc': table in toc_tables,
+        }
+        # Пустые таблицы могут не иметь TABLE DATA в оглавлении
+        entry['ok'] = entry['checksum_ok'] and entry['actual_rows'] == entry['expected_rows'] and (
+            entry['in_toc'] or expected['rows'] == 0
+        )
+        ok = ok and entry['ok']
+        report[table] = entry
+    run.verification = report
+    return ok
+
+
+def _swap(run, live):
+    """
+    Временная БД становится рабочей; текущие подключения к рабочей обрываются.
+
+    Перед обрывом новые подключения к рабочей БД запрещаются: пулы воркеров иначе
+    переподключились бы сразу, и RENAME упал бы с «is being accessed by other users».
+    Если второе переименование не прошло, прежняя БД возвращается под рабочее имя
+    и подключения к ней снова разрешаются. Прежняя БД после подмены остаётся закрытой
+    для подключений — для отката её переименовывают обратно и делают ALLOW_CONNECTIONS true.
+    """
+    previous = f"{live}_old_{run.id}"
+    connection.close()
+    _maintenance([(f"ALTER DATABASE {_quote(live)} ALLOW_CONNECTIONS false", None)])
+    renamed = False
+    try:
+        _maintenance([
+            ("SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = %s AND pid <> pg_backend_pid()", [live]),
+            (f"ALTER DATABASE {_quote(live)} RENAME TO {_quote(previous)}", None),
+        ])
+        renamed = True
+        _maintenance([(f"ALTER DATABASE {_quote(run.scratch_database)} RENAME TO {_quote(live)}", None)])
+    except Exception:
+        _maintenance([
+            *([(f"ALTER DATABASE {_quote(previous)} RENAME TO {_quote(live)}", None)] if renamed else []),
+            (f"ALTER DATABASE {_quote(live)} ALLOW_CONNECTIONS true", None),
+        ])
+        raise
+    return previous
+
+
+def _carry_over(*objects):
+    """
+    После подмены БД в ней состояние на момент бэкапа — записи о самом восстановлении
+    и его задаче переносим, а последовательности id подтягиваем, чтобы не было конфликтов.
+    """
+    for obj in objects:
+        obj.save(force_insert=not type(obj).objects.filter(pk=obj.pk).exists())
+    models = {type(obj) for obj in objects}
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), list(models)):
+            cursor.execute(sql)
+
+
+def run_restore(backup, jobs=None, swap=True, progress=None, job=None):
+    """
+    Полный цикл восстановления; возвращает RestoreRun.
+    swap=False — только проверка бэкапа: временная БД удаляется после сверки.
+    job — запись Job, которую нужно перенести в новую рабочую БД вместе с RestoreRun.
+    """
+    jobs = max(1, int(jobs or getattr(settings, 'RESTORE_JOBS', 4)))
+    live = settings.DATABASES["default"]["NAME"]
+    run = RestoreRun.objects.create(backup=backup, jobs=jobs, scratch_database='')
+    run.scratch_database = f"{live}_restore_{run.id}"
+    run.save(update_fields=['scratch_database'])
+
+    def report(percent, message):
+        if progress:
+            progress(percent, message)
+
+    created = False
+    try:
+        if not backup.manifest:
+            raise RestoreError("У бэкапа нет манифеста — проверить восстановление не с чем")
+        report(0, "Проверка SHA-256 файла")
+        if backup.sha256 and backup_checksum(backup) != backup.sha256:
+            raise RestoreError("SHA-256 файла не совпадает с записанным при создании бэкапа")
+
+        path = backup.file.path
+        toc_tables = dump_tables(path)
+
+        _maintenance([(f"CREATE DATABASE {_quote(run.scratch_database)} TEMPLATE template0", None)])
+        created = True
+
+        timer = TableTimer()
+        # Прогресс восстановления — 5..85%, остальное — проверка и подмена
+        run_with_progress(
+            [
+                "pg_restore", *connection_args(),
+                "--dbname", run.scratch_database,
+                "--jobs", str(jobs),
+                "--no-owner",
+                "--exit-on-error",
+                "--verbose",
+                path,
+            ],
+            "finished item" if jobs > 1 else "processing data for table",
+            len(toc_tables),
+            lambda percent, message: report(5 + percent * 80 // 100, message),
+            on_line=timer,
+        )
+        run.table_timings = timer.finish()
+        run.save(update_fields=['table_timings'])
+
+        report(85, "Сверка с манифестом")
+        if not verify(run, backup.manifest, toc_tables):
+            failed = sorted(t for t, entry in run.verification.items() if not entry['ok'])
+            raise RestoreError(f"Проверка не пройдена: {', '.join(failed[:10])}")
+        run.status = 'verified'
+        run.save(update_fields=['status', 'verification'])
+
+        if not swap:
+            _drop_database(run.scratch_database)
+            created = False
+        else:
+            report(95, "Подмена рабочей БД")
+            run.previous_database = _swap(run, live)
+            created = False
+            run.status = 'swapped'
+    except Exception as e:
+        run.status = 'failed'
+        run.error = str(e) if not isinstance(e, subprocess.CalledProcessError) else (e.stderr or str(e))
+        if created:
+            _drop_database(run.scratch_database)
+        run.finished_at = timezone.now()
+        run.save()
+        raise
+
+    run.finished_at = timezone.now()
+    if run.status == 'swapped':
+        _carry_over(run, *([job] if job is not None else []))
+    else:
+        run.save()
+    return run
@@ -0,0 +1,35 @@
+# main/search.py
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import F, Q
+
+from .models import Product
+
+SEARCH_CONFIG = 'russian'
+# Глубже этой страницы поиск не листаем: релевантные результаты — в начале выдачи
+MAX_SEARCH_PAGE = 50
+
+
+def search_products(text, queryset=None):
+    """
+    Товары по запросу `text`, отсортированные по релевантности.
+    Полнотекстовое совпадение по name/description (GIN по search_vector)
+    объединяется с триграммным сходством слов названия (GIN gin_trgm_ops) — для опечаток.
+    """
+    if queryset is None:
+        queryset = Product.objects.all()
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    return (
+        queryset
+        .filter(Q(search_vector=query) | Q(name__trigram_word_similar=text))
+        .annotate(rank=SearchRank(F('search_vector'), query) + TrigramWordSimilarity(text, 'name'))
+        .order_by('-rank', 'id')
+    )
+
+
+def search_page(queryset, page=1, per_page=12):
+    """Страница ранжированной выдачи без COUNT(*): (товары, есть ли следующая страница)"""
+    page = min(max(page, 1), MAX_SEARCH_PAGE)
+    offset = (page - 1) * per_page
+    rows = list(queryset[offset:offset + per_page + 1])
+    has_next = len(rows) > per_page and page < MAX_SEARCH_PAGE
+    return rows[:per_page], has_next
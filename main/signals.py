@@ -0,0 +1,42 @@
+# main/signals.py
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import bump_version, invalidate_product
+from .images import current_variants, schedule
+from .models import Game, Category, Product, Review
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, instance, **kwargs):
+    invalidate_product(instance.id, instance.game_id)
+
+
+@receiver([post_save, post_delete], sender=Review)
+def review_changed(sender, instance, **kwargs):
+    # Отзыв меняет рейтинг товара (триггер), который виден и в карточке каталога.
+    # Правка только текста рейтинг не трогает — updated_at товара (ETag страницы) обновляем явно
+    Product.objects.filter(id=instance.product_id).update(updated_at=timezone.now())
+    game_id = Product.objects.filter(id=instance.product_id).values_list('game_id', flat=True).first()
+    invalidate_product(instance.product_id, game_id)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, instance, **kwargs):
+    bump_version('game', instance.game_id)
+
+
+@receiver([post_save, post_delete], sender=Game)
+def game_changed(sender, instance, **kwargs):
+    bump_version('game', instance.id)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Game)
+def image_saved(sender, instance, **kwargs):
+    # Новое изображение — копии готовятся в фоне, после коммита (иначе обработчик не увидит строку)
+    image = instance.logo if sender is Game else instance.image
+    if image and current_variants(instance) is None:
+        transaction.on_commit(lambda: schedule(instance))
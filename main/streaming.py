@@ -0,0 +1,57 @@
+# main/streaming.py
+"""
+Потоковые ответы, которые и под ASGI не собираются в память.
+
+ASGI-обработчик Django читает синхронный итератор StreamingHttpResponse (и FileResponse)
+целиком — sync_to_async(list) — и лишь затем отправляет; асинхронный отдаёт кусками.
+Под ASGI (ASYNC_VIEWS) итератор оборачивается: каждый кусок берётся в потоке запроса —
+там же, где его соединение с БД (курсор выгрузки товаров). Под WSGI всё как прежде.
+"""
+import os
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+_DONE = object()
+
+
+def streaming_content(iterable):
+    """Содержимое для StreamingHttpResponse: под ASGI — асинхронный итератор"""
+    if not getattr(settings, 'ASYNC_VIEWS', False):
+        return iterable
+    return _async_chunks(iter(iterable))
+
+
+async def _async_chunks(iterator):
+    take = sync_to_async(next)
+    try:
+        while (chunk := await take(iterator, _DONE)) is not _DONE:
+            yield chunk
+    finally:
+        # Клиент оборвал загрузку — генератор закрывает файл/курсор в том же потоке
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def _file_chunks(path, block_size):
+    with open(path, 'rb') as f:
+        while chunk := f.read(block_size):
+            yield chunk
+
+
+def file_response(path, block_size):
+    """Файл на скачивание: FileResponse под WSGI (wsgi.file_wrapper), поток кусками под ASGI"""
+    filename = os.path.basename(path)
+    if not getattr(settings, 'ASYNC_VIEWS', False):
+        response = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename)
+        response.block_size = block_size
+        return response
+    response = StreamingHttpResponse(
+        streaming_content(_file_chunks(path, block_size)), content_type='application/octet-stream',
+    )
+    response['Content-Length'] = os.path.getsize(path)
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
@@ -0,0 +1,81 @@
+# main/tasks.py
+"""Фоновые задачи проекта (см. main/jobs.py)"""
+from django.core.files.storage import default_storage
+from django.db import connection
+
+from .analytics import refresh_all
+from .backups import create_backup
+from .jobs import task
+from .models import BackupFile
+from .images import generate
+from .product_io import import_products
+from .recommendations import refresh as refresh_recommendations
+from .restore import run_restore
+
+
+@task('backup')
+def backup_task(job, compression=None, jobs=None):
+    job.progress(0, 'pg_dump запущен')
+    backup = create_backup(progress=job.progress, compression=compression, jobs=jobs)
+    return {
+        'backup_id': backup.id,
+        'file': backup.file.name,
+        'size_bytes': backup.size_bytes,
+        'sha256': backup.sha256,
+        'duration_seconds': backup.duration.total_seconds(),
+    }
+
+
+@task('restore')
+def restore_task(job, backup_id, jobs=None, swap=True):
+    backup = BackupFile.objects.get(id=backup_id)
+    run = run_restore(backup, jobs=jobs, swap=swap, progress=job.progress, job=job.job)
+    return {
+        'backup_id': backup_id,
+        'restore_run_id': run.id,
+        'status': run.status,
+        'previous_database': run.previous_database,
+        'duration_seconds': run.duration.total_seconds(),
+        'slowest_tables': sorted(run.table_timings.items(), key=lambda item: -item[1])[:5],
+    }
+
+
+@task('cleanup_orphaned_items')
+def cleanup_orphaned_items_task(job):
+    with connection.cursor() as cursor:
+        cursor.execute("CALL cleanup_orphaned_items()")
+    return None
+
+
+@task('import_products')
+def import_products_task(job, path, fmt, batch_size=None):
+    job.progress(0, f'Импорт {path}')
+    with default_storage.open(path, 'rb') as f:
+        result = import_products(f, fmt, batch_size=batch_size, progress=job.progress, size=f.size)
+    default_storage.delete(path)
+    return result
+
+
+@task('generate_thumbnails')
+def generate_thumbnails_task(job, model, pk, force=False):
+    return {'created': generate(model, pk, force=force)}
+
+
+@task('refresh_recommendations')
+def refresh_recommendations_task(job, full=False):
+    run = refresh_recommendations(full=full, progress=job.progress)
+    return {
+        'run_id': run.id,
+        'mode': run.mode,
+        'products_updated': run.products_updated,
+        'neighbors_written': run.neighbors_written,
+        'duration_seconds': run.duration.total_seconds(),
+    }
+
+
+@task('refresh_analytics')
+def refresh_analytics_task(job, views=None):
+    return {
+        r.view_name: {'rows': r.row_count, 'duration_seconds': r.duration.total_seconds()}
+        for r in refresh_all(views)
+    }
@@ -0,0 +1,21 @@
+# main/templatetags/thumbnails.py
+"""
+{% load thumbnails %}
+<img src="{{ product|thumbnail:320 }}" srcset="{{ product|srcset }}" sizes="…">
+"""
+from django import template
+
+from main import images
+
+register = template.Library()
+
+
+@register.filter
+def thumbnail(instance, width):
+    """URL копии изображения товара/логотипа игры шириной не меньше width (или оригинала)"""
+    return images.thumbnail_url(instance, int(width))
+
+
+@register.filter
+def srcset(instance):
+    return images.srcset(instance)
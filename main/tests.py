@@ -1,3 +1,1217 @@
-from django.test import TestCase
+import io
+import os
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser, User
+from django.http import QueryDict
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.db.models import F, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+
+from .basket_ops import add_to_basket, checkout, EmptyBasket
+from .counters import UserCounters
+from .models import (
+    Game, Category, Product, Basket, Wishlist, UserCartSummary, Order, OrderItem, Review, Job, BackupFile,
+    RestoreRun, ProductNeighbor, ActiveOrderView, TopSellingProductView, TopWishlistView, AnalyticsRefresh,
+)
+from .pagination import KeysetPaginator, SORT_ORDERINGS
+from .queries import games_with_discounts
+from .search import search_products
+from .facets import compute_facets, normalize_filters
+from .cache import fragment_cache, apply_discount_to_product
+from .query_budget import QueryBudgetTestMixin
+from .jobs import task, enqueue, claim_next, run_job, UnknownTask
+from .backups import BackupError, parse_compression, apply_retention, backup_checksum, stream_directory_tar, table_manifest
+from .restore import RestoreError, TableTimer, _swap, run_restore
+from .product_io import import_products, stream_export
+from .images import generate, schedule, srcset, thumbnail_url
+from .pool_metrics import pop_stats
+from .loaders import DataLoader, Fanout, request_loader
+from .recommendations import refresh as refresh_recommendations, schedule_refresh, similar_products
+from .analytics import due_views, refresh_all
+from .conditional import in_wishlist
+
+
+def read_streaming(response):
+    """Содержимое потокового ответа — и синхронного, и асинхронного (как его читает ASGI)"""
+    if not response.is_async:
+        return b''.join(response.streaming_content)
+
+    async def collect():
+        return b''.join([chunk async for chunk in response.streaming_content])
+    return async_to_sync(collect)()
+
+
+def make_catalog(games_count, products_per_game=6, discounted_per_game=5):
+    games = Game.objects.bulk_create(Game(name=f'Game {i}') for i in range(games_count))
+    categories = Category.objects.bulk_create(Category(name=f'Cat {g.id}', game=g) for g in games)
+    Product.objects.bulk_create(
+        Product(
+            name=f'Product {g.id}-{j}',
+            description='',
+            price=100,
+            discount=10 if j < discounted_per_game else None,
+            category=c,
+            game=g,
+        )
+        for g, c in zip(games, categories)
+        for j in range(products_per_game)
+    )
+    return games
+
+
+class IndexQueryCountTests(TestCase):
+    def test_games_with_discounts_is_single_query(self):
+        for games_count in (10, 100, 1000):
+            with self.subTest(games=games_count):
+                Game.objects.all().delete()
+                make_catalog(games_count)
+
+                with self.assertNumQueries(1):
+                    result = games_with_discounts(limit=4)
+
+                self.assertEqual(len(result), games_count)
+                self.assertTrue(all(len(entry['products']) == 4 for entry in result))
+
+    def test_index_view_query_count_does_not_grow(self):
+        for games_count in (10, 100, 1000):
+            with self.subTest(games=games_count):
+                Game.objects.all().delete()
+                make_catalog(games_count)
+
+                # 1 запрос — скидки по всем играм, 1 — список игр для навигации
+                with self.assertNumQueries(2):
+                    response = self.client.get(reverse('index'))
+                self.assertEqual(response.status_code, 200)
+
+    def test_games_without_discounts_are_skipped(self):
+        games = make_catalog(3, discounted_per_game=0)
+        Product.objects.filter(game=games[1]).update(discount=20)
+
+        result = games_with_discounts()
+
+        self.assertEqual([entry['game'].id for entry in result], [games[1].id])
+
+
+class UserCountersTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pass')
+        game = make_catalog(1, products_per_game=2)[0]
+        products = list(Product.objects.filter(game=game))
+        Basket.objects.create(user=self.user, product=products[0], quantity=3)
+        Wishlist.objects.create(user=self.user, product=products[1])
+
+    def test_both_counts_are_fetched_in_one_query(self):
+        counters = UserCounters(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(counters.basket_count, 3)
+            self.assertEqual(counters.wishlist_count, 1)
+
+    def test_anonymous_user_does_not_hit_database(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(UserCounters(AnonymousUser()).basket_count, 0)
+
+    def test_adjust_updates_loaded_values_only(self):
+        counters = UserCounters(self.user)
+        counters.adjust(basket=5)
+        self.assertFalse(counters.loaded)
+
+        self.assertEqual(counters.basket_count, 3)
+        counters.adjust(basket=1, wishlist=-1)
+        with self.assertNumQueries(0):
+            self.assertEqual(counters.basket_count, 4)
+            self.assertEqual(counters.wishlist_count, 0)
+
+    def test_page_without_counters_in_template_skips_query(self):
+        # Анонимная главная не читает счётчики — лишних запросов нет
+        with self.assertNumQueries(2):
+            self.client.get(reverse('index'))
+
+
+class UserCartSummaryTriggerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pass')
+        game = make_catalog(1, products_per_game=2, discounted_per_game=0)[0]
+        self.first, self.second = Product.objects.filter(game=game).order_by('id')
+
+    def summary(self):
+        return UserCartSummary.objects.get(user=self.user)
+
+    def test_basket_and_wishlist_changes_are_tracked(self):
+        item = Basket.objects.create(user=self.user, product=self.first, quantity=2)
+        Basket.objects.create(user=self.user, product=self.second, quantity=1)
+        Wishlist.objects.create(user=self.user, product=self.first)
+        self.assertEqual(
+            (self.summary().basket_count, self.summary().wishlist_count, self.summary().basket_total),
+            (3, 1, Decimal('300.00')),
+        )
+
+        item.quantity = 5
+        item.save()
+        self.assertEqual(self.summary().basket_count, 6)
+
+        item.delete()
+        Wishlist.objects.filter(user=self.user).delete()
+        self.assertEqual(
+            (self.summary().basket_count, self.summary().wishlist_count, self.summary().basket_total),
+            (1, 0, Decimal('100.00')),
+        )
+
+    def test_price_change_updates_basket_total(self):
+        Basket.objects.create(user=self.user, product=self.first, quantity=3)
+        Product.objects.filter(id=self.first.id).update(price=50)
+        self.assertEqual(self.summary().basket_total, Decimal('150.00'))
+
+    def test_rebuild_command_fixes_drift(self):
+        Basket.objects.create(user=self.user, product=self.first, quantity=2)
+        UserCartSummary.objects.filter(user=self.user).update(basket_count=99)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_cart_summary', '--check', stdout=StringIO())
+        call_command('rebuild_cart_summary', stdout=StringIO())
+        call_command('rebuild_cart_summary', '--check', stdout=StringIO())
+        self.assertEqual(self.summary().basket_count, 2)
+
+
+class ProductRatingTriggerTests(TestCase):
+    def setUp(self):
+        game = make_catalog(1, products_per_game=2, discounted_per_game=0)[0]
+        self.product, self.other = Product.objects.filter(game=game).order_by('id')
+        self.users = [User.objects.create_user(f'buyer{i}', password='pass') for i in range(2)]
+        for user in self.users:
+            # Отзыв можно оставить только после покупки (trg_prevent_fake_review)
+            order = Order.objects.create(user=user, total_price=100)
+            OrderItem.objects.create(order=order, product=self.product, quantity=1, price=100)
+
+    def test_review_changes_update_only_affected_product(self):
+        first = Review.objects.create(product=self.product, user=self.users[0], rating=5, comment='ok')
+        Review.objects.create(product=self.product, user=self.users[1], rating=2, comment='ok')
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (7, 2))
+        self.assertEqual(self.product.average_rating, Decimal('3.50'))
+
+        first.rating = 3
+        first.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.average_rating, Decimal('2.50'))
+
+        Review.objects.filter(product=self.product).delete()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.average_rating), (0, Decimal('0.00')))
+
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.rating_count, 0)
+
+    def test_save_of_stale_product_keeps_new_ratings(self):
+        stale = Product.objects.get(id=self.product.id)
+        Review.objects.create(product=self.product, user=self.users[0], rating=5, comment='ok')
+
+        stale.name = 'Новое имя'
+        stale.save()
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.rating_count), ('Новое имя', 1))
+        self.assertEqual(self.product.average_rating, Decimal('5.00'))
+
+    def test_recalculate_command_repairs_aggregates(self):
+        Review.objects.create(product=self.product, user=self.users[0], rating=4, comment='ok')
+        Product.objects.filter(id=self.product.id).update(rating_sum=0, rating_count=0, average_rating=0)
+
+        call_command('recalculate_ratings', stdout=StringIO())
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.average_rating, Decimal('4.00'))
+
+
+class IndexAdvisorCommandTests(TestCase):
+    def test_reports_every_hot_query(self):
+        game = make_catalog(1)[0]
+        Category.objects.create(name='Другая', game=game)
+        out = StringIO()
+
+        call_command('index_advisor', '--game', str(game.id), stdout=out)
+
+        for name in ('index_discounts', 'catalog_filter', 'basket_items', 'wishlist_items'):
+            self.assertIn(name, out.getvalue())
+
+    def test_unknown_query_is_rejected(self):
+        with self.assertRaises(CommandError):
+            call_command('index_advisor', '--query', 'nope', stdout=StringIO())
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.game = make_catalog(1, products_per_game=0)[0]
+        category = Category.objects.get(game=self.game)
+        # Повторяющиеся цены проверяют, что id делает ключ уникальным
+        Product.objects.bulk_create(
+            Product(name=f'P{i}', description='', price=i % 7, category=category, game=self.game)
+            for i in range(50)
+        )
+
+    def walk(self, sort):
+        paginator = KeysetPaginator(Product.objects.filter(game=self.game), 12, SORT_ORDERINGS[sort])
+        pages = [paginator.get_page()]
+        while pages[-1].has_next:
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        return paginator, pages
+
+    def test_forward_walk_matches_offset_ordering(self):
+        for sort in SORT_ORDERINGS:
+            with self.subTest(sort=sort):
+                _, pages = self.walk(sort)
+                walked = [p.id for page in pages for p in page]
+                expected = list(
+                    Product.objects.filter(game=self.game)
+                    .order_by(*SORT_ORDERINGS[sort]).values_list('id', flat=True)
+                )
+                self.assertEqual(walked, expected)
+                self.assertFalse(pages[0].has_previous)
+
+    def test_previous_cursor_returns_same_page(self):
+        paginator, pages = self.walk('price_desc')
+        back = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual([p.id for p in back], [p.id for p in pages[1]])
+        self.assertTrue(back.has_next)
+        self.assertTrue(back.has_previous)
+
+    def test_catalog_view_ignores_broken_cursor(self):
+        response = self.client.get(reverse('catalog', args=[self.game.id]), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['products']), 12)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        game = make_catalog(1, products_per_game=0)[0]
+        category = Category.objects.get(game=game)
+        self.sword = Product.objects.create(
+            name='Огненный меч', description='Легендарное оружие', price=100, category=category, game=game,
+        )
+        self.shield = Product.objects.create(
+            name='Ледяной щит', description='Подходит к огненному мечу', price=100, category=category, game=game,
+        )
+
+    def test_name_match_ranks_above_description_match(self):
+        self.assertEqual(list(search_products('меч')), [self.sword, self.shield])
+
+    def test_typo_is_tolerated(self):
+        self.assertIn(self.shield, search_products('ледяонй'))
+
+    def test_search_vector_follows_name_changes(self):
+        self.sword.name = 'Стальной топор'
+        self.sword.save()
+        self.assertNotIn(self.sword, search_products('меч'))
+
+
+class CatalogFacetsTests(TestCase):
+    def setUp(self):
+        self.game = make_catalog(1, products_per_game=0)[0]
+        self.cheap = Category.objects.get(game=self.game)
+        self.rare = Category.objects.create(name='Rare', game=self.game)
+        for price in (50, 150, 150):
+            Product.objects.create(name='c', description='', price=price, category=self.cheap, game=self.game)
+        Product.objects.create(name='r', description='', price=7000, category=self.rare, game=self.game)
+
+    def facets(self, query):
+        return compute_facets(self.game.id, normalize_filters(QueryDict(query)))
+
+    def test_counts_in_single_query(self):
+        with self.assertNumQueries(1):
+            facets = self.facets('')
+        self.assertEqual(facets['total'], 4)
+        self.assertEqual(facets['categories'], {self.cheap.id: 3, self.rare.id: 1})
+        self.assertEqual([b['count'] for b in facets['price_buckets']], [1, 2, 0, 0, 1, 0])
+
+    def test_each_facet_ignores_its_own_filter(self):
+        facets = self.facets(f'category={self.rare.id}&max_price=200')
+        # Категории — с учётом цены, гистограмма — с учётом категории
+        self.assertEqual(facets['categories'], {self.cheap.id: 3, self.rare.id: 0})
+        self.assertEqual([b['count'] for b in facets['price_buckets']], [0, 0, 0, 0, 1, 0])
+        self.assertEqual(facets['total'], 0)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        fragment_cache().clear()
+        self.game = make_catalog(1, products_per_game=3, discounted_per_game=0)[0]
+        self.product = Product.objects.filter(game=self.game).first()
+
+    def test_product_page_is_served_from_cache_until_product_changes(self):
+        url = reverse('product', args=[self.product.id])
+        self.client.get(url)
+        # Остаётся только список игр для навигации
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+        self.product.name = 'Переименован'
+        self.product.save()
+        response = self.client.get(url)
+        self.assertContains(response, 'Переименован')
+
+    def test_catalog_is_invalidated_by_stored_procedure_price_change(self):
+        url = reverse('catalog', args=[self.game.id])
+        self.client.get(url)
+        # Остаётся только список игр для навигации
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+        apply_discount_to_product(self.product.id, 50)
+        response = self.client.get(url)
+        self.assertContains(response, '-50%')
+
+    def test_catalog_pages_are_cached_separately(self):
+        url = reverse('catalog', args=[self.game.id])
+        first = self.client.get(url, {'sort': 'price_asc'})
+        other = self.client.get(url, {'sort': 'price_asc', 'min_price': 1000})
+        self.assertEqual(len(first.context['products']), 3)
+        self.assertEqual(len(other.context['products']), 0)
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Число запросов на страницах со списками не зависит от количества позиций"""
+
+    def setUp(self):
+        fragment_cache().clear()
+        self.user = User.objects.create_user('buyer', password='pass')
+        self.staff = User.objects.create_user('staff', password='pass', is_staff=True)
+        make_catalog(2, products_per_game=10)
+        self.products = list(Product.objects.order_by('id'))
+
+    def fill(self, count):
+        Basket.objects.filter(user=self.user).delete()
+        Wishlist.objects.filter(user=self.user).delete()
+        for product in self.products[:count]:
+            Basket.objects.create(user=self.user, product=product, quantity=1)
+            Wishlist.objects.create(user=self.user, product=product)
+        order = Order.objects.create(user=self.user, total_price=0)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=p, quantity=1, price=p.price) for p in self.products[:count]
+        )
+        return order
+
+    def query_counts(self, url_for):
+        counts = []
+        for count in (1, 10):
+            order = self.fill(count)
+            response = self.assertQueryBudget(url_for(order))
+            counts.append(response.query_count)
+        return counts
+
+    def test_basket(self):
+        self.client.force_login(self.user)
+        small, large = self.query_counts(lambda order: reverse('basket'))
+        self.assertEqual(small, large)
+
+    def test_wishlist(self):
+        self.client.force_login(self.user)
+        small, large = self.query_counts(lambda order: reverse('wishlist'))
+        self.assertEqual(small, large)
+
+    def test_order_detail(self):
+        self.client.force_login(self.staff)
+        small, large = self.query_counts(lambda order: reverse('order_detail', args=[order.id]))
+        self.assertEqual(small, large)
+
+    def test_product_page(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('product', args=[self.products[0].id]))
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        fragment_cache().clear()
+        self.game = make_catalog(1, products_per_game=3)[0]
+        self.product = Product.objects.filter(game=self.game).first()
+
+    def test_catalog_not_modified_skips_rendering(self):
+        url = reverse('catalog', args=[self.game.id])
+        etag = self.client.get(url)['ETag']
+        # Только запрос состояния игры — ни контекста, ни шаблона
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_stored_procedure_change_updates_etag(self):
+        url = reverse('catalog', args=[self.game.id])
+        first = self.client.get(url)
+        apply_discount_to_product(self.product.id, 50)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+    def test_if_modified_since_for_anonymous(self):
+        url = reverse('product', args=[self.product.id])
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_basket_change_updates_product_etag(self):
+        user = User.objects.create_user('buyer', password='pass')
+        self.client.force_login(user)
+        url = reverse('product', args=[self.product.id])
+        etag = self.client.get(url)['ETag']
+        Basket.objects.create(user=user, product=self.product, quantity=1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class BulkBasketTests(TestCase):
+    def setUp(self):
+        make_catalog(1, products_per_game=4)
+        self.products = list(Product.objects.order_by('id'))
+        self.user = User.objects.create_user('buyer', password='pass')
+        self.client.force_login(self.user)
+
+    def post(self, items):
+        return self.client.post(reverse('basket_bulk'), {'items': items}, content_type='application/json')
+
+    def test_add_update_and_remove_in_one_request(self):
+        a, b, c = self.products[:3]
+        Basket.objects.create(user=self.user, product=a, quantity=1)
+        Basket.objects.create(user=self.user, product=b, quantity=1)
+
+        response = self.post([
+            {'product_id': a.id, 'quantity': 5},
+            {'product_id': b.id, 'quantity': 0},
+            {'product_id': c.id, 'quantity': 2},
+        ])
+
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(
+            dict(Basket.objects.filter(user=self.user).values_list('product_id', 'quantity')),
+            {a.id: 5, c.id: 2},
+        )
+        summary = UserCartSummary.objects.get(user=self.user)
+        self.assertEqual(data['basket_items_count'], summary.basket_count)
+        self.assertEqual(Decimal(data['total']), summary.basket_total)
+
+    def test_last_operation_for_product_wins(self):
+        a = self.products[0]
+        self.post([{'product_id': a.id, 'quantity': 3}, {'product_id': a.id, 'quantity': 1}])
+        self.assertEqual(Basket.objects.get(user=self.user, product=a).quantity, 1)
+
+    def test_invalid_payload_changes_nothing(self):
+        response = self.post([{'product_id': self.products[0].id, 'quantity': -1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Basket.objects.filter(user=self.user).exists())
+
+    def test_out_of_range_values_are_rejected(self):
+        for item in (
+            {'product_id': self.products[0].id, 'quantity': 3_000_000_000},
+            {'product_id': self.products[0].id, 'quantity': 1000},
+            {'product_id': 2 ** 63, 'quantity': 1},
+            {'product_id': 0, 'quantity': 1},
+        ):
+            with self.subTest(item=item):
+                self.assertEqual(self.post([item]).status_code, 400)
+        self.assertFalse(Basket.objects.filter(user=self.user).exists())
+
+    def test_unknown_products_are_ignored(self):
+        response = self.post([{'product_id': 10 ** 9, 'quantity': 1}])
+        self.assertEqual(response.json()['basket_items_count'], 0)
+
+
+class ConcurrentAddToBasketTests(TransactionTestCase):
+    """Сотни параллельных добавлений с отдельными соединениями к PostgreSQL"""
+    ADDS_PER_PRODUCT = 100
+    WORKERS = 16
+
+    def setUp(self):
+        make_catalog(1, products_per_game=3)
+        self.products = list(Product.objects.order_by('id'))
+        self.user = User.objects.create_user('buyer', password='pass')
+
+    def add(self, product_id):
+        try:
+            return add_to_basket(self.user.id, product_id)
+        finally:
+            connection.close()
+
+    def test_parallel_adds_keep_exact_quantities(self):
+        product_ids = [p.id for p in self.products] * self.ADDS_PER_PRODUCT
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            results = list(pool.map(self.add, product_ids))
+
+        self.assertNotIn(None, results)
+        quantities = dict(Basket.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {p.id: self.ADDS_PER_PRODUCT for p in self.products})
+        # Каждое добавление вернуло своё значение счётчика — без потерянных обновлений
+        self.assertEqual(len(set(results)), self.ADDS_PER_PRODUCT)
+        summary = UserCartSummary.objects.get(user=self.user)
+        self.assertEqual(summary.basket_total, sum(p.price for p in self.products) * self.ADDS_PER_PRODUCT)
+
+    def test_view_adds_through_upsert(self):
+        self.client.force_login(self.user)
+        url = reverse('add_to_basket', args=[self.products[0].id])
+        self.client.post(url)
+        response = self.client.post(url)
+        self.assertEqual(Basket.objects.get(user=self.user).quantity, 2)
+        self.assertEqual(response.json()['basket_items_count'], 2)
+        self.assertEqual(self.client.post(reverse('add_to_basket', args=[10 ** 9])).status_code, 404)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        make_catalog(1, products_per_game=3)
+        self.products = list(Product.objects.order_by('id'))
+        self.user = User.objects.create_user('buyer', password='pass')
+
+    def test_order_total_comes_from_items(self):
+        for product in self.products:
+            add_to_basket(self.user.id, product.id, 2)
+        order = Order.objects.get(id=checkout(self.user.id))
+        self.assertEqual(order.total_price, sum(p.price * 2 for p in self.products))
+        self.assertEqual(order.orderitem_set.count(), 3)
+        self.assertFalse(Basket.objects.filter(user=self.user).exists())
+
+    def test_same_key_returns_same_order(self):
+        add_to_basket(self.user.id, self.products[0].id)
+        first = checkout(self.user.id, 'key-1')
+        self.assertEqual(checkout(self.user.id, 'key-1'), first)
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+
+    def test_empty_basket(self):
+        with self.assertRaises(EmptyBasket):
+            checkout(self.user.id)
+
+    def test_view_handles_double_submit(self):
+        add_to_basket(self.user.id, self.products[0].id)
+        self.client.force_login(self.user)
+        for _ in range(2):
+            response = self.client.post(reverse('create_order'), {'idempotency_key': 'form-1'})
+            self.assertRedirects(response, reverse('my_orders'), fetch_redirect_response=False)
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Нагрузочный тест оформления: параллельные заказы, дубли и смена цен"""
+    USERS = 20
+    WORKERS = 16
+
+    def setUp(self):
+        make_catalog(1, products_per_game=5)
+        self.products = list(Product.objects.order_by('id'))
+        self.users = [User.objects.create_user(f'buyer{i}', password='pass') for i in range(self.USERS)]
+        for user in self.users:
+            for product in self.products:
+                add_to_basket(user.id, product.id, 3)
+
+    def run_parallel(self, calls):
+        def run(call):
+            try:
+                return call()
+            except EmptyBasket:
+                return None
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            return list(pool.map(run, calls))
+
+    def test_double_submits_create_one_order_per_user(self):
+        calls = [
+            (lambda user=user: checkout(user.id, f'form-{user.id}'))
+            for user in self.users for _ in range(5)
+        ]
+        self.run_parallel(calls)
+        for user in self.users:
+            self.assertEqual(Order.objects.filter(user=user).count(), 1)
+        self.assertFalse(Basket.objects.exists())
+
+    def test_totals_match_items_under_concurrent_discounts(self):
+        calls = [(lambda user=user: checkout(user.id)) for user in self.users]
+        calls += [
+            (lambda product=product: apply_discount_to_product(product.id, 10))
+            for product in self.products
+        ]
+        self.run_parallel(calls)
+
+        orders = Order.objects.annotate(items_total=Sum(F('orderitem__price') * F('orderitem__quantity')))
+        self.assertEqual(orders.count(), self.USERS)
+        for order in orders:
+            self.assertEqual(order.total_price, order.items_total)
+
+
+@task('test_echo')
+def echo_task(job, value):
+    job.progress(50, 'половина')
+    return {'value': value}
+
+
+@task('test_fail')
+def failing_task(job):
+    raise RuntimeError('сломалось')
+
+
+class JobQueueTests(TestCase):
+    def test_job_runs_and_records_result(self):
+        job = enqueue('test_echo', value=42)
+        self.assertEqual(claim_next('test'), job.id)
+        self.assertIsNone(claim_next('test'))
+
+        self.assertTrue(run_job(job.id))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_DONE)
+        self.assertEqual((job.progress, job.message, job.result), (100, 'половина', {'value': 42}))
+        self.assertIsNotNone(job.duration)
+
+    def test_failure_is_recorded(self):
+        job = enqueue('test_fail')
+        claim_next('test')
+        self.assertFalse(run_job(job.id))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertIn('RuntimeError', job.error)
+
+    def test_jobs_are_claimed_in_order(self):
+        first, second = enqueue('test_echo', value=1), enqueue('test_echo', value=2)
+        self.assertEqual([claim_next(), claim_next()], [first.id, second.id])
+
+    def test_unknown_task(self):
+        with self.assertRaises(UnknownTask):
+            enqueue('no_such_task')
+
+    def test_runworker_once_drains_queue(self):
+        jobs = [enqueue('test_echo', value=i) for i in range(3)]
+        call_command('runworker', '--sync', '--once', stdout=StringIO())
+        self.assertEqual(
+            set(Job.objects.filter(id__in=[j.id for j in jobs]).values_list('status', flat=True)),
+            {Job.STATUS_DONE},
+        )
+
+    def test_runworker_fails_jobs_of_dead_worker(self):
+        job = enqueue('test_echo', value=1)
+        claim_next('dead-worker')
+        Job.objects.filter(id=job.id).update(heartbeat_at=timezone.now() - timedelta(minutes=10))
+
+        call_command('runworker', '--sync', '--once', stdout=StringIO(), stderr=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+
+    def test_fresh_running_job_is_not_stale(self):
+        job = enqueue('test_echo', value=1)
+        claim_next('live-worker')
+        call_command('runworker', '--sync', '--once', stdout=StringIO(), stderr=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_RUNNING)
+
+    def test_admin_backup_is_enqueued_not_run(self):
+        admin = User.objects.create_superuser('root', 'root@example.com', 'pass')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:make_backup'))
+        job = Job.objects.get(name='backup')
+        self.assertRedirects(response, reverse('admin:main_job_change', args=[job.id]), fetch_redirect_response=False)
+        self.assertEqual(job.status, Job.STATUS_QUEUED)
+
+
+class BackupStorageTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name, BACKUP_CHUNK_SIZE=1024)
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(self.media.name, 'backups'))
+
+    def make_backup(self, name, content=b'dump', age_days=0):
+        with open(os.path.join(self.media.name, 'backups', name), 'wb') as f:
+            f.write(content)
+        backup = BackupFile.objects.create(file=f'backups/{name}', size_bytes=len(content))
+        BackupFile.objects.filter(id=backup.id).update(created_at=timezone.now() - timedelta(days=age_days))
+        backup.sha256 = backup_checksum(backup)
+        backup.save(update_fields=['sha256'])
+        return backup
+
+    def test_parse_compression(self):
+        self.assertEqual(parse_compression('zstd:3'), ('zstd', 3))
+        self.assertEqual(parse_compression('gzip'), ('gzip', 1))
+        self.assertEqual(parse_compression('none'), ('none', 0))
+        for spec in ('zstd:40', 'lz4:1', 'gzip:x'):
+            with self.subTest(spec=spec), self.assertRaises(BackupError):
+                parse_compression(spec)
+
+    def test_retention_keeps_recent_and_last_n(self):
+        old = [self.make_backup(f'old{i}.dump', age_days=60 + i) for i in range(3)]
+        fresh = self.make_backup('fresh.dump', age_days=1)
+
+        self.assertEqual(apply_retention(keep_last=2, keep_days=30), 2)
+        self.assertEqual(set(BackupFile.objects.values_list('id', flat=True)), {fresh.id, old[0].id})
+        self.assertFalse(os.path.exists(os.path.join(self.media.name, 'backups', 'old2.dump')))
+
+    def test_directory_is_streamed_as_tar(self):
+        directory = os.path.join(self.media.name, 'backups', 'b.dir')
+        os.makedirs(directory)
+        files = {'toc.dat': b'x' * 3000, '3001.dat.zst': b'y' * 10}
+        for name, content in files.items():
+            with open(os.path.join(directory, name), 'wb') as f:
+                f.write(content)
+
+        archive = tarfile.open(fileobj=io.BytesIO(b''.join(stream_directory_tar(directory))))
+        self.assertEqual(
+            {m.name: archive.extractfile(m).read() for m in archive.getmembers()},
+            {f'b.dir/{name}': content for name, content in files.items()},
+        )
+
+    def test_download_streams_file_with_checksum(self):
+        backup = self.make_backup('big.dump', content=b'z' * 5000)
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pass'))
+        response = self.client.get(reverse('admin:download_backup', args=[backup.id]))
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), b'z' * 5000)
+        self.assertEqual(response['X-Checksum-SHA256'], backup.sha256)
+
+    @override_settings(ASYNC_VIEWS=True)
+    def test_download_is_async_iterator_under_asgi(self):
+        # Синхронный итератор ASGI-обработчик Django собрал бы в память целиком
+        backup = self.make_backup('big.dump', content=b'z' * 5000)
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pass'))
+        response = self.client.get(reverse('admin:download_backup', args=[backup.id]))
+        self.assertTrue(response.is_async)
+        self.assertEqual(response['Content-Length'], '5000')
+        self.assertEqual(read_streaming(response), b'z' * 5000)
+
+
+class RestoreVerificationTests(TestCase):
+    def test_manifest_changes_with_data(self):
+        with connection.cursor() as cursor:
+            before = table_manifest(cursor)
+            Game.objects.create(name='Манифест')
+            after = table_manifest(cursor)
+        self.assertEqual(after['public.main_game']['rows'], before['public.main_game']['rows'] + 1)
+        self.assertNotEqual(after['public.main_game']['checksum'], before['public.main_game']['checksum'])
+        self.assertEqual(after['public.main_order'], before['public.main_order'])
+
+    def test_table_timer_parses_parallel_and_serial_output(self):
+        timer = TableTimer()
+        for line in (
+            'pg_restore: launching item 3001 TABLE DATA public main_product',
+            'pg_restore: launching item 3002 TABLE DATA public main_game',
+            'pg_restore: finished item 3002 TABLE DATA public main_game',
+            'pg_restore: finished item 3001 TABLE DATA public main_product',
+            'pg_restore: processing data for table "public.main_order"',
+        ):
+            timer(line)
+        self.assertEqual(set(timer.finish()), {'public.main_product', 'public.main_game', 'public.main_order'})
+
+    def test_checksum_mismatch_fails_before_restoring(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        os.makedirs(os.path.join(media.name, 'backups'))
+        with open(os.path.join(media.name, 'backups', 'x.dump'), 'wb') as f:
+            f.write(b'dump')
+        backup = BackupFile.objects.create(
+            file='backups/x.dump', sha256='0' * 64, manifest={'public.main_game': {'rows': 0, 'checksum': '0'}},
+        )
+
+        with override_settings(MEDIA_ROOT=media.name), self.assertRaises(RestoreError):
+            run_restore(backup, swap=False)
+        run = RestoreRun.objects.get(backup=backup)
+        self.assertEqual(run.status, 'failed')
+        self.assertIn('SHA-256', run.error)
+
+    def swap_statements(self, fail_on):
+        """ALTER DATABASE, выполненные _swap, если оператор с fail_on падает"""
+        run = RestoreRun(id=7, scratch_database='shop_restore_7')
+        executed = []
+
+        def maintenance(statements):
+            for sql, _ in statements:
+                if fail_on and fail_on in sql:
+                    raise RuntimeError('rename failed')
+                executed.append(sql)
+
+        with mock.patch('main.restore._maintenance', side_effect=maintenance), \
+                mock.patch('main.restore.connection') as conn:
+            conn.ops.quote_name.side_effect = lambda name: f'"{name}"'
+            if fail_on:
+                with self.assertRaises(RuntimeError):
+                    _swap(run, 'shop')
+            else:
+                self.assertEqual(_swap(run, 'shop'), 'shop_old_7')
+        return [sql for sql in executed if sql.startswith('ALTER DATABASE')]
+
+    def test_swap_blocks_connections_before_renaming(self):
+        self.assertEqual(self.swap_statements(fail_on=None), [
+            'ALTER DATABASE "shop" ALLOW_CONNECTIONS false',
+            'ALTER DATABASE "shop" RENAME TO "shop_old_7"',
+            'ALTER DATABASE "shop_restore_7" RENAME TO "shop"',
+        ])
+
+    def test_failed_second_rename_restores_live_database(self):
+        self.assertEqual(self.swap_statements(fail_on='"shop_restore_7" RENAME'), [
+            'ALTER DATABASE "shop" ALLOW_CONNECTIONS false',
+            'ALTER DATABASE "shop" RENAME TO "shop_old_7"',
+            'ALTER DATABASE "shop_old_7" RENAME TO "shop"',
+            'ALTER DATABASE "shop" ALLOW_CONNECTIONS true',
+        ])
+
+    def test_failed_first_rename_allows_connections_again(self):
+        self.assertEqual(self.swap_statements(fail_on='"shop" RENAME'), [
+            'ALTER DATABASE "shop" ALLOW_CONNECTIONS false',
+            'ALTER DATABASE "shop" ALLOW_CONNECTIONS true',
+        ])
+
+
+class ProductImportExportTests(TestCase):
+    def setUp(self):
+        self.game = Game.objects.create(name='Dota 2')
+        self.category = Category.objects.create(name='Аркана', game=self.game)
+        self.product = Product.objects.create(
+            name='Старое имя', description='', price=Decimal('100.00'), category=self.category, game=self.game,
+        )
+
+    def test_csv_import_creates_updates_and_reports_bad_rows(self):
+        data = (
+            'id;name;description;price;discount;category;game\n'
+            f'{self.product.id};Новое имя;;150.00;;Аркана;Dota 2\n'
+            ';Новый товар;Описание;200;10;Аркана;Dota 2\n'
+            ';Без игры;;10;;Аркана;CS2\n'
+            ';Без цены;;;;Аркана;Dota 2\n'
+            '999999;Чужой id;;10;;Аркана;Dota 2\n'
+        ).encode()
+        report = import_products(io.BytesIO(data), 'csv', batch_size=2)
+
+        self.assertEqual((report['rows'], report['created'], report['updated'], report['error_count']), (5, 1, 1, 3))
+        self.assertEqual([e['line'] for e in report['errors']], [4, 5, 6])
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.price), ('Новое имя', Decimal('150.00')))
+        created = Product.objects.get(name='Новый товар')
+        self.assertEqual((created.price, created.old_price), (Decimal('180.00'), Decimal('200.00')))
+
+    def test_export_round_trip_keeps_prices(self):
+        Product.objects.create(
+            name='Со скидкой', description='', price=Decimal('200.00'), discount=10,
+            category=self.category, game=self.game,
+        )
+        before = list(Product.objects.order_by('id').values_list('id', 'price', 'old_price', 'discount'))
+        exported = ''.join(stream_export(Product.objects.all(), 'jsonl')).encode()
+
+        report = import_products(io.BytesIO(exported), 'jsonl')
+        self.assertEqual((report['updated'], report['error_count']), (2, 0))
+        self.assertEqual(list(Product.objects.order_by('id').values_list('id', 'price', 'old_price', 'discount')), before)
+
+    def test_admin_export_streams_csv(self):
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pass'))
+        response = self.client.get(reverse('admin:export_products'), {'format': 'csv'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0], 'id,name,description,price,discount,category,game')
+        self.assertEqual(lines[1], f'{self.product.id},Старое имя,,100.00,,Аркана,Dota 2')
+
+    @override_settings(ASYNC_VIEWS=True)
+    def test_admin_export_is_async_iterator_under_asgi(self):
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pass'))
+        response = self.client.get(reverse('admin:export_products'), {'format': 'jsonl'})
+        self.assertTrue(response.is_async)
+        self.assertIn('"Старое имя"', read_streaming(response).decode())
+
+    def test_admin_export_rejects_invalid_game(self):
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pass'))
+        response = self.client.get(reverse('admin:export_products'), {'format': 'csv', 'game': 'abc'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name, THUMBNAIL_WIDTHS=(160, 320, 640), THUMBNAIL_FORMAT='webp')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.game = Game.objects.create(name='Dota 2')
+        self.category = Category.objects.create(name='Аркана', game=self.game)
+
+    def make_product(self, width=800):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (width, width // 2), 'red').save(buffer, format='PNG')
+        return Product.objects.create(
+            name='Меч', description='', price=10, category=self.category, game=self.game,
+            image=SimpleUploadedFile('sword.png', buffer.getvalue(), content_type='image/png'),
+        )
+
+    def test_generate_and_srcset(self):
+        product = self.make_product()
+        self.assertEqual(generate('product', product.id), 3)
+        self.assertEqual(generate('product', product.id), 0)
+
+        product.refresh_from_db()
+        self.assertTrue(thumbnail_url(product, 300).endswith('/thumbs/sword_320w.webp'))
+        entries = srcset(product).split(', ')
+        self.assertEqual([e.rsplit(' ', 1)[1] for e in entries], ['160w', '320w', '640w', '800w'])
+        self.assertEqual(thumbnail_url(product, 1000), product.image.url)
+
+    def test_no_upscaling(self):
+        product = self.make_product(width=200)
+        generate('product', product.id)
+        product.refresh_from_db()
+        self.assertEqual(list(product.image_variants['widths']), ['160'])
+
+    def test_stale_variants_fall_back_to_original_without_writes(self):
+        product = self.make_product()
+        generate('product', product.id)
+        product.refresh_from_db()
+        product.image.name = 'products/other.png'
+
+        # Чтение страницы не ставит задач: очередь пополняют загрузка и generate_thumbnails
+        with self.assertNumQueries(0):
+            self.assertEqual(thumbnail_url(product, 320), product.image.url)
+            self.assertEqual(srcset(product), '')
+
+    def test_schedule_skips_already_queued_job(self):
+        product = self.make_product()
+        schedule(product)
+        schedule(product)
+        self.assertEqual(Job.objects.filter(name='generate_thumbnails', kwargs__pk=product.id).count(), 1)
+
+
+class PoolMetricsTests(TestCase):
+    def test_connects_are_counted_and_reset(self):
+        pop_stats()
+        connection_created.send(sender=connection.__class__, connection=connection)
+        stats = pop_stats()
+        self.assertEqual((stats['mode'], stats['connects']), (settings.DB_CONNECTION_MODE, 1))
+        self.assertEqual(pop_stats()['connects'], 0)
+
+
+@override_settings(ROOT_URLCONF='webproj.urls_async', ASYNC_CONCURRENT_QUERIES=False)
+class AsyncViewsTests(TestCase):
+    def setUp(self):
+        fragment_cache().clear()
+        self.game = make_catalog(1, products_per_game=3)[0]
+        self.product = Product.objects.filter(game=self.game).first()
+
+    def test_index_lists_games(self):
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.game.name)
+
+    def test_product_page_and_not_modified(self):
+        url = reverse('product', args=[self.product.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.product.name)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_catalog_matches_sync_view(self):
+        url = reverse('catalog', args=[self.game.id])
+        response = self.client.get(url)
+        fragment_cache().clear()
+        with override_settings(ROOT_URLCONF='webproj.urls'):
+            expected = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [p.id for p in response.context['products']], [p.id for p in expected.context['products']],
+        )
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_catalog_unknown_game_is_404(self):
+        self.assertEqual(self.client.get(reverse('catalog', args=[self.game.id + 1000])).status_code, 404)
+
+
+class FanoutTests(TestCase):
+    def test_dependencies_receive_results_in_transaction(self):
+        fetch = Fanout('page').add('a', lambda: 1).add('b', lambda: 2).add('sum', lambda a, b: a + b, after=['a', 'b'])
+        self.assertEqual(fetch.run(), {'a': 1, 'b': 2, 'sum': 3})
+        # Внутри транзакции теста — по очереди в текущем потоке
+        self.assertEqual({span.thread for span in fetch.trace}, {threading.current_thread().name})
+
+    def test_unknown_dependency_is_rejected(self):
+        with self.assertRaises(ValueError):
+            Fanout('page').add('similar', lambda product: product, after=['product'])
+
+    def test_worker_queries_count_towards_query_budget(self):
+        game = make_catalog(1, products_per_game=2)[0]
+        self.client.force_login(User.objects.create_user('buyer', password='pass'))
+        product = Product.objects.filter(game=game).first()
+        with override_settings(LOADER_SERVER_TIMING=True):
+            response = self.client.get(reverse('product', args=[product.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('similar;dur=', response['Server-Timing'])
+        self.assertLessEqual(response.query_count, 8)
+
+
+class ConcurrentFanoutTests(TransactionTestCase):
+    @override_settings(LOADER_MAX_WORKERS=4)
+    def test_independent_fetches_overlap(self):
+        def slow(value):
+            return lambda *args: time.sleep(0.2) or value
+
+        fetch = (
+            Fanout('page')
+            .add('a', slow(1)).add('b', slow(2)).add('c', slow(3))
+            .add('d', slow(4), after=['a'])
+        )
+        started = time.monotonic()
+        self.assertEqual(fetch.run(), {'a': 1, 'b': 2, 'c': 3, 'd': 4})
+        # Самый длинный путь — a → d, а не сумма четырёх выборок
+        self.assertLess(time.monotonic() - started, 0.6)
+        self.assertGreater(len({span.thread for span in fetch.trace}), 1)
+
+    @override_settings(LOADER_MAX_WORKERS=4)
+    def test_first_error_is_raised(self):
+        def fail():
+            raise LookupError('нет товара')
+
+        with self.assertRaises(LookupError):
+            Fanout('page').add('product', fail).add('similar', lambda p: p, after=['product']).run()
+
+
+class DataLoaderTests(TestCase):
+    def test_queued_keys_load_in_one_batch(self):
+        calls = []
+
+        def batch(keys):
+            calls.append(list(keys))
+            return {key: key * 10 for key in keys if key != 3}
+
+        loader = DataLoader(batch, default=0)
+        first, second, missing = loader.load(1), loader.load(2), loader.load(3)
+        self.assertEqual((first.get(), second.get(), missing.get()), (10, 20, 0))
+        self.assertEqual(loader.load_many([2, 4]), [20, 40])
+        self.assertEqual(calls, [[1, 2, 3], [4]])
+
+    def test_wishlist_flags_share_one_query(self):
+        user = User.objects.create_user('buyer', password='pass')
+        products = list(Product.objects.filter(game=make_catalog(1, products_per_game=3)[0]))
+        Wishlist.objects.create(user=user, product=products[0])
+        request = type('Request', (), {'user': user})()
+
+        for product in products:
+            request_loader(request, 'wishlist').load(product.id)
+        with self.assertNumQueries(1):
+            flags = [in_wishlist(request, product.id) for product in products]
+        self.assertEqual(flags, [True, False, False])
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        fragment_cache().clear()
+        game = make_catalog(1, products_per_game=5)[0]
+        self.products = list(Product.objects.filter(game=game).order_by('id'))
+        self.user = User.objects.create_user('buyer', password='pass')
+
+    def order(self, *products):
+        order = Order.objects.create(user=self.user, total_price=0)
+        OrderItem.objects.bulk_create(OrderItem(order=order, product=p, quantity=1, price=p.price) for p in products)
+
+    def neighbor_ids(self, product):
+        return list(ProductNeighbor.objects.filter(product=product).order_by('rank').values_list('neighbor_id', flat=True))
+
+    def test_co_purchases_rank_first(self):
+        p = self.products
+        self.order(p[0], p[1])
+        self.order(p[0], p[1])
+        self.order(p[0], p[2])
+        run = refresh_recommendations(full=True)
+
+        self.assertEqual((run.mode, run.products_updated), ('full', 5))
+        self.assertEqual(self.neighbor_ids(p[0])[:2], [p[1].id, p[2].id])
+        self.assertNotIn(p[0].id, self.neighbor_ids(p[0]))
+        self.assertEqual([x.id for x in similar_products(p[0], limit=2)], [p[1].id, p[2].id])
+
+    def test_incremental_refresh_touches_only_new_orders(self):
+        p = self.products
+        self.order(p[0], p[1])
+        refresh_recommendations(full=True)
+        before = self.neighbor_ids(p[0])
+
+        self.order(p[3], p[4])
+        run = refresh_recommendations()
+        self.assertEqual((run.mode, run.products_updated), ('incremental', 2))
+        self.assertEqual(self.neighbor_ids(p[3])[0], p[4].id)
+        self.assertEqual(self.neighbor_ids(p[0]), before)
+        self.assertEqual(refresh_recommendations().products_updated, 0)
+
+    def test_schedule_refresh_keeps_one_queued_job(self):
+        schedule_refresh()
+        schedule_refresh()
+        jobs = Job.objects.filter(name='refresh_recommendations')
+        self.assertEqual(jobs.count(), 1)
+
+        # Начатый пересчёт может не увидеть новые заказы — следующий ставится
+        jobs.update(status=Job.STATUS_RUNNING)
+        schedule_refresh()
+        self.assertEqual(jobs.filter(status=Job.STATUS_QUEUED).count(), 1)
+
+    def test_fallback_without_index_is_same_category(self):
+        similar = similar_products(self.products[0], limit=4)
+        self.assertEqual(len(similar), 4)
+        self.assertTrue(all(x.category_id == self.products[0].category_id for x in similar))
+
+    def test_product_page_reads_neighbors(self):
+        p = self.products
+        self.order(p[0], p[4])
+        refresh_recommendations(full=True)
+        response = self.client.get(reverse('product', args=[p[0].id]))
+        self.assertEqual(response.context['similar_products'][0].id, p[4].id)
+
+    def test_refresh_changes_product_etag(self):
+        url = reverse('product', args=[self.products[0].id])
+        refresh_recommendations(full=True)
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.order(self.products[0], self.products[4])
+        refresh_recommendations()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_neighbor_change_in_other_game_changes_product_etag(self):
+        other = Product.objects.filter(game=make_catalog(1, products_per_game=1)[0]).get()
+        self.order(self.products[0], other)
+        refresh_recommendations(full=True)
+        url = reverse('product', args=[self.products[0].id])
+        etag = self.client.get(url)['ETag']
+
+        other.name = 'Новое имя'
+        other.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class AnalyticsViewsTests(TestCase):
+    def setUp(self):
+        self.products = list(Product.objects.filter(game=make_catalog(1, products_per_game=2)[0]).order_by('id'))
+        self.user = User.objects.create_user('buyer', password='pass')
+        for status, quantity in (('доставлен', 3), ('на рассмотрении', 1), ('отменён', 5)):
+            order = Order.objects.create(user=self.user, total_price=0, status=status)
+            OrderItem.objects.create(order=order, product=self.products[0], quantity=quantity, price=10)
+        Wishlist.objects.create(user=self.user, product=self.products[1])
+
+    def test_views_are_materialized_until_refresh(self):
+        self.assertFalse(ActiveOrderView.objects.exists())
+        refresh_all()
+        self.assertEqual(
+            sorted(ActiveOrderView.objects.values_list('status', flat=True)), ['доставлен', 'на рассмотрении'],
+        )
+        self.assertEqual(AnalyticsRefresh.objects.get(view_name='active_orders_view').row_count, 2)
+
+    def test_top_selling_counts_only_delivered_orders(self):
+        refresh_all(['top_selling_products_view', 'top_wishlists_view'])
+        top = TopSellingProductView.objects.get()
+        self.assertEqual((top.rank, top.product_id, top.total_sold, top.orders_count), (1, self.products[0].id, 3, 1))
+        self.assertEqual(TopWishlistView.objects.get(user=self.user).wishlist_count, 1)
+
+    def test_schedule_uses_intervals(self):
+        self.assertEqual(len(due_views()), 3)
+        refresh_all()
+        self.assertEqual(due_views(), [])
+        self.assertEqual(len(due_views(now=timezone.now() + timedelta(days=1))), 3)
@@ -5,7 +5,7 @@ from django.conf.urls.static import static
 from .views import (
     IndexView, ProductView, AboutView,
     BasketView, AddToBasketView, RemoveFromBasketView,
-    UpdateBasketView, CreateOrderView, AddReviewView,
+    UpdateBasketView, BulkBasketView, CreateOrderView, AddReviewView,
     ProductCreateView, ProductUpdateView, ProductDeleteView,
     GameCreateView, GameUpdateView, GameDeleteView,
     CategoryCreateView, CategoryUpdateView, CategoryDeleteView,
@@ -37,6 +37,7 @@ urlpatterns = [
     path('add-to-basket/<int:product_id>/', AddToBasketView.as_view(), name='add_to_basket'),
     path('remove-from-basket/<int:item_id>/', RemoveFromBasketView.as_view(), name='remove_from_basket'),
     path('update-basket/<int:item_id>/', UpdateBasketView.as_view(), name='update_basket'),
+    path('basket/bulk/', BulkBasketView.as_view(), name='basket_bulk'),
     path('create-order/', CreateOrderView.as_view(), name='create_order'),
 
     # Список желаний
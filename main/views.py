@@ -2,19 +2,38 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.admin.views.decorators import staff_member_required
 from django.views import View
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
 from django.views.generic import ListView, DetailView
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
+from django.db.models import Prefetch
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
 from .models import Game, Category, Product, User, Basket, Order, OrderItem, Review, Wishlist
+from .queries import games_with_discounts
+from .counters import get_counters
+from .pagination import KeysetPaginator, InvalidCursor, SORT_ORDERINGS, estimate_count
+from .search import search_products, search_page
+from .facets import catalog_facets, normalize_filters
+from .cache import get_version, fragment_key, get_or_build
+from .query_budget import query_budget
+from .loaders import Fanout
+from .recommendations import similar_products
+from .jobs import enqueue
+from .basket_ops import (
+    parse_operations, apply_basket_operations, add_to_basket, checkout, EmptyBasket, MAX_QUANTITY,
+)
+from .conditional import (
+    catalog_etag, catalog_last_modified, product_etag, product_last_modified, in_wishlist,
+)
 from .forms import ProfileUpdateForm, GameForm, ProductForm, CategoryForm, UserForm, OrderForm, ReviewForm, LoginForm, RegistrationForm
-from django.core.paginator import Paginator
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+import json
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
@@ -35,14 +54,19 @@ def call_pg_procedure(proc_name, *args):
         cursor.execute(f"CALL {proc_name}({placeholders})", args)
 
 
+# Позиции заказа вместе с товарами — один запрос на весь заказ
+ORDER_ITEMS_PREFETCH = Prefetch('orderitem_set', queryset=OrderItem.objects.select_related('product'))
+
+
 # --- Views ---
+@method_decorator(query_budget(5), name='dispatch')
 class OrderDetailView(LoginRequiredMixin, DetailView):
     model = Order
     template_name = 'main/order_detail.html'
     context_object_name = 'order'
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return Order.objects.filter(user=self.request.user).prefetch_related(ORDER_ITEMS_PREFETCH)
 
 
 class UserOrdersView(LoginRequiredMixin, ListView):
@@ -85,12 +109,8 @@ def logout_user(request):
 
 @login_required
 def profile_view(request):
-    basket_count = call_pg_function('get_basket_count', request.user.id)
-    wishlist_count = call_pg_function('get_wishlist_count', request.user.id)
-    return render(request, 'main/profile.html', {
-        'basket_items_count': basket_count,
-        'wishlist_count': wishlist_count,
-    })
+    # Счётчики берутся из контекст-процессора (один запрос на оба значения)
+    return render(request, 'main/profile.html')
 
 
 # --- Админка: CRUD ---
@@ -128,16 +148,16 @@ class ProductDeleteView(DeleteView):
     template_name = 'main/product_confirm_delete.html'
     success_url = reverse_lazy('index')
 
-    def delete(self, request, *args, **kwargs):
+    def form_valid(self, form):
         # Сначала удаляем сам товар (родительский метод)
-        response = super().delete(request, *args, **kwargs)
+        response = super().form_valid(form)
 
-        # Затем вызываем процедуру очистки "битых" записей
+        # Очистка "битых" записей — в фоне, ответ её не ждёт
         try:
-            call_pg_procedure('cleanup_orphaned_items')
+            enqueue('cleanup_orphaned_items', created_by=self.request.user)
         except Exception as e:
             # Логируем ошибку, но не прерываем удаление
-            logger.error(f"Ошибка при очистке после удаления товара: {e}")
+            logger.error(f"Не удалось поставить очистку после удаления товара в очередь: {e}")
 
         return response
 @method_decorator(staff_member_required, name='dispatch')
@@ -220,10 +240,14 @@ class OrderListView(ListView):
 
 
 @method_decorator(staff_member_required, name='dispatch')
+@method_decorator(query_budget(5), name='dispatch')
 class OrderDetailView(DetailView):
     model = Order
     template_name = 'main/order_detail.html'
 
+    def get_queryset(self):
+        return Order.objects.prefetch_related(ORDER_ITEMS_PREFETCH)
+
 
 @method_decorator(staff_member_required, name='dispatch')
 class OrderUpdateView(UpdateView):
@@ -259,85 +283,100 @@ class ReviewDeleteView(DeleteView):
 class IndexView(View):
     def get(self, request):
         games = Game.objects.all()
-        games_with_discounts = []
+        # Все игры со своими первыми 4 скидочными товарами — один запрос вместо 1 + N
+        discounts = games_with_discounts(limit=4)
 
-        for game in games:
-            discounted_products = game.product_set.filter(discount__isnull=False)[:4]
-            if discounted_products:
-                games_with_discounts.append({
-                    'game': game,
-                    'products': discounted_products
-                })
-
-        basket_count = call_pg_function('get_basket_count', request.user.id) if request.user.is_authenticated else 0
         return render(request, 'main/index.html', {
             'games': games,
-            'games_with_discounts': games_with_discounts,
-            'basket_items_count': basket_count,
+            'games_with_discounts': discounts,
         })
 
 
 # ProductView
+# Загрузка частей страницы товара (с кэшем фрагментов) — общая с async-версией
+def load_product(product_id, version):
+    return get_or_build(
+        fragment_key('product', product_id, version),
+        lambda: get_object_or_404(Product.objects.select_related('game', 'category'), id=product_id),
+    )
+
+
+def load_reviews(product_id, version):
+    return get_or_build(
+        fragment_key('product_reviews', product_id, version),
+        lambda: list(Review.objects.filter(product_id=product_id).select_related('user')),
+    )
+
+
+def load_similar_products(product, version):
+    return get_or_build(
+        fragment_key(
+            'product_similar', product.id, version,
+            get_version('game', product.game_id), get_version('recommendations', 0),
+        ),
+        lambda: similar_products(product, limit=4),
+    )
+
+
+@method_decorator(query_budget(8), name='dispatch')
 class ProductView(View):
+    # 304 до сборки контекста и рендера, если игра товара не менялась
+    @method_decorator(condition(etag_func=product_etag, last_modified_func=product_last_modified))
     def get(self, request, product_id):
-        product = get_object_or_404(Product, id=product_id)
-        reviews = Review.objects.filter(product=product)
-        similar_products = Product.objects.filter(
-            category=product.category
-        ).exclude(id=product.id)[:4]
-
-        in_wishlist = False
-        if request.user.is_authenticated:
-            in_wishlist = Wishlist.objects.filter(user=request.user, product=product).exists()
-
-        basket_count = call_pg_function('get_basket_count', request.user.id) if request.user.is_authenticated else 0
-        return render(request, 'main/prodinfo.html', {
-            'product': product,
-            'reviews': reviews,
-            'similar_products': similar_products,
-            'in_wishlist': in_wishlist,
-            'basket_items_count': basket_count,
+        version = get_version('product', product_id)
+        counters = get_counters(request)
+        # Отзывы, отметка вишлиста и счётчики шапки не зависят от товара — грузятся параллельно
+        # с ним; похожие товары ждут только товар (нужна его категория)
+        fetch = (
+            Fanout('product_page')
+            .add('product', lambda: load_product(product_id, version))
+            .add('reviews', lambda: load_reviews(product_id, version))
+            .add('in_wishlist', lambda: in_wishlist(request, product_id))
+            .add('counters', lambda: counters.basket_count)
+            .add('similar', lambda product: load_similar_products(product, version), after=['product'])
+        )
+        data = fetch.run()
+
+        response = render(request, 'main/prodinfo.html', {
+            'product': data['product'],
+            'reviews': data['reviews'],
+            'similar_products': data['similar'],
+            'in_wishlist': data['in_wishlist'],
         })
+        return fetch.server_timing(response)
 
 
 # AboutView
 class AboutView(View):
     def get(self, request):
-        basket_count = call_pg_function('get_basket_count', request.user.id) if request.user.is_authenticated else 0
-        return render(request, 'main/about.html', {
-            'basket_items_count': basket_count,
-        })
+        return render(request, 'main/about.html')
 
 
 # BasketView
+@method_decorator(query_budget(4), name='dispatch')
 class BasketView(LoginRequiredMixin, View):
     def get(self, request):
-        basket_items = Basket.objects.filter(user=request.user)
-        total = call_pg_function('get_basket_total', request.user.id)
-        count = call_pg_function('get_basket_count', request.user.id)
+        basket_items = Basket.objects.filter(user=request.user).select_related('product')
+        # Сумма загружается тем же запросом, что и счётчики в шапке
+        total = get_counters(request).basket_total
 
         return render(request, 'main/basket.html', {
             'basket_items': basket_items,
             'total': total,
-            'basket_items_count': count,
+            # Новый ключ на каждый показ формы: двойной клик не создаст второй заказ
+            'idempotency_key': uuid.uuid4().hex,
         })
 
 
 # AddToBasketView
 class AddToBasketView(LoginRequiredMixin, View):
     def post(self, request, product_id):
-        product = get_object_or_404(Product, id=product_id)
-        basket_item, created = Basket.objects.get_or_create(
-            user=request.user,
-            product=product,
-            defaults={'quantity': 1}
-        )
-        if not created:
-            basket_item.quantity += 1
-            basket_item.save()
+        if add_to_basket(request.user.id, product_id) is None:
+            raise Http404("Товар не найден")
 
-        new_count = call_pg_function('get_basket_count', request.user.id)
-        return JsonResponse({'success': True, 'basket_items_count': new_count})
+        counters = get_counters(request)
+        counters.adjust(basket=1)
+        return JsonResponse({'success': True, 'basket_items_count': counters.basket_count})
 
 
 # RemoveFromBasketView
@@ -345,8 +384,10 @@ class RemoveFromBasketView(LoginRequiredMixin, View):
     def post(self, request, item_id):
         basket_item = get_object_or_404(Basket, id=item_id, user=request.user)
         basket_item.delete()
-        new_count = call_pg_function('get_basket_count', request.user.id)
-        return JsonResponse({'success': True, 'basket_items_count': new_count})
+
+        counters = get_counters(request)
+        counters.adjust(basket=-basket_item.quantity)
+        return JsonResponse({'success': True, 'basket_items_count': counters.basket_count})
 
 
 # UpdateBasketView
@@ -354,33 +395,56 @@ class UpdateBasketView(LoginRequiredMixin, View):
     def post(self, request, item_id):
         try:
             quantity = int(request.POST.get('quantity', 1))
-            if quantity < 1:
+            if not 1 <= quantity <= MAX_QUANTITY:
                 raise ValueError
         except (ValueError, TypeError):
             return JsonResponse({'success': False, 'message': 'Invalid quantity'})
 
         basket_item = get_object_or_404(Basket, id=item_id, user=request.user)
+        delta = quantity - basket_item.quantity
         basket_item.quantity = quantity
         basket_item.save()
+        get_counters(request).adjust(basket=delta)
         return JsonResponse({'success': True})
 
 
-# CreateOrderView — используем процедуру
-class CreateOrderView(LoginRequiredMixin, View):
+# BulkBasketView — пачка изменений корзины одним запросом и одной транзакцией
+class BulkBasketView(LoginRequiredMixin, View):
     def post(self, request):
-        basket_count = call_pg_function('get_basket_count', request.user.id)
-        if basket_count == 0:
-            return JsonResponse({'success': False, 'message': 'Корзина пуста'}, status=400)
-
         try:
-            call_pg_procedure('create_order_from_basket', request.user.id)
+            payload = json.loads(request.body or b'{}')
+            operations = parse_operations(payload.get('items') if isinstance(payload, dict) else None)
+        except ValueError as e:  # JSONDecodeError и BasketOperationError
+            return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+        apply_basket_operations(request.user.id, operations)
 
+        # Сводку пересчитали триггеры — счётчики и сумма одним запросом
+        counters = get_counters(request)
+        counters.invalidate()
+        return JsonResponse({
+            'success': True,
+            'basket_items_count': counters.basket_count,
+            'wishlist_count': counters.wishlist_count,
+            'total': str(counters.basket_total),
+        })
+
+
+# CreateOrderView — используем процедуру; пустую корзину она определит сама
+class CreateOrderView(LoginRequiredMixin, View):
+    def post(self, request):
+        idempotency_key = request.POST.get('idempotency_key', '').strip()[:64] or None
+        try:
+            checkout(request.user.id, idempotency_key)
+            get_counters(request).invalidate()
             return redirect('my_orders')
+        except EmptyBasket:
+            return JsonResponse({'success': False, 'message': 'Корзина пуста'}, status=400)
         except Exception as e:
             logger.error(f"Ошибка при создании заказа: {e}")
             return JsonResponse({'success': False, 'message': 'Ошибка при создании заказа'}, status=500)
 
-# AddReviewView — триггер сам проверит покупку
+# AddReviewView — триггеры сами проверят покупку и обновят рейтинг
 class AddReviewView(LoginRequiredMixin, View):
     def post(self, request, product_id):
         product = get_object_or_404(Product, id=product_id)
@@ -397,30 +461,38 @@ class AddReviewView(LoginRequiredMixin, View):
             return JsonResponse({'success': False, 'message': 'Comment cannot be empty'})
 
         try:
+            # Рейтинг товара пересчитывает триггер trg_review_rating — только для этого товара
             Review.objects.create(
                 product=product,
                 user=request.user,
                 rating=rating,
                 comment=comment
             )
-            # ← Добавьте эту строку:
-            call_pg_procedure('recalculate_product_ratings')
             return JsonResponse({'success': True})
         except Exception as e:
             return JsonResponse({'success': False, 'message': str(e)})
 
 
 # catalog_view
-def catalog_view(request, game_id):
-    game = get_object_or_404(Game, id=game_id)
-    categories = Category.objects.filter(game=game)
-    products = Product.objects.filter(game=game)
+# Части страницы каталога вынесены в функции: их используют и этот view,
+# и асинхронный в main/async_views.py (там независимые запросы идут параллельно)
+def catalog_url_builder(params):
+    def build_url(**kwargs):
+        new_params = params.copy()
+        for key, value in kwargs.items():
+            if value is not None and value != '':
+                new_params[key] = value
+            else:
+                new_params.pop(key, None)
+        return f"?{new_params.urlencode()}" if new_params else ""
+    return build_url
 
-    params = request.GET.copy()
+
+def catalog_products(game_id, params):
+    products = Product.objects.filter(game_id=game_id)
     selected_categories = params.getlist('category', [])
     min_price = params.get('min_price', '')
     max_price = params.get('max_price', '')
-    sort = params.get('sort', 'default')
 
     if selected_categories:
         products = products.filter(category_id__in=selected_categories)
@@ -434,44 +506,100 @@ def catalog_view(request, game_id):
             products = products.filter(price__lte=float(max_price))
         except ValueError:
             pass
-    if sort == 'price_asc':
-        products = products.order_by('price')
-    elif sort == 'price_desc':
-        products = products.order_by('-price')
+    return products
 
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page', 1)
-    products_page = paginator.get_page(page_number)
 
-    def build_url(**kwargs):
-        new_params = params.copy()
-        for key, value in kwargs.items():
-            if value is not None and value != '':
-                new_params[key] = value
-            else:
-                new_params.pop(key, None)
-        return f"?{new_params.urlencode()}" if new_params else ""
+def catalog_page(products, params, build_url):
+    """Страница товаров и ссылки на соседние страницы"""
+    search_query = params.get('q', '').strip()
+    if search_query:
+        # Поиск: выдача по релевантности, страницы по номеру (глубина ограничена)
+        try:
+            page_number = int(params.get('page', 1))
+        except ValueError:
+            page_number = 1
+        products_page, has_next = search_page(search_products(search_query, products), page_number, 12)
+        total_estimate = None
+        next_url = build_url(page=page_number + 1, cursor=None) if has_next else None
+        previous_url = build_url(page=page_number - 1, cursor=None) if page_number > 1 else None
+    else:
+        # Keyset-пагинация по активной сортировке: без COUNT(*) и OFFSET
+        sort = params.get('sort', 'default')
+        paginator = KeysetPaginator(products, 12, SORT_ORDERINGS.get(sort, SORT_ORDERINGS['default']))
+        try:
+            products_page = paginator.get_page(params.get('cursor'))
+        except InvalidCursor:
+            products_page = paginator.get_page()
+        total_estimate = estimate_count(products)
+        next_url = build_url(cursor=products_page.next_cursor, page=None) if products_page.has_next else None
+        previous_url = build_url(cursor=products_page.previous_cursor, page=None) if products_page.has_previous else None
+
+    return {
+        'products': products_page,
+        'total_estimate': total_estimate,
+        'next_url': next_url,
+        'previous_url': previous_url,
+    }
+
+
+def catalog_context(game, categories, facets, page, build_url):
+    """Собирает контекст фрагмента: счётчики фасетов раскладываются по категориям и диапазонам цен"""
+    categories = list(categories)
+    for category in categories:
+        category.facet_count = facets['categories'].get(category.id, 0)
+    for bucket in facets['price_buckets']:
+        bucket['url'] = build_url(min_price=bucket['min'], max_price=bucket['max'], cursor=None, page=None)
+    return {'game': game, 'categories': categories, 'facets': facets, **page}
+
+
+def catalog_key(game_id, params):
+    # Фрагмент каталога кэшируется по игре, фильтрам, сортировке и странице;
+    # версия игры увеличивается сигналами при любом изменении её товаров
+    return fragment_key(
+        'catalog', game_id, get_version('game', game_id),
+        normalize_filters(params), params.get('sort', 'default'), params.get('q', '').strip(),
+        params.get('cursor', ''), params.get('page', ''),
+    )
+
 
+def render_catalog(request, context, params, build_url):
     return render(request, 'main/catalog.html', {
-        'game': game,
-        'categories': categories,
-        'products': products_page,
-        'selected_categories': [int(c) for c in selected_categories],
-        'min_price': min_price,
-        'max_price': max_price,
-        'current_sort': sort,
+        **context,
+        'search_query': params.get('q', '').strip(),
+        'selected_categories': [int(c) for c in params.getlist('category', [])],
+        'min_price': params.get('min_price', ''),
+        'max_price': params.get('max_price', ''),
+        'current_sort': params.get('sort', 'default'),
         'build_url': build_url,
     })
 
 
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+def catalog_view(request, game_id):
+    params = request.GET.copy()
+    build_url = catalog_url_builder(params)
+
+    def build():
+        game = get_object_or_404(Game, id=game_id)
+        categories = Category.objects.filter(game=game)
+        page = catalog_page(catalog_products(game.id, params), params, build_url)
+        # Сколько товаров даст каждая категория и каждый ценовой диапазон — один агрегирующий запрос
+        facets = catalog_facets(game.id, params)
+        return catalog_context(game, categories, facets, page, build_url)
+
+    context = get_or_build(catalog_key(game_id, params), build)
+    return render_catalog(request, context, params, build_url)
+
+
 # wishlist_view
 @login_required
+@query_budget(4)
 def wishlist_view(request):
-    wishlist_items = Wishlist.objects.filter(user=request.user).select_related('product')
-    count = call_pg_function('get_wishlist_count', request.user.id)
+    wishlist_items = Wishlist.objects.filter(user=request.user).select_related(
+        'product__category', 'product__game'
+    )
     return render(request, 'main/wishlist.html', {
         'wishlist_items': wishlist_items,
-        'wishlist_count': count,
     })
 
 
@@ -483,18 +611,20 @@ def toggle_wishlist(request, product_id):
         user=request.user,
         product=product
     )
+    counters = get_counters(request)
     if not created:
         wishlist_item.delete()
+        counters.adjust(wishlist=-1)
         action = 'removed'
     else:
+        counters.adjust(wishlist=1)
         action = 'added'
 
-    new_count = call_pg_function('get_wishlist_count', request.user.id)
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({
             'status': 'success',
             'action': action,
-            'count': new_count
+            'count': counters.wishlist_count
         })
     return redirect('wishlist')
 
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'webproj.settings')
+# Под ASGI — асинхронные страницы и API только для чтения (webproj/urls_async.py)
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 MIDDLEWARE = [
@@ -55,7 +56,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'webproj.urls'
+# ASYNC_VIEWS=1 (выставляет webproj/asgi.py): страницы и API только для чтения — корутинами,
+# независимые запросы страницы выполняются параллельно (ASYNC_CONCURRENT_QUERIES)
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == '1'
+ASYNC_CONCURRENT_QUERIES = os.environ.get('ASYNC_CONCURRENT_QUERIES', '1') == '1'
+ROOT_URLCONF = 'webproj.urls_async' if ASYNC_VIEWS else 'webproj.urls'
 
 TEMPLATES = [
     {
@@ -91,6 +96,136 @@ DATABASES = {
     }
 }
 
+# Соединения с БД (DB_CONNECTION_MODE):
+#   pool       — пул psycopg 3 в каждом процессе: соединение берётся на время запроса и возвращается;
+#   persistent — постоянное соединение на поток (CONN_MAX_AGE) с проверкой перед повторным использованием;
+#   off        — новое соединение на каждый запрос.
+# Размер пула — от числа потоков воркера gunicorn (gunicorn.conf.py читает те же переменные):
+# каждому потоку по соединению плюс запас для фоновых потоков. Под gunicorn размер ещё
+# ограничен долей бюджета DB_MAX_CONNECTIONS на воркер: gunicorn.conf.py задаёт DB_POOL_MAX_SIZE
+# до старта воркеров и не запускается, если все воркеры вместе могут превысить бюджет.
+
+DB_CONNECTION_MODE = os.environ.get('DB_CONNECTION_MODE', 'persistent')
+GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 4))
+# Потоки main/loaders.py для параллельных выборок страницы (1 — по очереди); у каждого своё соединение
+LOADER_MAX_WORKERS = int(os.environ.get('LOADER_MAX_WORKERS', 4))
+# Заголовок Server-Timing с временем каждой выборки (раскрывает внутреннее устройство — только для отладки)
+LOADER_SERVER_TIMING = DEBUG
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+# Под ASGI соединения держат не потоки воркера, а параллельные запросы страниц (до 5 на страницу)
+DB_POOL_MAX_SIZE = int(os.environ.get(
+    'DB_POOL_MAX_SIZE', 20 if ASYNC_VIEWS else GUNICORN_THREADS + LOADER_MAX_WORKERS + 2,
+))
+# Сколько секунд запрос ждёт свободное соединение, прежде чем упасть с PoolTimeout
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+# Раз в сколько секунд каждый воркер пишет в лог метрики пула (0 — не писать)
+DB_POOL_STATS_INTERVAL = int(os.environ.get('DB_POOL_STATS_INTERVAL', 60))
+
+if DB_CONNECTION_MODE == 'pool':
+    from psycopg_pool import ConnectionPool
+
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': DB_POOL_TIMEOUT,
+            'max_idle': 300,
+            'max_lifetime': 3600,
+            # Проверка соединения при выдаче из пула: разорванное (рестарт БД, failover) заменяется новым
+            'check': ConnectionPool.check_connection,
+        },
+    }
+elif DB_CONNECTION_MODE == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+elif DB_CONNECTION_MODE != 'off':
+    from django.core.exceptions import ImproperlyConfigured
+    raise ImproperlyConfigured(f"DB_CONNECTION_MODE: ожидается pool, persistent или off, получено {DB_CONNECTION_MODE!r}")
+
+
+# Cache
+# Фрагменты каталога и страниц товаров. LocMemCache — LRU в памяти процесса,
+# FileBasedCache — общий для всех воркеров на одной машине. Оба работают без Redis.
+# Версии фрагментов (bump_version) лежат в том же кэше: с locmem запись сбрасывает кэш
+# только своего процесса, остальные воркеры до FRAGMENT_CACHE_TIMEOUT отдают устаревшее.
+# Поэтому locmem — только для тестов и runserver с одним процессом; образ задаёт file.
+
+FRAGMENT_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+}
+FRAGMENT_CACHE_BACKEND = os.environ.get('FRAGMENT_CACHE_BACKEND', 'locmem')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'default',
+    },
+    'fragments': {
+        'BACKEND': FRAGMENT_CACHE_BACKENDS[FRAGMENT_CACHE_BACKEND],
+        'LOCATION': (
+            os.environ.get('FRAGMENT_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'fragments'))
+            if FRAGMENT_CACHE_BACKEND == 'file' else 'fragments'
+        ),
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+            'CULL_FREQUENCY': 4,
+        },
+    },
+}
+FRAGMENT_CACHE_ALIAS = 'fragments'
+FRAGMENT_CACHE_TIMEOUT = 600
+
+
+# Backups
+# pg_dump сжимает сам (zstd:N или gzip:N, «none» — без сжатия); при BACKUP_JOBS > 1
+# дамп делается в формате directory параллельно в N потоков.
+
+BACKUP_COMPRESSION = os.environ.get('BACKUP_COMPRESSION', 'zstd:3')
+BACKUP_JOBS = int(os.environ.get('BACKUP_JOBS', 1))
+# Хранятся последние BACKUP_KEEP_LAST бэкапов и все, что моложе BACKUP_KEEP_DAYS дней
+BACKUP_KEEP_LAST = int(os.environ.get('BACKUP_KEEP_LAST', 7))
+BACKUP_KEEP_DAYS = int(os.environ.get('BACKUP_KEEP_DAYS', 30))
+BACKUP_CHUNK_SIZE = 1024 * 1024
+# Восстановление: pg_restore -j RESTORE_JOBS во временную БД, CREATE/DROP/RENAME DATABASE —
+# из служебной БД RESTORE_MAINTENANCE_DB (у пользователя БД нужно право CREATEDB)
+RESTORE_JOBS = int(os.environ.get('RESTORE_JOBS', 4))
+RESTORE_MAINTENANCE_DB = os.environ.get('RESTORE_MAINTENANCE_DB', 'postgres')
+
+
+# Массовый импорт/экспорт товаров: строк на bulk_create/bulk_update и строк на выборку курсора
+
+PRODUCT_IMPORT_BATCH_SIZE = 1000
+PRODUCT_EXPORT_CHUNK_SIZE = 2000
+
+
+# Уменьшенные копии изображений товаров и логотипов (main/images.py): ширины для srcset,
+# формат (webp или jpeg) и качество. Смена формата или ширин — затем manage.py generate_thumbnails --force
+
+THUMBNAIL_WIDTHS = (160, 320, 640)
+THUMBNAIL_FORMAT = os.environ.get('THUMBNAIL_FORMAT', 'webp')
+THUMBNAIL_QUALITY = 80
+
+
+# Похожие товары (main/recommendations.py): веса сигналов, соседей на товар, окно соседей по цене
+# в категории; после заказа ставится инкрементальный пересчёт (один на очередь, пока он не начат).
+# Полный пересчёт — manage.py build_recommendations --full (по расписанию, например раз в сутки)
+
+RECOMMENDATION_WEIGHTS = {'orders': 1.0, 'wishlist': 0.5, 'category': 0.2}
+RECOMMENDATION_TOP_K = 12
+RECOMMENDATION_PRICE_WINDOW = 10
+
+
+# Материализованные представления аналитики (main/analytics.py): раз в сколько секунд
+# manage.py refresh_analytics --loop обновляет каждое из них
+
+ANALYTICS_REFRESH_INTERVALS = {
+    'active_orders_view': int(os.environ.get('ANALYTICS_ACTIVE_ORDERS_INTERVAL', 60)),
+    'top_selling_products_view': int(os.environ.get('ANALYTICS_TOP_PRODUCTS_INTERVAL', 900)),
+    'top_wishlists_view': int(os.environ.get('ANALYTICS_TOP_WISHLISTS_INTERVAL', 3600)),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -173,3 +308,25 @@ REST_FRAMEWORK_METHOD_RESTRICTIONS = {
         'disable_methods': ['put', 'patch']  # нельзя редактировать отзывы
     },
 }
+
+
+# Логи: метрики пула соединений пишутся каждым воркером (main/pool_metrics.py),
+# трассировка параллельных выборок — main/loaders.py
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '[{asctime}] {levelname} {name} pid={process}: {message}', 'style': '{'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'loggers': {
+        'main.pool_metrics': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        # Трассировка параллельных выборок страниц (main/loaders.py): LOADER_LOG_LEVEL=DEBUG
+        'main.loaders': {
+            'handlers': ['console'], 'level': os.environ.get('LOADER_LOG_LEVEL', 'INFO'), 'propagate': False,
+        },
+    },
+}
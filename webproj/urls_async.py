@@ -0,0 +1,24 @@
+"""
+URL-конфигурация для запуска под ASGI (ROOT_URLCONF при ASYNC_VIEWS=1).
+
+Страницы и API только для чтения обслуживаются корутинами; всё остальное — те же
+маршруты, что в webproj/urls.py. Имена маршрутов совпадают, reverse() не меняется.
+"""
+from django.urls import path, include
+from rest_framework.routers import SimpleRouter
+
+from api.async_views import AsyncGameViewSet, AsyncProductViewSet
+from main import async_views
+
+from .urls import urlpatterns as sync_urlpatterns
+
+router = SimpleRouter()
+router.register(r'games', AsyncGameViewSet)
+router.register(r'products', AsyncProductViewSet)
+
+urlpatterns = [
+    path('', async_views.index_view, name='index'),
+    path('prodinfo/<int:product_id>/', async_views.product_view, name='product'),
+    path('catalog/<int:game_id>/', async_views.catalog_view, name='catalog'),
+    path('api/', include(router.urls)),
+] + sync_urlpatterns